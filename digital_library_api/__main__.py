@@ -1,8 +1,18 @@
 import sys
 
-module = sys.argv[1]
+# Each command imports its own stack only when selected, so starting the GUI
+# never loads FastAPI/uvicorn and starting the server never loads Qt.
+USAGE = "usage: python -m digital_library_api {gui|server}"
+
+module = sys.argv[1] if len(sys.argv) > 1 else None
 
 if module == "gui":
     from digital_library_gui.gui import main_gui
 
     main_gui()
+elif module == "server":
+    from digital_library_api.json_api import main
+
+    main()
+else:
+    sys.exit(USAGE)
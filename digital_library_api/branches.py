@@ -0,0 +1,149 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, sessionmaker
+
+from .database import Book as DBBook, User as DBUser, create_db_tables, make_engine, prefix_match
+from .models import BookInDB
+
+# Request header naming the branch when the caller has no branch-scoped token.
+BRANCH_HEADER = "X-Library-Branch"
+
+# Every branch database gets WAL (readers don't block the writer) and a busy
+# timeout, so a bulk import in one branch never locks another branch's file.
+DEFAULT_BRANCH_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+}
+
+
+class UnknownBranchError(KeyError):
+    """Raised when a request names a branch that is not configured."""
+
+
+class Branch:
+    """One branch database with its own engine, connection pool and pragmas.
+
+    The engine is created (and its tables ensured) on first use.
+    """
+
+    def __init__(self, name: str, url: str, pool_size: int = 5, pragmas: Optional[dict] = None):
+        self.name = name
+        self.url = url
+        self.pool_size = pool_size
+        self.pragmas = DEFAULT_BRANCH_PRAGMAS if pragmas is None else pragmas
+        self._session_factory = None
+        self._lock = threading.Lock()
+
+    @property
+    def session_factory(self) -> sessionmaker:
+        if self._session_factory is None:
+            with self._lock:
+                if self._session_factory is None:
+                    engine = make_engine(self.url, pragmas=self.pragmas, pool_size=self.pool_size)
+                    create_db_tables(engine)
+                    self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        return self._session_factory
+
+    def dispose(self):
+        if self._session_factory is not None:
+            self._session_factory.kw["bind"].dispose()
+
+
+def search_books(db: Session, query: str, limit: int) -> List[Dict]:
+    """Prefix search on title, author or ISBN, returning BookInDB-shaped dicts."""
+    rows = (
+        db.query(DBBook, DBUser.username)
+        .outerjoin(DBUser, DBBook.borrower_id == DBUser.id)
+        .filter(
+            or_(
+                prefix_match(DBBook.title, query),
+                prefix_match(DBBook.author, query),
+                prefix_match(DBBook.isbn, query),
+            )
+        )
+        .order_by(DBBook.title, DBBook.id)
+        .limit(limit)
+        .all()
+    )
+    results = []
+    for db_book, borrower_username in rows:
+        book = BookInDB.model_validate(db_book)
+        book.borrower_username = borrower_username
+        results.append(book.model_dump())
+    return results
+
+
+class BranchRouter:
+    """Routes sessions to per-branch databases and fans out catalog searches."""
+
+    def __init__(self, branches: Iterable[Branch], default: Optional[str] = None):
+        self.branches = {branch.name: branch for branch in branches}
+        if default is not None and default not in self.branches:
+            raise UnknownBranchError(default)
+        self.default = default
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.branches)), thread_name_prefix="branch-search"
+        )
+
+    @classmethod
+    def from_env(cls) -> Optional["BranchRouter"]:
+        """Builds a router from LIBRARY_BRANCHES, or returns None if it is unset.
+
+        LIBRARY_BRANCHES is a comma-separated list of branch names. Each branch's
+        URL comes from LIBRARY_BRANCH_URL_TEMPLATE (default
+        "sqlite:///./db_{branch}.sqlite3"); LIBRARY_DEFAULT_BRANCH optionally
+        names the branch used when a request doesn't specify one.
+        """
+        names = [name.strip() for name in os.environ.get("LIBRARY_BRANCHES", "").split(",") if name.strip()]
+        if not names:
+            return None
+        template = os.environ.get("LIBRARY_BRANCH_URL_TEMPLATE", "sqlite:///./db_{branch}.sqlite3")
+        pool_size = int(os.environ.get("LIBRARY_BRANCH_POOL_SIZE", "5"))
+        return cls(
+            [Branch(name, template.format(branch=name), pool_size=pool_size) for name in names],
+            default=os.environ.get("LIBRARY_DEFAULT_BRANCH") or None,
+        )
+
+    def __contains__(self, name) -> bool:
+        return name in self.branches
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.branches)
+
+    def session(self, name: str) -> Session:
+        try:
+            branch = self.branches[name]
+        except KeyError:
+            raise UnknownBranchError(name) from None
+        return branch.session_factory()
+
+    def _search_branch(self, name: str, query: str, limit: int) -> List[Dict]:
+        db = self.session(name)
+        try:
+            results = search_books(db, query, limit)
+        finally:
+            db.close()
+        for result in results:
+            result["branch"] = name
+        return results
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        """Searches every branch in parallel and merges the results by title."""
+        futures = [
+            self._executor.submit(self._search_branch, name, query, limit)
+            for name in self.branches
+        ]
+        merged = [result for future in futures for result in future.result()]
+        merged.sort(key=lambda book: (book["title"], book["branch"], book["id"]))
+        return merged[:limit]
+
+    def dispose(self):
+        self._executor.shutdown(wait=False)
+        for branch in self.branches.values():
+            branch.dispose()
@@ -0,0 +1,173 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+def approx_sizeof(value: Any) -> int:
+    """Roughly estimates the memory held by a JSON-like value, in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += approx_sizeof(key) + approx_sizeof(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += approx_sizeof(item)
+    return size
+
+
+class _Flight:
+    """A load in progress; concurrent misses for the same key wait on it."""
+
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = _MISSING
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    `get_or_load` is single-flight: when several callers miss on the same key at
+    once, only the first runs the loader and the others wait for its result.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60.0,
+        sizeof: Callable[[Any], int] = approx_sizeof,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, size, value)
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._generation = 0  # bumped on invalidation so in-flight loads are not stored
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        """Returns the live value for key or _MISSING. Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, _, value = entry
+        if expires_at <= self._clock():
+            self._remove(key)
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[1]
+
+    def _store(self, key, value):
+        self._remove(key)
+        size = self._sizeof(value)
+        self._entries[key] = (self._clock() + self.ttl, size, value)
+        self._memory_bytes += size
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._generation += 1
+            self._store(key, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def get_or_load(self, key, loader: Callable[[], Any]):
+        """Returns the cached value for key, calling `loader` once on a miss.
+
+        A loader returning None is treated as "not found" and is not cached.
+        Exceptions raised by the loader propagate to every waiting caller.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+                leader = True
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if (
+                    flight.error is None
+                    and flight.value is not None
+                    and generation == self._generation
+                ):
+                    self._store(key, flight.value)
+            flight.event.set()
+        return flight.value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_bytes": self._memory_bytes,
+            }
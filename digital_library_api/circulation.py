@@ -0,0 +1,144 @@
+from datetime import date, timedelta
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from .database import Book as DBBook, User as DBUser
+
+# Circulation rules shared by the JSON API, the SIP2 server and the GUI.
+# Each change is a single conditional UPDATE ... RETURNING, so two clients
+# racing for the same copy can never both borrow it, and the common
+# (successful) case costs one statement. Callers own the transaction and
+# commit when they are done, which lets batches share one commit.
+
+DEFAULT_LOAN_DAYS = 14
+
+
+class CirculationError(Exception):
+    """A circulation rule rejected the request; str(e) says why."""
+
+
+class BookNotFoundError(CirculationError):
+    def __init__(self):
+        super().__init__("Book not found")
+
+
+class BookAlreadyBorrowedError(CirculationError):
+    def __init__(self, borrower_username=None):
+        self.borrower_username = borrower_username
+        super().__init__(f"Book is already borrowed by {borrower_username or 'another user'}")
+
+
+class BookNotBorrowedError(CirculationError):
+    def __init__(self):
+        super().__init__("Book is not currently borrowed")
+
+
+def _unavailable_reason(db: Session, book_filter, borrowing: bool) -> CirculationError:
+    """Works out why a conditional update matched no row (the slow path)."""
+    row = (
+        db.query(DBBook.is_borrowed, DBUser.username)
+        .outerjoin(DBUser, DBBook.borrower_id == DBUser.id)
+        .filter(book_filter)
+        .first()
+    )
+    if row is None:
+        return BookNotFoundError()
+    if borrowing:
+        return BookAlreadyBorrowedError(row.username)
+    return BookNotBorrowedError()
+
+
+def checkout(db: Session, book_filter, user_id: int, days: int = DEFAULT_LOAN_DAYS):
+    """Lends the book matching `book_filter` (e.g. DBBook.id == 5) to a user.
+
+    Returns a row with the book's id, title and due_date. Raises
+    BookNotFoundError or BookAlreadyBorrowedError.
+    """
+    row = db.execute(
+        update(DBBook)
+        .where(book_filter, DBBook.is_borrowed.is_(False))
+        .values(is_borrowed=True, borrower_id=user_id, due_date=date.today() + timedelta(days=days))
+        .returning(DBBook.id, DBBook.title, DBBook.due_date)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        raise _unavailable_reason(db, book_filter, borrowing=True)
+    return row
+
+
+def checkin(db: Session, book_filter):
+    """Returns the borrowed book matching `book_filter`.
+
+    Returns a row with the book's id and title. Raises BookNotFoundError or
+    BookNotBorrowedError.
+    """
+    row = db.execute(
+        update(DBBook)
+        .where(book_filter, DBBook.is_borrowed.is_(True))
+        .values(is_borrowed=False, borrower_id=None, due_date=None)
+        .returning(DBBook.id, DBBook.title)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        raise _unavailable_reason(db, book_filter, borrowing=False)
+    return row
+
+
+def _unavailable_reasons(db: Session, key_column, keys, borrowing: bool):
+    """_unavailable_reason() for many books at once, keyed by `key_column`."""
+    if not keys:
+        return {}
+    rows = (
+        db.query(key_column, DBBook.is_borrowed, DBUser.username)
+        .select_from(DBBook)
+        .outerjoin(DBUser, DBBook.borrower_id == DBUser.id)
+        .filter(key_column.in_(keys))
+        .all()
+    )
+    found = {key: (is_borrowed, username) for key, is_borrowed, username in rows}
+    errors = {}
+    for key in keys:
+        if key not in found:
+            errors[key] = BookNotFoundError()
+        elif borrowing:
+            errors[key] = BookAlreadyBorrowedError(found[key][1])
+        else:
+            errors[key] = BookNotBorrowedError()
+    return errors
+
+
+def checkout_many(db: Session, key_column, keys, user_id: int, days: int = DEFAULT_LOAN_DAYS):
+    """checkout() for every book whose `key_column` (e.g. DBBook.rfid_tag) is in `keys`.
+
+    One UPDATE lends all the available ones. Returns (rows, errors): rows
+    maps each lent key to a row with the book's key, id, title and due_date,
+    errors maps every other key to its CirculationError. Failures do not
+    undo the successes; the caller commits.
+    """
+    keys = list(dict.fromkeys(keys))
+    rows = db.execute(
+        update(DBBook)
+        .where(key_column.in_(keys), DBBook.is_borrowed.is_(False))
+        .values(is_borrowed=True, borrower_id=user_id, due_date=date.today() + timedelta(days=days))
+        .returning(key_column.label("key"), DBBook.id, DBBook.title, DBBook.due_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+    lent = {row.key: row for row in rows}
+    unavailable = [key for key in keys if key not in lent]
+    return lent, _unavailable_reasons(db, key_column, unavailable, borrowing=True)
+
+
+def checkin_many(db: Session, key_column, keys):
+    """checkin() for every book whose `key_column` is in `keys`; see checkout_many()."""
+    keys = list(dict.fromkeys(keys))
+    rows = db.execute(
+        update(DBBook)
+        .where(key_column.in_(keys), DBBook.is_borrowed.is_(True))
+        .values(is_borrowed=False, borrower_id=None, due_date=None)
+        .returning(key_column.label("key"), DBBook.id, DBBook.title)
+        .execution_options(synchronize_session=False)
+    ).all()
+    returned = {row.key: row for row in rows}
+    unavailable = [key for key in keys if key not in returned]
+    return returned, _unavailable_reasons(db, key_column, unavailable, borrowing=False)
@@ -0,0 +1,96 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool  # Add this import
+from sqlalchemy.orm import sessionmaker
+
+from .json_api import app, get_db, get_catalog_db, book_cache  # Import the FastAPI app and the dependency
+from .tags import tag_cache
+from .database import (
+    Base,
+    User as DBUser,
+)
+
+# --- Test Database Setup ---
+# Use an in-memory SQLite database for testing
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,  # Use StaticPool for in-memory SQLite
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# --- Dependency Override ---
+# This function will be used to override the get_db dependency in json_api.py
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+# Override the dependency in the FastAPI app
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_catalog_db] = override_get_db
+
+# --- Test Client ---
+# Create a TestClient instance for your app
+client = TestClient(app)
+
+
+# --- Pytest Fixtures ---
+# Fixture to create and drop tables for each test. Not autouse: the modules
+# that need the tables ask for it (test_json_api through pytestmark)
+@pytest.fixture(scope="function")
+def db_session(request):  # Added request for potential unique naming if needed
+    """Create a new database session for each test."""
+    # Ensure a clean state and create tables for each test using the test engine
+    Base.metadata.create_all(bind=engine)  # Create all tables
+    book_cache.clear()  # Book ids are reused once tables are recreated
+    tag_cache.clear()
+    db = TestingSessionLocal()
+    try:
+        yield db  # Provide the session to the test
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)  # Ensure tables are dropped after the test
+
+
+@pytest.fixture(scope="function")
+def test_user(db_session):
+    """Creates a user in the DB and returns the user object and raw password."""
+    username = "testfixtureuser"
+    password = "testfixturepassword"
+
+    response = client.post("/users/", json={"username": username, "password": password})
+    assert response.status_code == 201, (
+        f"Failed to create user for fixture: {response.json()}"
+    )
+    user_data = response.json()
+
+    db_user = db_session.query(DBUser).filter(DBUser.id == user_data["id"]).first()
+    assert db_user is not None, "User not found in DB after creation for fixture"
+    return {
+        "db_user": db_user,
+        "password": password,
+        "id": db_user.id,
+        "username": db_user.username,
+    }
+
+
+@pytest.fixture(scope="function")
+def auth_headers(test_user):
+    """Provides authentication headers for a test user."""
+    username = test_user["username"]
+    password = test_user["password"]
+
+    response = client.post("/token", data={"username": username, "password": password})
+    assert response.status_code == 200, (
+        f"Failed to get token for fixture: {response.json()}"
+    )
+    token = response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
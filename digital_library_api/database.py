@@ -1,13 +1,69 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, Date, ForeignKey
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, event, and_, inspect, text, Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.orm import declarative_base
 
 DATABASE_URL = "sqlite:///./db.sqlite3"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}) # check_same_thread is needed for SQLite with Qt
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def make_engine(url, pragmas=None, **engine_kwargs):
+    """Creates a SQLite engine, running `PRAGMA name=value` for each item of
+    `pragmas` on every new pool connection."""
+    new_engine = create_engine(url, connect_args={"check_same_thread": False}, **engine_kwargs) # check_same_thread is needed for SQLite with Qt
+    if pragmas:
+        @event.listens_for(new_engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return new_engine
+
+
+# The engine is built on first use rather than at import, so CLI entry points
+# and worker processes that never touch the database don't pay for it.
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Returns the application engine, creating it and its tables on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                new_engine = make_engine(DATABASE_URL)
+                create_db_tables(new_engine)
+                _engine = new_engine
+    return _engine
+
+
+class _LazySessionmaker(sessionmaker):
+    """sessionmaker that binds to get_engine() when the first session is created."""
+
+    def __call__(self, **local_kw):
+        if "bind" not in local_kw and self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+
+def __getattr__(name):
+    # Keeps `from digital_library_api.database import engine` working.
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def utcnow():
+    """Naive UTC now, as stored in DateTime columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 # Define the User model
 class User(Base):
     __tablename__ = "users"
@@ -26,11 +82,33 @@ class Book(Base):
     title = Column(String, index=True, nullable=False)
     author = Column(String, index=True, nullable=False)
     isbn = Column(String, unique=True, index=True, nullable=False)
+    # EPC of the book's RFID tag, upper-case hex (see tags.py)
+    rfid_tag = Column(String, unique=True, index=True, nullable=True)
+    # Shelf the book belongs on, e.g. "A3-12"; compared by RFID stock-takes
+    location = Column(String, nullable=True)
     is_borrowed = Column(Boolean, default=False, nullable=False)
     due_date = Column(Date, nullable=True)
 
     borrower_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     borrower = relationship("User", back_populates="borrowed_books")
+    # Last change through the ORM or a Core update() (circulation, tags), in
+    # UTC; lets remote desks fetch only what changed (GET /books/?updated_since=).
+    # NULL for books last changed before the column existed.
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, index=True, nullable=True)
+
+    # Composite indexes for the access patterns the API and SIP2 server use.
+    # Every one of them is checked by test_query_plans.py.
+    __table_args__ = (
+        # A patron's loans, ordered by due date (also serves the borrower_id FK).
+        Index("ix_books_borrower_id_due_date", "borrower_id", "due_date"),
+        # Overdue items: is_borrowed = 1 AND due_date < :today.
+        Index("ix_books_is_borrowed_due_date", "is_borrowed", "due_date"),
+        # Availability listings; covers the common ?fields=id,title,is_borrowed
+        # projection (id is the rowid) so it never touches the table.
+        Index("ix_books_is_borrowed_title", "is_borrowed", "title"),
+        # Books that should be on a shelf: location = :shelf AND is_borrowed = 0.
+        Index("ix_books_location_is_borrowed", "location", "is_borrowed"),
+    )
 
     def __str__(self):
         status = ""
@@ -40,6 +118,69 @@ class Book(Base):
             status = f" (Borrowed by User ID: {self.borrower_id}, Due: {self.due_date or 'N/A'})"
         return f"{self.title} by {self.author} (ISBN: {self.isbn}){status}"
 
+
+# Case-insensitive (ASCII) prefix search as staff type, e.g. "dune" finding
+# "Dune"; see prefix_match_nocase(). Expression indexes can't go in
+# __table_args__ before the columns exist, so they are declared here.
+Index("ix_books_title_nocase", Book.title.collate("NOCASE"))
+Index("ix_books_author_nocase", Book.author.collate("NOCASE"))
+
+
+class DeletedBook(Base):
+    """A deleted book's id and when it went, so remote desks can drop their
+    copies incrementally (GET /books/deletions?since=)."""
+
+    __tablename__ = "deleted_books"
+
+    book_id = Column(Integer, primary_key=True)
+    deleted_at = Column(DateTime, default=utcnow, nullable=False, index=True)
+
+
+@event.listens_for(Book, "after_delete")
+def record_book_deletion(mapper, connection, book):
+    # Every ORM delete (API, desk GUI) leaves a record; an id deleted twice keeps the latest
+    connection.execute(DeletedBook.__table__.delete().where(DeletedBook.book_id == book.id))
+    connection.execute(DeletedBook.__table__.insert().values(book_id=book.id, deleted_at=utcnow()))
+
+
+def prefix_match(column, prefix):
+    """Index-friendly equivalent of `column LIKE 'prefix%'` (case-sensitive).
+
+    Expressed as a range so SQLite can seek the column's index instead of
+    scanning the table.
+    """
+    return and_(column >= prefix, column < prefix + "\U0010ffff")
+
+
+def prefix_match_nocase(column, prefix):
+    """prefix_match() ignoring ASCII case; seeks a `column COLLATE NOCASE` index.
+
+    Order by column.collate("NOCASE") too, and SQLite reads the matches
+    straight from that index in order, so a LIMIT stops the scan early.
+    """
+    folded = column.collate("NOCASE")
+    return and_(folded >= prefix, folded < prefix + "\U0010ffff")
+
+
+def upgrade_schema(engine):
+    """Brings an existing database up to date with the models.
+
+    create_all() only creates missing tables, so nullable columns and indexes
+    added to existing tables are created here. Safe to run on every start.
+    """
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
 # Create database tables
-def create_db_tables(engine=engine):
+def create_db_tables(engine=None):
+    engine = engine if engine is not None else get_engine()
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
@@ -1,16 +1,22 @@
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta, datetime, timezone
 from typing import List, Optional, Dict, Any
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, status, Body, Depends
+from fastapi import FastAPI, HTTPException, status, Body, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field, field_validator, ValidationInfo
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
 
-from .database import SessionLocal, Book as DBBook, User as DBUser, create_db_tables
+from .branches import BRANCH_HEADER, BranchRouter, UnknownBranchError, search_books
+from .cache import TTLCache
+from .circulation import BookNotFoundError, CirculationError, checkin, checkout
+from .database import SessionLocal, Book as DBBook, DeletedBook as DBDeletedBook, User as DBUser, get_engine
+from .log import configure_logging, logging_configured, request_id
 from .models import (
     Token,
     TokenData,
@@ -20,9 +26,26 @@ from .models import (
     BookCreate,
     BookUpdate,
     BookInDB,
+    CatalogSearchResult,
+    RFIDTagAssignment,
 )
-import uvicorn
+from .security import get_password_hash, verify_password
+from .tags import (
+    TagAlreadyAssignedError,
+    TagError,
+    assign_tag,
+    book_id_for_tag,
+    clear_tag,
+    invalidate_tags,
+    normalize_epc,
+    tag_cache,
+)
+import logging
 import os
+import re
+import uuid
+
+logger = logging.getLogger(__name__)
 
 
 # --- Authentication Configuration ---
@@ -32,32 +55,99 @@ SECRET_KEY = os.environ.get(
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password Hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# jose and uvicorn (like passlib in .security) are imported where they are
+# first needed, so importing this module from tests, workers and the CLI
+# stays cheap.
 
 # OAuth2 Scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# --- Book Detail Cache ---
+# Serialized GET /books/{id} responses, keyed by (branch, book id). Writes through this
+# API update or invalidate entries; changes made elsewhere expire after the TTL.
+book_cache = TTLCache(
+    maxsize=int(os.environ.get("BOOK_CACHE_MAXSIZE", "4096")),
+    ttl=float(os.environ.get("BOOK_CACHE_TTL", "30")),
+)
+
+
+# --- Branch Routing ---
+@lru_cache(maxsize=None)
+def get_branch_router() -> Optional[BranchRouter]:
+    """The per-branch database router, or None when running on a single database."""
+    return BranchRouter.from_env()
+
+
+def get_token_branch(request: Request) -> Optional[str]:
+    """Returns the branch claim of a valid bearer token, if the request has one."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    from jose import JWTError, jwt
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None  # get_current_user reports invalid tokens
+    return payload.get("branch")
+
+
+def get_request_branch(
+    request: Request, router: Optional[BranchRouter] = Depends(get_branch_router)
+) -> Optional[str]:
+    """Picks the branch for a request: the token's branch claim, else the
+    X-Library-Branch header, else the configured default branch."""
+    if router is None:
+        return None
+    header_branch = request.headers.get(BRANCH_HEADER)
+    token_branch = get_token_branch(request)
+    if token_branch and header_branch and token_branch != header_branch:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Token is not valid for branch {header_branch}",
+        )
+    branch = token_branch or header_branch or router.default
+    if branch is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No branch specified. Send the {BRANCH_HEADER} header.",
+        )
+    if branch not in router:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown branch: {branch}"
+        )
+    return branch
+
 
 # --- Database Dependency ---
-def get_db():
-    db = SessionLocal()
+def get_db(
+    branch: Optional[str] = Depends(get_request_branch),
+    router: Optional[BranchRouter] = Depends(get_branch_router),
+):
+    db = SessionLocal() if router is None else router.session(branch)
     try:
         yield db
     finally:
         db.close()
 
 
-# --- Utility Functions ---
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+def get_catalog_db(router: Optional[BranchRouter] = Depends(get_branch_router)):
+    """Session for catalog search on a single database; None when searching
+    branches, since every branch is queried with its own session."""
+    if router is not None:
+        yield None
+        return
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
 
 
+# --- Utility Functions ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -71,6 +161,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 async def get_current_user(
     token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
 ) -> DBUser:
+    from jose import JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -91,6 +183,97 @@ async def get_current_user(
     return user
 
 
+# --- Sparse Fieldsets ---
+# Maps every field of BookInDB to the SQL expression that produces it, so a
+# ?fields= request selects only the columns it needs. borrower_username is the
+# only field that requires joining the users table.
+BOOK_FIELD_COLUMNS = {
+    "id": DBBook.id,
+    "title": DBBook.title,
+    "author": DBBook.author,
+    "isbn": DBBook.isbn,
+    "is_borrowed": DBBook.is_borrowed,
+    "due_date": DBBook.due_date,
+    "borrower_id": DBBook.borrower_id,
+    "borrower_username": DBUser.username,
+    "rfid_tag": DBBook.rfid_tag,
+    "location": DBBook.location,
+    "updated_at": DBBook.updated_at,
+}
+
+
+def parse_book_fields(
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated list of book fields to return, e.g. id,title,is_borrowed",
+    ),
+) -> Optional[List[str]]:
+    """Dependency that validates the ?fields= parameter.
+
+    Returns None when the parameter is absent (full BookInDB response),
+    otherwise the de-duplicated list of requested fields in request order.
+    """
+    if fields is None:
+        return None
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in BOOK_FIELD_COLUMNS]
+    if not requested or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid fields: {', '.join(unknown) or fields!r}. "
+            f"Allowed fields: {', '.join(BOOK_FIELD_COLUMNS)}",
+        )
+    return list(dict.fromkeys(requested))
+
+
+def query_book_fields(db: Session, fields: List[str]):
+    """Builds a query selecting only the requested book columns."""
+    query = db.query(*(BOOK_FIELD_COLUMNS[name].label(name) for name in fields))
+    query = query.select_from(DBBook)
+    if "borrower_username" in fields:
+        query = query.outerjoin(DBUser, DBBook.borrower_id == DBUser.id)
+    return query
+
+
+def filter_books(
+    query,
+    is_borrowed: Optional[bool] = None,
+    borrower_id: Optional[int] = None,
+    due_before: Optional[date] = None,
+    updated_since: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+):
+    """Applies the /books/ list filters. Each maps onto a composite index.
+
+    Paging (`after_id`, `limit`) is by id, so it seeks the primary key
+    however deep the page.
+    """
+    if is_borrowed is not None:
+        query = query.filter(DBBook.is_borrowed.is_(is_borrowed))
+    if borrower_id is not None:
+        query = query.filter(DBBook.borrower_id == borrower_id)
+    if due_before is not None:
+        # Only borrowed books have a due date; saying so lets SQLite seek
+        # ix_books_is_borrowed_due_date instead of scanning for the range.
+        query = query.filter(DBBook.is_borrowed.is_(True), DBBook.due_date < due_before)
+    if updated_since is not None:
+        query = query.filter(DBBook.updated_at >= updated_since)
+    if after_id is not None:
+        query = query.filter(DBBook.id > after_id)
+    if after_id is not None or limit is not None:
+        query = query.order_by(DBBook.id).limit(limit)
+    return query
+
+
+def book_row_to_json(row) -> Dict[str, Any]:
+    """Converts a projected row to a JSON-ready dict without building BookInDB."""
+    return {
+        name: value.isoformat() if isinstance(value, date) else value
+        for name, value in row._mapping.items()
+    }
+
+
 # --- FastAPI App ---
 app = FastAPI(
     title="Digital Library JSON API",
@@ -110,18 +293,65 @@ app.add_middleware(
 )
 
 
+# --- Request IDs ---
+REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_KEY = REQUEST_ID_HEADER.lower().encode("latin-1")  # ASGI header names are lowercase
+_VALID_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+class RequestIdMiddleware:
+    """Tags each request with an id for its log records and echoes it in the response.
+
+    A well-formed X-Request-ID from the client (or a proxy) is kept, so log
+    lines can be matched across services; otherwise a new one is made. Plain
+    ASGI rather than @app.middleware, which would add a task per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = next(
+            (value.decode("latin-1") for name, value in scope["headers"] if name == _REQUEST_ID_KEY), ""
+        )
+        value = incoming if _VALID_REQUEST_ID.fullmatch(incoming) else uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (_REQUEST_ID_KEY, value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+app.add_middleware(RequestIdMiddleware)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Manages application startup and shutdown events.
     On startup, it ensures database tables are created.
     """
-    # Ensure database tables are created
-    create_db_tables()
-    print(f"SQLite Database API started. Using database: {SessionLocal().bind.url}")
+    if not logging_configured():
+        configure_logging()  # LOG_LEVEL, LOG_FORMAT and LOG_SAMPLE_RATE
+    router = get_branch_router()
+    if router is None:
+        # Build the engine (and create tables) once, before the first request
+        engine = get_engine()
+        logger.info("SQLite Database API started. Using database: %s", engine.url)
+    else:
+        logger.info("SQLite Database API started. Branches: %s", ", ".join(router.names))
     yield
-    # Add any shutdown logic here if needed in the future
-    print("SQLite Database API shutting down.")
+    if router is not None:
+        router.dispose()
+    logger.info("SQLite Database API shutting down.")
 
 
 # --- API Endpoints ---
@@ -144,7 +374,9 @@ async def create_user(user: UserCreate, db: Session = Depends(get_db)):
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db),
+    branch: Optional[str] = Depends(get_request_branch),
 ):
     user = db.query(DBUser).filter(DBUser.username == form_data.username).first()
     if not user or not verify_password(form_data.password, user.hashed_password):
@@ -154,8 +386,11 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    token_data = {"sub": user.username}
+    if branch is not None:
+        token_data["branch"] = branch  # Later requests are routed by this claim
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=token_data, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -186,29 +421,119 @@ async def create_book(
 
 
 @app.get("/books/", response_model=List[BookInDB])
-async def get_all_books(db: Session = Depends(get_db)):
-    books = db.query(DBBook).all()
-    # Populate borrower_username
+async def get_all_books(
+    db: Session = Depends(get_db),
+    fields: Optional[List[str]] = Depends(parse_book_fields),
+    is_borrowed: Optional[bool] = Query(None, description="Only borrowed (true) or available (false) books"),
+    borrower_id: Optional[int] = Query(None, description="Only books borrowed by this user"),
+    due_before: Optional[date] = Query(None, description="Only borrowed books due before this date"),
+    updated_since: Optional[datetime] = Query(None, description="Only books changed at or after this UTC time"),
+    after_id: Optional[int] = Query(None, description="Only books with a higher id; results are in id order"),
+    limit: Optional[int] = Query(None, gt=0, le=5000, description="At most this many books, in id order"),
+):
+    if updated_since is not None and updated_since.tzinfo is not None:
+        updated_since = updated_since.astimezone(timezone.utc).replace(tzinfo=None)
+    filters = dict(
+        is_borrowed=is_borrowed,
+        borrower_id=borrower_id,
+        due_before=due_before,
+        updated_since=updated_since,
+        after_id=after_id,
+        limit=limit,
+    )
+    if fields is not None:
+        rows = filter_books(query_book_fields(db, fields), **filters).all()
+        return JSONResponse(content=[book_row_to_json(row) for row in rows])
+
+    # Populate borrower_username from the same query instead of one lazy
+    # load per borrowed book
+    rows = filter_books(
+        db.query(DBBook, DBUser.username).outerjoin(DBUser, DBBook.borrower_id == DBUser.id),
+        **filters,
+    ).all()
     result = []
-    for book in books:
+    for book, borrower_username in rows:
         book_data = BookInDB.model_validate(book).model_dump()
-        if book.borrower:
-            book_data["borrower_username"] = book.borrower.username
+        book_data["borrower_username"] = borrower_username
         result.append(BookInDB(**book_data))
     return result
 
 
+@app.get("/books/deletions")
+def get_book_deletions(
+    since: datetime = Query(..., description="Only books deleted at or after this UTC time"),
+    db: Session = Depends(get_db),
+):
+    """Ids of books deleted since a time, for clients keeping a copy of the catalog."""
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    rows = db.query(DBDeletedBook.book_id, DBDeletedBook.deleted_at).filter(DBDeletedBook.deleted_at >= since)
+    return [{"id": book_id, "deleted_at": deleted_at.isoformat()} for book_id, deleted_at in rows]
+
+
+def load_book_json(db: Session, book_id: int) -> Optional[Dict[str, Any]]:
+    """Loads one book with its borrower name in a single query, as JSON-ready data."""
+    row = (
+        db.query(DBBook, DBUser.username)
+        .outerjoin(DBUser, DBBook.borrower_id == DBUser.id)
+        .filter(DBBook.id == book_id)
+        .first()
+    )
+    if row is None:
+        return None
+    db_book, borrower_username = row
+    book = BookInDB.model_validate(db_book)
+    book.borrower_username = borrower_username
+    return book.model_dump(mode="json")
+
+
 @app.get("/books/{book_id}", response_model=BookInDB)  # book_id is now int
-async def get_book(book_id: int, db: Session = Depends(get_db)):
-    db_book = db.query(DBBook).filter(DBBook.id == book_id).first()
-    if not db_book:
+def get_book(
+    book_id: int,
+    db: Session = Depends(get_db),
+    branch: Optional[str] = Depends(get_request_branch),
+    fields: Optional[List[str]] = Depends(parse_book_fields),
+):
+    """A plain def, so it runs in the threadpool: loading blocks, and
+    concurrent misses for one book must overlap to share a single load."""
+    if fields is not None:
+        # Only the requested columns; the cache holds full records only
+        row = query_book_fields(db, fields).filter(DBBook.id == book_id).first()
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Book not found"
+            )
+        return JSONResponse(content=book_row_to_json(row))
+    book_data = book_cache.get_or_load(
+        (branch, book_id), lambda: load_book_json(db, book_id)
+    )
+    if book_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Book not found"
         )
-    book_data = BookInDB.model_validate(db_book).model_dump()
-    if db_book.borrower:
-        book_data["borrower_username"] = db_book.borrower.username
-    return BookInDB(**book_data)
+    return JSONResponse(content=book_data)
+
+
+@app.get("/catalog/search", response_model=List[CatalogSearchResult])
+async def search_catalog(
+    q: str = Query(..., min_length=1, description="Title, author or ISBN prefix"),
+    limit: int = Query(20, gt=0, le=200),
+    router: Optional[BranchRouter] = Depends(get_branch_router),
+    db: Optional[Session] = Depends(get_catalog_db),
+):
+    """Searches the catalog of every branch in parallel and merges the results.
+
+    Without branch configuration this searches the single library database.
+    """
+    if router is None:
+        return search_books(db, q, limit)
+    return await run_in_threadpool(router.search, q, limit)
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Reports hit rate and approximate memory footprint of the book and RFID tag caches."""
+    return {"books": book_cache.stats(), "rfid_tags": tag_cache.stats()}
 
 
 @app.put("/books/{book_id}", response_model=BookInDB)  # book_id is now int
@@ -216,6 +541,7 @@ async def update_book(
     book_id: int,
     book_update: BookUpdate,
     db: Session = Depends(get_db),
+    branch: Optional[str] = Depends(get_request_branch),
     current_user: DBUser = Depends(get_current_user), # <--- ADD THIS
 ):
     db_book = db.query(DBBook).filter(DBBook.id == book_id).first()
@@ -276,6 +602,7 @@ async def update_book(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     db.commit()
+    book_cache.invalidate((branch, book_id))
     db.refresh(db_book)
     return db_book
 
@@ -286,6 +613,7 @@ async def update_book(
 async def delete_book(
     book_id: int,
     db: Session = Depends(get_db),
+    branch: Optional[str] = Depends(get_request_branch),
     current_user: DBUser = Depends(get_current_user),
 ):
     db_book = db.query(DBBook).filter(DBBook.id == book_id).first()
@@ -294,73 +622,153 @@ async def delete_book(
             status_code=status.HTTP_404_NOT_FOUND, detail="Book not found"
         )
 
+    rfid_tag = db_book.rfid_tag
     db.delete(db_book)
     db.commit()
+    book_cache.invalidate((branch, book_id))
+    if rfid_tag:
+        invalidate_tags([rfid_tag], branch)
     return None
 
 
-@app.post("/books/{book_id}/borrow", response_model=BookInDB)  # book_id is now int
-async def borrow_book_action(
-    book_id: int,
-    # borrower_name: str = Body(..., embed=True, min_length=1), # Removed
-    borrow_days: int = Body(14, embed=True, gt=0),
+def invalidate_rfid_change(change, branch: Optional[str]) -> None:
+    invalidate_tags(change.epcs, branch)
+    for changed_book_id in change.book_ids:
+        book_cache.invalidate((branch, changed_book_id))
+
+
+@app.get("/books/by-rfid/{epc}", response_model=BookInDB)
+def get_book_by_rfid_tag(
+    epc: str,
     db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),  # Added
+    branch: Optional[str] = Depends(get_request_branch),
+    fields: Optional[List[str]] = Depends(parse_book_fields),
 ):
-    db_book = db.query(DBBook).filter(DBBook.id == book_id).first()
-    if not db_book:
+    """Looks up the book carrying an RFID tag, through the tag and book caches."""
+    canonical = normalize_epc(epc)
+    book_id = book_id_for_tag(db, canonical, branch) if canonical else None
+    if book_id is None:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Book not found"
+            status_code=status.HTTP_404_NOT_FOUND, detail="No book has this tag"
         )
-    if db_book.is_borrowed:
+    return get_book(book_id, db, branch, fields)
+
+
+@app.put("/books/{book_id}/rfid", response_model=BookInDB)
+async def assign_book_rfid_tag(
+    book_id: int,
+    assignment: RFIDTagAssignment,
+    db: Session = Depends(get_db),
+    branch: Optional[str] = Depends(get_request_branch),
+    current_user: DBUser = Depends(get_current_user),
+):
+    """Puts an RFID tag on a book, replacing its previous one.
+
+    A tag already on another book is a 409 unless `reassign` is set, which
+    moves it.
+    """
+    try:
+        change = assign_tag(db, book_id, assignment.rfid_tag, assignment.reassign)
+        db.commit()
+    except BookNotFoundError as e:
+        raise circulation_http_error(e)
+    except TagAlreadyAssignedError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except TagError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except IntegrityError:
+        # Another request took the tag between our check and the commit
+        db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Book is already borrowed by {db_book.borrower.username if db_book.borrower else 'another user'}",
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Tag {assignment.rfid_tag} is already assigned to another book",
         )
+    invalidate_rfid_change(change, branch)
+    return load_book_json(db, book_id)
+
+
+@app.delete("/books/{book_id}/rfid", response_model=BookInDB)
+async def clear_book_rfid_tag(
+    book_id: int,
+    db: Session = Depends(get_db),
+    branch: Optional[str] = Depends(get_request_branch),
+    current_user: DBUser = Depends(get_current_user),
+):
+    """Takes the RFID tag off a book, e.g. before the tag is reused."""
+    try:
+        change = clear_tag(db, book_id)
+    except BookNotFoundError as e:
+        raise circulation_http_error(e)
+    db.commit()
+    invalidate_rfid_change(change, branch)
+    return load_book_json(db, book_id)
+
 
-    db_book.is_borrowed = True
-    db_book.borrower_id = current_user.id  # Use authenticated user's ID
-    db_book.due_date = date.today() + timedelta(days=borrow_days)
+def circulation_http_error(error: CirculationError) -> HTTPException:
+    if isinstance(error, BookNotFoundError):
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error))
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
 
+
+@app.post("/books/{book_id}/borrow", response_model=BookInDB)  # book_id is now int
+async def borrow_book_action(
+    book_id: int,
+    # borrower_name: str = Body(..., embed=True, min_length=1), # Removed
+    borrow_days: int = Body(14, embed=True, gt=0),
+    # Lends to another registered user, e.g. a patron at a desk; defaults to the caller
+    borrower_username: Optional[str] = Body(None, embed=True, min_length=1),
+    db: Session = Depends(get_db),
+    branch: Optional[str] = Depends(get_request_branch),
+    current_user: DBUser = Depends(get_current_user),  # Added
+):
+    borrower = current_user
+    if borrower_username is not None and borrower_username != current_user.username:
+        borrower = db.query(DBUser).filter(DBUser.username == borrower_username).first()
+        if borrower is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown borrower: {borrower_username}",
+            )
+    try:
+        # Atomic: only succeeds if the book is still available
+        checkout(db, DBBook.id == book_id, borrower.id, borrow_days)
+    except CirculationError as e:
+        raise circulation_http_error(e)
     db.commit()
-    db.refresh(db_book)
+    db_book = db.query(DBBook).filter(DBBook.id == book_id).first()
     book_data = BookInDB.model_validate(db_book).model_dump()
-    book_data["borrower_username"] = current_user.username
-    return BookInDB(**book_data)
+    book_data["borrower_username"] = borrower.username
+    book = BookInDB(**book_data)
+    book_cache.set((branch, book_id), book.model_dump(mode="json"))
+    return book
 
 
 @app.post("/books/{book_id}/return", response_model=BookInDB)  # book_id is now int
 async def return_book_action(
     book_id: int,
     db: Session = Depends(get_db),
+    branch: Optional[str] = Depends(get_request_branch),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_book = db.query(DBBook).filter(DBBook.id == book_id).first()
-    if not db_book:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Book not found"
-        )
-    if not db_book.is_borrowed:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Book is not currently borrowed",
-        )
     # Optional: Check if the current_user is the one who borrowed it, if strict return policy is needed
-    # if db_book.borrower_id != current_user.id:
-    #     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You did not borrow this book.")
-
-    db_book.is_borrowed = False
-    db_book.borrower_id = None  # Clear borrower ID
-    db_book.due_date = None
-
+    # (add DBBook.borrower_id == current_user.id to the filter below)
+    try:
+        checkin(db, DBBook.id == book_id)  # Clears borrower ID and due date
+    except CirculationError as e:
+        raise circulation_http_error(e)
     db.commit()
-    db.refresh(db_book)
+    db_book = db.query(DBBook).filter(DBBook.id == book_id).first()
+    book_cache.set(
+        (branch, book_id), BookInDB.model_validate(db_book).model_dump(mode="json")
+    )
     return db_book
 
 
 # --- Main function to run Uvicorn ---
 def main():
     """Starts the Uvicorn server for the FastAPI application."""
+    import uvicorn
+
     uvicorn.run(
         "digital_library_api.json_api:app",  # Path to the app instance
         host="127.0.0.1",
@@ -0,0 +1,193 @@
+"""Logging setup shared by the API and the SIP2 servers.
+
+configure_logging() routes every record through a bounded queue to a
+background thread that formats and writes it, so a slow terminal or pipe
+never blocks a request or a SIP2 connection. When the queue is full,
+records are dropped and counted (dropped_records()) rather than waited on.
+
+Records carry the current request_id (API) or connection_id (SIP2) from
+context variables, and any `extra={...}` fields, as JSON lines:
+
+    {"time": "...", "level": "INFO", "logger": "digital_library_sip2.messages",
+     "message": "Received 2300120250101...", "connection_id": 17, "direction": "received"}
+
+Per-message logs should be guarded by sampled(), which passes the
+configured fraction of calls (LOG_SAMPLE_RATE), so they can stay on in
+production at, say, 1%.
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Optional, TextIO
+
+# Set by the API middleware and the SIP2 connection handlers
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+connection_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("connection_id", default=None)
+
+DEFAULT_QUEUE_SIZE = 10_000
+
+# LogRecord attributes that are not `extra` fields
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message",
+    "asctime",
+    "request_id",
+    "connection_id",
+    "context",
+}
+
+_handler: Optional["DroppingQueueHandler"] = None
+_listener: Optional["_QueueListener"] = None
+_sample_rate = 1.0
+
+
+class ContextFilter(logging.Filter):
+    """Copies the request and connection ids onto the record, in the caller's context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # An explicit extra={"connection_id": ...} wins over the context
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id.get()
+        if getattr(record, "connection_id", None) is None:
+            record.connection_id = connection_id.get()
+        if record.request_id is not None:
+            record.context = f"[request {record.request_id}] "
+        elif record.connection_id is not None:
+            record.context = f"[connection {record.connection_id}] "
+        else:
+            record.context = ""
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking on a full queue."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._exception_formatter = logging.Formatter()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now (they may change before the listener runs)
+        # but leave all other formatting to the listener's thread.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)  # Wait for room: the queue may be full
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with the context ids and `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in ("request_id", "connection_id"):
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for running in a terminal."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(context)s%(message)s", defaults={"context": ""})
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    json_format: Optional[bool] = None,
+    sample_rate: Optional[float] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    stream: Optional[TextIO] = None,
+) -> None:
+    """Installs the queue handler on the root logger, replacing an earlier setup.
+
+    Arguments left as None come from LOG_LEVEL (INFO), LOG_FORMAT ("json" or
+    "text") and LOG_SAMPLE_RATE (1.0).
+    """
+    global _handler, _listener, _sample_rate
+    shutdown_logging()
+    if level is None:
+        level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    if json_format is None:
+        json_format = os.environ.get("LOG_FORMAT", "json").lower() != "text"
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+    if not 0.0 <= sample_rate <= 1.0:
+        raise ValueError("sample_rate must be between 0 and 1")
+    _sample_rate = sample_rate
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if json_format else TextFormatter())
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    _handler = DroppingQueueHandler(log_queue)
+    _handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+    _listener = _QueueListener(log_queue, output)
+    _listener.start()
+
+
+def logging_configured() -> bool:
+    return _handler is not None
+
+
+def shutdown_logging() -> None:
+    """Writes out the queued records and removes the handler."""
+    global _handler, _listener
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def dropped_records() -> int:
+    """Records dropped because the queue was full, since configure_logging()."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def sampled() -> bool:
+    """Whether this per-message record should be logged, per the sample rate."""
+    return _sample_rate >= 1.0 or random.random() < _sample_rate
@@ -21,6 +21,7 @@ class BookBase(BaseModel):
     author: str = Field(..., min_length=1)
     isbn: str = Field(..., min_length=1, max_length=13)
     is_borrowed: bool = False
+    location: Optional[str] = None  # Shelf the book belongs on
     # borrower_name: Optional[str] = None # Removed
     due_date: Optional[date] = None
 
@@ -51,6 +52,7 @@ class BookUpdate(BaseModel):  # Changed to BaseModel for more explicit optional
     author: Optional[str] = Field(default=None, min_length=1)
     isbn: Optional[str] = Field(default=None, min_length=10, max_length=13)
     is_borrowed: Optional[bool] = Field(default=None)
+    location: Optional[str] = Field(default=None)
     # borrower_name: Optional[str] = Field(default=None) # Removed
     due_date: Optional[date] = Field(default=None)
 
@@ -59,10 +61,21 @@ class BookInDB(BookBase):
     id: int = Field(...)
     borrower_id: Optional[int] = None
     borrower_username: Optional[str] = None  # Added to show who borrowed
+    rfid_tag: Optional[str] = None  # EPC of the book's RFID tag
+    updated_at: Optional[datetime] = None  # UTC; None if unchanged since before it was tracked
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class RFIDTagAssignment(BaseModel):
+    rfid_tag: str = Field(..., min_length=1)
+    reassign: bool = False  # Move the tag if another book has it
+
+
+class CatalogSearchResult(BookInDB):
+    branch: Optional[str] = None  # Branch database the book was found in
+
+
 class User(UserBase):  # For API response
     id: int
 
@@ -0,0 +1,19 @@
+from functools import lru_cache
+
+
+# Password Hashing
+# passlib is imported where it is first needed, so importing this module
+# (from the API, the SIP2 server or the CLI) stays cheap.
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    return get_pwd_context().hash(password)
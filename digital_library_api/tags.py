@@ -0,0 +1,132 @@
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .circulation import BookNotFoundError
+from .database import Book as DBBook
+
+# RFID tags on books, shared by the JSON API, the SIP2 server and the RFID
+# reader service. A book's tag is its EPC (the tag's identifier) as upper-case
+# hex in books.rfid_tag, which has a unique index.
+#
+# tag_cache maps (branch, EPC) to a book id so gates and pads resolve
+# repeated reads without a database round trip. Assignments through
+# assign_tag()/clear_tag() are followed by invalidate_tags() in this process;
+# other processes see them once their entry expires (RFID_TAG_CACHE_TTL), so
+# anything that changes a book by tag should also filter on the tag itself
+# (book_filter_for_tag) rather than trust the cached id alone.
+
+# EPCs are 64 to 496 bits; ISBNs (10 or 13 digits) are never this long
+_EPC = re.compile(r"[0-9A-F]{16,124}")
+
+# Cached for tags that belong to no book (ids start at 1), so stray tags
+# seen by a gate are not looked up on every read
+NO_BOOK = 0
+
+tag_cache = TTLCache(
+    maxsize=int(os.environ.get("RFID_TAG_CACHE_MAXSIZE", "100000")),
+    ttl=float(os.environ.get("RFID_TAG_CACHE_TTL", "60")),
+)
+
+
+class TagError(ValueError):
+    """A tag could not be assigned; str(e) says why."""
+
+
+class InvalidTagError(TagError):
+    def __init__(self, epc):
+        super().__init__(f"Not an EPC: {epc!r} (expected 16 to 124 hex digits)")
+
+
+class TagAlreadyAssignedError(TagError):
+    def __init__(self, epc, book_id):
+        self.book_id = book_id
+        super().__init__(f"Tag {epc} is already assigned to book {book_id}")
+
+
+class TagChange(NamedTuple):
+    """What an assignment changed; invalidate both after committing it."""
+
+    epcs: List[str]  # For invalidate_tags()
+    book_ids: List[int]  # Books whose tag changed
+
+
+def normalize_epc(epc: str) -> Optional[str]:
+    """The EPC in canonical form (upper-case hex), or None if `epc` is not one."""
+    epc = epc.strip().upper()
+    return epc if len(epc) % 2 == 0 and _EPC.fullmatch(epc) else None
+
+
+def book_id_for_tag(db: Session, epc: str, branch: Optional[str] = None) -> Optional[int]:
+    """The id of the book carrying tag `epc` (canonical form), via tag_cache."""
+
+    def load():
+        book_id = db.query(DBBook.id).filter(DBBook.rfid_tag == epc).scalar()
+        return NO_BOOK if book_id is None else book_id
+
+    book_id = tag_cache.get_or_load((branch, epc), load)
+    return None if book_id == NO_BOOK else book_id
+
+
+def book_filter_for_tag(db: Session, epc: str, branch: Optional[str] = None):
+    """A filter for circulation.checkout()/checkin() that selects the book by tag.
+
+    It uses the cached book id, so SQLite seeks by rowid, and also requires
+    the tag, so an entry made stale by another process matches nothing
+    (BookNotFoundError) instead of the wrong book.
+    """
+    book_id = book_id_for_tag(db, epc, branch)
+    if book_id is None:
+        raise BookNotFoundError()
+    return and_(DBBook.id == book_id, DBBook.rfid_tag == epc)
+
+
+def assign_tag(db: Session, book_id: int, epc: str, reassign: bool = False) -> TagChange:
+    """Puts tag `epc` on a book, replacing the book's previous tag.
+
+    A tag already on another book is moved when `reassign` is true, else
+    TagAlreadyAssignedError is raised. The caller commits.
+    """
+    canonical = normalize_epc(epc)
+    if canonical is None:
+        raise InvalidTagError(epc)
+    book = db.query(DBBook).filter(DBBook.id == book_id).first()
+    if book is None:
+        raise BookNotFoundError()
+    if book.rfid_tag == canonical:
+        return TagChange([], [])
+    change = TagChange([canonical], [book_id])
+    holder = db.query(DBBook).filter(DBBook.rfid_tag == canonical).first()
+    if holder is not None:
+        if not reassign:
+            raise TagAlreadyAssignedError(canonical, holder.id)
+        holder.rfid_tag = None
+        change.book_ids.append(holder.id)
+        db.flush()  # Free the unique index entry before reusing it
+    if book.rfid_tag:
+        change.epcs.append(book.rfid_tag)
+    book.rfid_tag = canonical
+    db.flush()
+    return change
+
+
+def clear_tag(db: Session, book_id: int) -> TagChange:
+    """Removes a book's tag. The caller commits."""
+    book = db.query(DBBook).filter(DBBook.id == book_id).first()
+    if book is None:
+        raise BookNotFoundError()
+    if not book.rfid_tag:
+        return TagChange([], [])
+    change = TagChange([book.rfid_tag], [book_id])
+    book.rfid_tag = None
+    db.flush()
+    return change
+
+
+def invalidate_tags(epcs, branch: Optional[str] = None) -> None:
+    for epc in epcs:
+        tag_cache.invalidate((branch, epc))
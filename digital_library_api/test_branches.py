@@ -0,0 +1,121 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from .branches import BRANCH_HEADER, Branch, BranchRouter, UnknownBranchError
+from .database import Book as DBBook
+from .json_api import app, book_cache, get_branch_router, get_catalog_db, get_db
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def router(tmp_path):
+    """Two branch databases in temporary files, wired into the app."""
+    router = BranchRouter(
+        [
+            Branch("north", f"sqlite:///{tmp_path / 'north.sqlite3'}"),
+            Branch("south", f"sqlite:///{tmp_path / 'south.sqlite3'}"),
+        ]
+    )
+    saved_overrides = dict(app.dependency_overrides)
+    # Use the real, routed session dependencies
+    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_catalog_db, None)
+    app.dependency_overrides[get_branch_router] = lambda: router
+    book_cache.clear()
+    yield router
+    app.dependency_overrides.clear()
+    app.dependency_overrides.update(saved_overrides)
+    router.dispose()
+
+
+def add_book(router, branch, title, isbn, author="Author"):
+    db = router.session(branch)
+    db.add(DBBook(title=title, author=author, isbn=isbn))
+    db.commit()
+    db.close()
+
+
+def login(branch, username="librarian", password="secret"):
+    headers = {BRANCH_HEADER: branch}
+    client.post("/users/", json={"username": username, "password": password}, headers=headers)
+    response = client.post("/token", data={"username": username, "password": password}, headers=headers)
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_branches_use_separate_databases(router):
+    """Test that each branch has its own engine, file and pragmas."""
+    add_book(router, "north", "North Book", "1000000000001")
+
+    north, south = router.session("north"), router.session("south")
+    try:
+        assert north.query(DBBook).count() == 1
+        assert south.query(DBBook).count() == 0
+        assert north.get_bind() is not south.get_bind()
+        assert north.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+    finally:
+        north.close()
+        south.close()
+
+    with pytest.raises(UnknownBranchError):
+        router.session("east")
+
+
+def test_requests_routed_by_header(router):
+    """Test that the X-Library-Branch header selects the branch database."""
+    add_book(router, "north", "North Book", "1000000000001")
+
+    response = client.get("/books/", headers={BRANCH_HEADER: "north"})
+    assert [b["title"] for b in response.json()] == ["North Book"]
+    assert client.get("/books/", headers={BRANCH_HEADER: "south"}).json() == []
+
+    assert client.get("/books/").status_code == 400
+    assert client.get("/books/", headers={BRANCH_HEADER: "east"}).status_code == 400
+
+
+def test_requests_routed_by_token_claim(router):
+    """Test that tokens carry their branch and cannot be used for another one."""
+    auth_headers = login("south")
+
+    response = client.post(
+        "/books/",
+        json={"title": "South Book", "author": "Author", "isbn": "2000000000001"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    book_id = response.json()["id"]
+
+    # No header needed: the token's branch claim routes the request.
+    assert client.get(f"/books/{book_id}", headers=auth_headers).json()["title"] == "South Book"
+    assert client.get("/books/", headers={BRANCH_HEADER: "north"}).json() == []
+
+    response = client.get("/books/", headers={**auth_headers, BRANCH_HEADER: "north"})
+    assert response.status_code == 403
+
+
+def test_book_cache_is_per_branch(router):
+    """Test that equal book ids in different branches are cached separately."""
+    add_book(router, "north", "North Book", "1000000000001")
+    add_book(router, "south", "South Book", "2000000000001")
+
+    assert client.get("/books/1", headers={BRANCH_HEADER: "north"}).json()["title"] == "North Book"
+    assert client.get("/books/1", headers={BRANCH_HEADER: "south"}).json()["title"] == "South Book"
+
+
+def test_catalog_search_fans_out_and_merges(router):
+    """Test that a catalog search returns matches from every branch."""
+    add_book(router, "north", "Dune", "1000000000001", author="Frank Herbert")
+    add_book(router, "south", "Dune Messiah", "2000000000001", author="Frank Herbert")
+    add_book(router, "south", "Emma", "2000000000002", author="Jane Austen")
+
+    response = client.get("/catalog/search", params={"q": "Dune"})
+    assert response.status_code == 200
+    assert [(b["title"], b["branch"]) for b in response.json()] == [
+        ("Dune", "north"),
+        ("Dune Messiah", "south"),
+    ]
+
+    response = client.get("/catalog/search", params={"q": "Frank", "limit": 1})
+    assert len(response.json()) == 1
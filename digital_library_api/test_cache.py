@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+
+from .cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    """Test that entries expire once their TTL has passed."""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_get_or_load_does_not_cache_none():
+    """Test that a loader returning None (not found) is retried next time."""
+    cache = TTLCache()
+    calls = []
+    assert cache.get_or_load("a", lambda: calls.append(1)) is None
+    assert cache.get_or_load("a", lambda: calls.append(1)) is None
+    assert len(calls) == 2
+
+
+def test_get_or_load_coalesces_concurrent_misses():
+    """Test that concurrent misses on one key run the loader only once."""
+    cache = TTLCache()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_load("k", loader)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == ["value"] * 8
+    assert cache.get("k") == "value"
+
+
+def test_get_or_load_propagates_errors():
+    """Test that loader errors reach the caller and nothing is cached."""
+    cache = TTLCache()
+
+    def loader():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("k", loader)
+    assert cache.get_or_load("k", lambda: 1) == 1
+
+
+def test_invalidate_during_load_discards_result():
+    """Test that a load racing with an invalidation does not store stale data."""
+    cache = TTLCache()
+
+    def loader():
+        cache.invalidate("k")  # e.g. a write committed while we were reading
+        return "stale"
+
+    assert cache.get_or_load("k", loader) == "stale"
+    assert cache.get("k") is None
+
+
+def test_stats_hit_rate_and_memory():
+    """Test the reported hit rate and memory footprint."""
+    cache = TTLCache(sizeof=len)
+    cache.set("a", "x" * 100)
+    cache.get("a")
+    cache.get("missing")
+
+    stats = cache.stats()
+    assert stats["hit_rate"] == 0.5
+    assert stats["memory_bytes"] == 100
+    cache.invalidate("a")
+    assert cache.stats()["memory_bytes"] == 0
@@ -11,10 +11,8 @@ from .database import (
     Book as DBBook,  # <--- Import DBBook as well if you want to see it
 )
 
-from .test_json_api import db_session
 
-
-def test_inspect_database_tables(db_session):  # noqa: F811
+def test_inspect_database_tables(db_session):
     """Test to inspect and list all tables in the test database."""
     # The db_session fixture ensures tables are created.
     # We can get the engine from the session.
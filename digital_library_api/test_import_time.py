@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Cumulative import budgets in milliseconds, roughly 2.5x what the modules take
+# on a developer machine. Slow CI runners can scale them with
+# IMPORT_TIME_BUDGET_SCALE instead of editing the numbers.
+IMPORT_BUDGETS_MS = {
+    "digital_library_api.database": 700,
+    "digital_library_api.json_api": 1500,
+}
+BUDGET_SCALE = float(os.environ.get("IMPORT_TIME_BUDGET_SCALE", "1"))
+
+# Modules that must only be imported when actually used.
+DEFERRED_MODULES = ["uvicorn", "jose", "passlib", "PySide6"]
+
+
+def measure_import(module: str) -> dict:
+    """Imports `module` in a fresh interpreter under -X importtime.
+
+    Returns a mapping of every imported module to its cumulative time in ms.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGETS_MS))
+def test_import_time_within_budget(module):
+    """Test that cold-importing API modules stays under the time budget."""
+    budget = IMPORT_BUDGETS_MS[module] * BUDGET_SCALE
+    # Best of three runs to keep scheduler noise out of the measurement.
+    best = min(measure_import(module)[module] for _ in range(3))
+    assert best <= budget, f"import {module} took {best:.0f} ms (budget {budget:.0f} ms)"
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGETS_MS))
+def test_heavy_dependencies_are_deferred(module):
+    """Test that server, auth and GUI libraries are not imported eagerly."""
+    imported = measure_import(module)
+    eager = [name for name in DEFERRED_MODULES if name in imported]
+    assert not eager, f"import {module} eagerly imports {', '.join(eager)}"
@@ -1,96 +1,16 @@
-import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool  # Add this import
-from sqlalchemy.orm import sessionmaker
-
-from .json_api import app, get_db  # Import the FastAPI app and the dependency
-from .database import (
-    Base,
-    create_db_tables,
-    User as DBUser,
-    Book as DBBook,  # <--- Import DBBook as well if you want to see it
-)
-
-# --- Test Database Setup ---
-# Use an in-memory SQLite database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,  # Use StaticPool for in-memory SQLite
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-
-# --- Dependency Override ---
-# This function will be used to override the get_db dependency in json_api.py
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-
-# Override the dependency in the FastAPI app
-app.dependency_overrides[get_db] = override_get_db
-
-# --- Test Client ---
-# Create a TestClient instance for your app
-client = TestClient(app)
-
-
-# --- Pytest Fixtures ---
-# Fixture to create and drop tables for each test
-@pytest.fixture(scope="function", autouse=True)
-def db_session(request):  # Added request for potential unique naming if needed
-    """Create a new database session for each test."""
-    # Ensure a clean state and create tables for each test using the test engine
-    Base.metadata.create_all(bind=engine)  # Create all tables
-    db = TestingSessionLocal()
-    try:
-        yield db  # Provide the session to the test
-    finally:
-        db.close()
-        Base.metadata.drop_all(bind=engine)  # Ensure tables are dropped after the test
-
-
-@pytest.fixture(scope="function")
-def test_user(db_session):
-    """Creates a user in the DB and returns the user object and raw password."""
-    username = "testfixtureuser"
-    password = "testfixturepassword"
-
-    response = client.post("/users/", json={"username": username, "password": password})
-    assert response.status_code == 201, (
-        f"Failed to create user for fixture: {response.json()}"
-    )
-    user_data = response.json()
-
-    db_user = db_session.query(DBUser).filter(DBUser.id == user_data["id"]).first()
-    assert db_user is not None, "User not found in DB after creation for fixture"
-    return {
-        "db_user": db_user,
-        "password": password,
-        "id": db_user.id,
-        "username": db_user.username,
-    }
+import asyncio
+import time
 
+import httpx
+import pytest
+from sqlalchemy import event
 
-@pytest.fixture(scope="function")
-def auth_headers(test_user):
-    """Provides authentication headers for a test user."""
-    username = test_user["username"]
-    password = test_user["password"]
+from . import json_api
+from .json_api import app, book_cache
+from .database import Book as DBBook
+from .conftest import client, engine
 
-    response = client.post("/token", data={"username": username, "password": password})
-    assert response.status_code == 200, (
-        f"Failed to get token for fixture: {response.json()}"
-    )
-    token = response.json()["access_token"]
-    return {"Authorization": f"Bearer {token}"}
+pytestmark = pytest.mark.usefixtures("db_session")  # Fresh tables for every test
 
 
 # You might not need to explicitly use db_session fixture in tests
@@ -241,6 +161,46 @@ def test_get_all_books_with_data(auth_headers):
     assert book2_data["isbn"] in response_isbns
 
 
+def test_get_all_books_filters(auth_headers, test_user):
+    """Test filtering the book list by availability, borrower and due date."""
+    borrowed = create_book_via_api_util(auth_headers, title="Out", isbn="1100000000001")
+    create_book_via_api_util(auth_headers, title="In", isbn="1100000000002")
+    client.post(f"/books/{borrowed['id']}/borrow", json={"borrow_days": 7}, headers=auth_headers)
+
+    def titles(**params):
+        return [b["title"] for b in client.get("/books/", params=params).json()]
+
+    assert titles(is_borrowed="false") == ["In"]
+    assert titles(is_borrowed="true") == ["Out"]
+    assert titles(borrower_id=test_user["id"]) == ["Out"]
+    assert titles(due_before="2999-01-01") == ["Out"]
+    assert titles(due_before="2000-01-01") == []
+
+
+def test_get_all_books_paged_and_changed_since(auth_headers, db_session):
+    """Test keyset paging and the updated_since filter remote desks sync with."""
+    books = [create_book_via_api_util(auth_headers, title=f"Page {n}", isbn=f"120000000000{n}") for n in range(5)]
+    ids = [book["id"] for book in books]
+
+    def page(**params):
+        return [b["id"] for b in client.get("/books/", params=params).json()]
+
+    assert page(limit=2) == ids[:2]
+    assert page(after_id=ids[1], limit=2) == ids[2:4]
+    assert page(after_id=ids[3]) == ids[4:]
+
+    # Pre-existing books have no stamp and only come with a full listing
+    db_session.query(DBBook).filter(DBBook.id == ids[0]).update({"updated_at": None})
+    db_session.commit()
+    since = max(book["updated_at"] for book in books)
+    assert page(updated_since=since) == [ids[-1]]
+    client.post(f"/books/{ids[0]}/borrow", json={"borrow_days": 7}, headers=auth_headers)
+    changed = client.get("/books/", params={"updated_since": since, "fields": "id,updated_at"}).json()
+    assert sorted(b["id"] for b in changed) == [ids[0], ids[-1]]
+    assert sorted(page(updated_since=since + "+01:00")) == ids  # Converted to UTC
+    assert client.get("/books/", params={"limit": 0}).status_code == 422
+
+
 def test_get_book_success(auth_headers):
     """Test getting a single existing book."""
     created_book = create_book_via_api_util(
@@ -263,6 +223,186 @@ def test_get_book_not_found():
     assert response.json() == {"detail": "Book not found"}
 
 
+def test_get_all_books_sparse_fields(auth_headers):
+    """Test that ?fields= returns only the requested keys."""
+    create_book_via_api_util(auth_headers, title="Sparse One", isbn="2100000000001")
+    create_book_via_api_util(auth_headers, title="Sparse Two", isbn="2100000000002")
+
+    response = client.get("/books/", params={"fields": "id,title,is_borrowed"})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 2
+    for book in data:
+        assert set(book) == {"id", "title", "is_borrowed"}
+    assert {b["title"] for b in data} == {"Sparse One", "Sparse Two"}
+
+
+def test_get_all_books_sparse_fields_skips_borrower_join(auth_headers):
+    """Test that the users join is only issued when borrower_username is requested."""
+    create_book_via_api_util(auth_headers, isbn="2100000000011")
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        client.get("/books/", params={"fields": "id,title"})
+        assert not any("JOIN" in s for s in statements)
+
+        statements.clear()
+        response = client.get("/books/", params={"fields": "id,borrower_username"})
+        assert any("LEFT OUTER JOIN users" in s for s in statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert response.json()[0]["borrower_username"] is None
+
+
+def test_get_book_sparse_fields(auth_headers, test_user):
+    """Test ?fields= on the detail endpoint, including the joined borrower name."""
+    book = create_book_via_api_util(auth_headers, isbn="2100000000021")
+    client.post(
+        f"/books/{book['id']}/borrow", json={"borrow_days": 7}, headers=auth_headers
+    )
+
+    response = client.get(
+        f"/books/{book['id']}", params={"fields": "title,due_date,borrower_username"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data) == {"title", "due_date", "borrower_username"}
+    assert data["borrower_username"] == test_user["username"]
+    assert data["due_date"] is not None
+
+    response = client.get("/books/99999", params={"fields": "id"})
+    assert response.status_code == 404
+
+
+def test_get_books_invalid_fields():
+    """Test that unknown field names are rejected."""
+    response = client.get("/books/", params={"fields": "id,hashed_password"})
+    assert response.status_code == 400
+    assert "hashed_password" in response.json()["detail"]
+
+
+def test_get_book_served_from_cache(auth_headers, db_session):
+    """Test that repeated detail lookups are answered from the cache."""
+    book = create_book_via_api_util(auth_headers, isbn="2200000000001")
+    hits_before = book_cache.hits
+
+    assert client.get(f"/books/{book['id']}").status_code == 200
+    # Change the row behind the API's back; the cached response is served.
+    db_session.query(DBBook).filter(DBBook.id == book["id"]).update({"title": "Stale"})
+    db_session.commit()
+    response = client.get(f"/books/{book['id']}")
+    assert response.json()["title"] == "Test Book"
+    assert book_cache.hits == hits_before + 1
+
+    stats = client.get("/cache/stats").json()["books"]
+    assert stats["size"] == 1
+    assert stats["memory_bytes"] > 0
+
+
+def test_get_book_concurrent_misses_share_one_load(auth_headers, monkeypatch):
+    """Test that concurrent requests for an uncached book on one event loop run a single load."""
+    book = create_book_via_api_util(auth_headers, isbn="2200000000021")
+    load_book_json = json_api.load_book_json
+    loads = []
+
+    def slow_load(db, book_id):
+        loads.append(book_id)
+        time.sleep(0.2)  # Long enough for the other requests to arrive
+        return load_book_json(db, book_id)
+
+    monkeypatch.setattr(json_api, "load_book_json", slow_load)
+    coalesced_before = book_cache.coalesced
+
+    async def fetch_concurrently():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            return await asyncio.gather(*(async_client.get(f"/books/{book['id']}") for _ in range(5)))
+
+    responses = asyncio.run(fetch_concurrently())
+    assert [response.json()["isbn"] for response in responses] == ["2200000000021"] * 5
+    assert loads == [book["id"]]
+    assert book_cache.coalesced == coalesced_before + 4
+
+
+def test_book_cache_updated_by_writes(auth_headers, test_user):
+    """Test that update, borrow, return and delete keep cached details correct."""
+    book = create_book_via_api_util(auth_headers, isbn="2200000000011")
+    book_id = book["id"]
+    client.get(f"/books/{book_id}")
+
+    client.put(f"/books/{book_id}", json={"title": "Renamed"}, headers=auth_headers)
+    assert client.get(f"/books/{book_id}").json()["title"] == "Renamed"
+
+    client.post(f"/books/{book_id}/borrow", json={"borrow_days": 7}, headers=auth_headers)
+    data = client.get(f"/books/{book_id}").json()
+    assert data["is_borrowed"] is True
+    assert data["borrower_username"] == test_user["username"]
+
+    client.post(f"/books/{book_id}/return", headers=auth_headers)
+    data = client.get(f"/books/{book_id}").json()
+    assert data["is_borrowed"] is False
+    assert data["borrower_username"] is None
+
+    client.delete(f"/books/{book_id}", headers=auth_headers)
+    assert client.get(f"/books/{book_id}").status_code == 404
+
+
+def test_assign_rfid_tag(auth_headers):
+    """Test assigning, looking up, moving and clearing a book's RFID tag."""
+    epc = "E28011606000020A3B4C5D6E"
+    dune = create_book_via_api_util(auth_headers, title="Dune", isbn="2210000000001")
+    emma = create_book_via_api_util(auth_headers, title="Emma", isbn="2210000000002")
+
+    response = client.put(f"/books/{dune['id']}/rfid", json={"rfid_tag": epc.lower()}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["rfid_tag"] == epc
+    assert client.get(f"/books/by-rfid/{epc}").json()["title"] == "Dune"
+    assert client.get(f"/books/{dune['id']}", params={"fields": "rfid_tag"}).json() == {"rfid_tag": epc}
+
+    response = client.put(f"/books/{emma['id']}/rfid", json={"rfid_tag": epc}, headers=auth_headers)
+    assert response.status_code == 409
+    response = client.put(
+        f"/books/{emma['id']}/rfid", json={"rfid_tag": epc, "reassign": True}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    # Both the tag lookup and the previous holder's cached details were invalidated
+    assert client.get(f"/books/by-rfid/{epc}").json()["title"] == "Emma"
+    assert client.get(f"/books/{dune['id']}").json()["rfid_tag"] is None
+
+    assert client.delete(f"/books/{emma['id']}/rfid", headers=auth_headers).json()["rfid_tag"] is None
+    assert client.get(f"/books/by-rfid/{epc}").status_code == 404
+    assert client.get("/cache/stats").json()["rfid_tags"]["misses"] >= 1
+
+
+def test_assign_rfid_tag_errors(auth_headers):
+    """Test that malformed tags, unknown books and missing tokens are refused."""
+    book = create_book_via_api_util(auth_headers, isbn="2210000000011")
+    url = f"/books/{book['id']}/rfid"
+    assert client.put(url, json={"rfid_tag": "9780441013593"}, headers=auth_headers).status_code == 400
+    assert client.put(url, json={"rfid_tag": "E2801160XYZ00000"}, headers=auth_headers).status_code == 400
+    assert client.put("/books/999/rfid", json={"rfid_tag": "E280116060000201"}, headers=auth_headers).status_code == 404
+    assert client.put(url, json={"rfid_tag": "E280116060000201"}).status_code == 401
+    assert client.get("/books/by-rfid/not-a-tag").status_code == 404
+
+
+def test_search_catalog_prefix(auth_headers):
+    """Test catalog search by title, author or ISBN prefix on a single database."""
+    create_book_via_api_util(auth_headers, title="Dune", author="Frank Herbert", isbn="2300000000001")
+    create_book_via_api_util(auth_headers, title="Emma", author="Jane Austen", isbn="2300000000002")
+
+    response = client.get("/catalog/search", params={"q": "Jane"})
+    assert response.status_code == 200
+    assert [b["title"] for b in response.json()] == ["Emma"]
+    assert response.json()[0]["branch"] is None
+
+    response = client.get("/catalog/search", params={"q": "230000000000"})
+    assert [b["title"] for b in response.json()] == ["Dune", "Emma"]
+
+
 def test_update_book_success(auth_headers):
     """Test successfully updating a book's details."""
     created_book = create_book_via_api_util(
@@ -349,6 +489,18 @@ def test_delete_book_success(auth_headers):
     assert get_response.status_code == 404
 
 
+def test_book_deletions_since(auth_headers):
+    """Test that deleted books are listed for clients syncing a copy of the catalog."""
+    kept = create_book_via_api_util(auth_headers, isbn="4000000000011")
+    gone = create_book_via_api_util(auth_headers, isbn="4000000000012")
+    client.delete(f"/books/{gone['id']}", headers=auth_headers)
+
+    deletions = client.get("/books/deletions", params={"since": kept["updated_at"]}).json()
+    assert [deletion["id"] for deletion in deletions] == [gone["id"]]
+    assert deletions[0]["deleted_at"] >= gone["updated_at"]
+    assert client.get("/books/deletions", params={"since": "2999-01-01T00:00:00"}).json() == []
+
+
 def test_delete_book_not_found(auth_headers):
     """Test deleting a non-existent book."""
     response = client.delete("/books/99997", headers=auth_headers)
@@ -385,6 +537,25 @@ def test_borrow_book_success(auth_headers, test_user):
     assert data["due_date"] is not None
 
 
+def test_borrow_book_for_another_user(auth_headers, test_user):
+    """Test lending a book to a named patron, as a desk does."""
+    book = create_book_via_api_util(auth_headers, isbn="5000000000009")
+    patron = client.post("/users/", json={"username": "patron", "password": "pw"}).json()
+
+    response = client.post(
+        f"/books/{book['id']}/borrow", json={"borrower_username": "nobody"}, headers=auth_headers
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unknown borrower: nobody"}
+
+    response = client.post(
+        f"/books/{book['id']}/borrow", json={"borrower_username": "patron"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["borrower_id"] == patron["id"]
+    assert response.json()["borrower_username"] == "patron"
+
+
 def test_borrow_book_not_found(auth_headers):
     """Test borrowing a non-existent book."""
     response = client.post(
@@ -474,3 +645,12 @@ def test_return_book_unauthenticated(
     response = client.post(f"/books/{book_id}/return")  # No headers
     assert response.status_code == 401
     assert response.json() == {"detail": "Not authenticated"}
+
+
+def test_request_id_header():
+    """Test that a client's X-Request-ID is echoed and a fresh one is made otherwise."""
+    response = client.get("/books/", headers={"X-Request-ID": "kiosk-42.abc"})
+    assert response.headers["X-Request-ID"] == "kiosk-42.abc"
+
+    generated = client.get("/books/", headers={"X-Request-ID": "not valid!"}).headers["X-Request-ID"]
+    assert generated != "not valid!" and len(generated) == 32
@@ -0,0 +1,70 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from . import log
+
+
+@pytest.fixture
+def stream():
+    output = io.StringIO()
+    yield output
+    log.shutdown_logging()
+
+
+def records(output):
+    log.shutdown_logging()  # Flushes the queue
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_json_records_carry_context_and_extras(stream):
+    """Test that records are written as JSON with the context ids and extra fields."""
+    log.configure_logging(level="INFO", json_format=True, stream=stream)
+    logger = logging.getLogger("digital_library_api.test")
+    token = log.connection_id.set(7)
+    try:
+        logger.info("Received %s", "9300", extra={"direction": "received"})
+    finally:
+        log.connection_id.reset(token)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Failed")
+    logger.debug("Not logged at INFO")
+
+    received, failed = records(stream)
+    assert received["message"] == "Received 9300"
+    assert received["connection_id"] == 7 and received["direction"] == "received"
+    assert received["level"] == "INFO" and received["logger"] == "digital_library_api.test"
+    assert "request_id" not in received
+    assert failed["level"] == "ERROR" and "ValueError: boom" in failed["exception"]
+
+
+def test_full_queue_drops_and_counts():
+    """Test that a full queue drops records instead of blocking the caller."""
+    handler = log.DroppingQueueHandler(queue.Queue(2))
+    logger = logging.getLogger("digital_library_api.test.dropping")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for n in range(5):
+            logger.warning("record %d", n)
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    assert handler.queue.get().getMessage() == "record 0"
+
+
+def test_sample_rate(stream):
+    """Test that the sample rate sets how many records sampled() lets through."""
+    log.configure_logging(sample_rate=0.0, stream=stream)
+    assert not any(log.sampled() for _ in range(100))
+    log.configure_logging(sample_rate=1.0, stream=stream)
+    assert all(log.sampled() for _ in range(100))
+    with pytest.raises(ValueError):
+        log.configure_logging(sample_rate=2.0, stream=stream)
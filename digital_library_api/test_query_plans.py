@@ -0,0 +1,129 @@
+import re
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from .json_api import book_cache
+from .tags import tag_cache
+from .conftest import client, engine
+from .test_json_api import create_book_via_api_util
+
+pytestmark = pytest.mark.usefixtures("db_session")
+
+# The unfiltered GET /books/ returns every row by design and is not checked
+# here; its common sparse form must at least read a covering index instead.
+
+# "SCAN books" or "SCAN books USING INDEX ix" visit every row of the table.
+# "SCAN books USING COVERING INDEX ix" reads only the (smaller) index.
+FULL_SCAN = re.compile(r"^SCAN (books|users)\b(?! USING COVERING INDEX)")
+ANY_SCAN = re.compile(r"^SCAN (books|users)\b")
+
+
+@pytest.fixture
+def captured_statements():
+    """Records every SQL statement (with parameters) the app executes."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield statements
+    event.remove(engine, "before_cursor_execute", capture)
+
+
+def query_plan(statement, parameters):
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in rows]
+
+
+def assert_indexed(statements, allow_covering_scan=False):
+    pattern = FULL_SCAN if allow_covering_scan else ANY_SCAN
+    for statement, parameters in statements:
+        plan = query_plan(statement, parameters)
+        scans = [step for step in plan if pattern.match(step)]
+        assert not scans, f"{statement!r} scans the table: {plan}"
+
+
+@pytest.fixture
+def library(auth_headers, test_user):
+    """A few books, one of them borrowed (and due within the next month)."""
+    books = [
+        create_book_via_api_util(auth_headers, title=f"Plan Book {n}", isbn=f"700000000000{n}")
+        for n in range(3)
+    ]
+    client.post(f"/books/{books[0]['id']}/borrow", json={"borrow_days": 7}, headers=auth_headers)
+    return books
+
+
+def endpoint_requests(books, user_id):
+    book_id = books[0]["id"]
+    next_month = (date.today() + timedelta(days=30)).isoformat()
+    return [
+        ("POST", "/users/", {"json": {"username": "planuser", "password": "pw"}}),
+        ("POST", "/token", {"data": {"username": "testfixtureuser", "password": "testfixturepassword"}}),
+        ("POST", "/books/", {"json": {"title": "New", "author": "A", "isbn": "7100000000001"}}),
+        ("GET", "/books/", {"params": {"is_borrowed": "false"}}),
+        ("GET", "/books/", {"params": {"is_borrowed": "true", "fields": "id,title"}}),
+        ("GET", "/books/", {"params": {"borrower_id": user_id}}),
+        ("GET", "/books/", {"params": {"due_before": next_month}}),
+        ("GET", f"/books/{book_id}", {}),
+        ("GET", "/catalog/search", {"params": {"q": "Plan"}}),
+        ("PUT", f"/books/{books[1]['id']}", {"json": {"isbn": "7200000000001"}}),
+        ("PUT", f"/books/{books[1]['id']}/rfid", {"json": {"rfid_tag": "E280116060000201"}}),
+        ("GET", "/books/by-rfid/E280116060000201", {}),
+        ("POST", f"/books/{book_id}/return", {}),
+        ("POST", f"/books/{book_id}/borrow", {"json": {"borrow_days": 7}}),
+        ("DELETE", f"/books/{books[2]['id']}", {}),
+    ]
+
+
+def test_endpoint_queries_use_indexes(library, test_user, auth_headers, captured_statements):
+    """Test that no filtered endpoint query falls back to a full table scan."""
+    for method, url, kwargs in endpoint_requests(library, test_user["id"]):
+        captured_statements.clear()
+        book_cache.clear()  # Make cached endpoints run their query
+        tag_cache.clear()
+        response = client.request(method, url, headers=auth_headers, **kwargs)
+        assert response.status_code < 300, (method, url, response.json())
+        assert captured_statements, f"no queries captured for {method} {url}"
+        assert_indexed(captured_statements)
+
+
+def test_sparse_listing_uses_covering_index(library, captured_statements):
+    """Test that the common id/title/is_borrowed listing reads only an index."""
+    client.get("/books/", params={"fields": "id,title,is_borrowed"})
+    assert captured_statements
+    assert_indexed(captured_statements, allow_covering_scan=True)
+
+
+def test_upgrade_schema_adds_missing_indexes(tmp_path):
+    """Test that the migration step adds new columns and indexes to an old database."""
+    from sqlalchemy import create_engine, inspect, text
+
+    from .database import create_db_tables, upgrade_schema
+
+    old_engine = create_engine(f"sqlite:///{tmp_path / 'old.sqlite3'}")
+    create_db_tables(old_engine)
+    with old_engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_books_borrower_id_due_date"))
+
+        # A database from before books.rfid_tag existed
+        connection.execute(text("DROP INDEX ix_books_rfid_tag"))
+        connection.execute(text("ALTER TABLE books DROP COLUMN rfid_tag"))
+
+    upgrade_schema(old_engine)
+    upgrade_schema(old_engine)  # Idempotent
+
+    names = {index["name"] for index in inspect(old_engine).get_indexes("books")}
+    assert {
+        "ix_books_borrower_id_due_date",
+        "ix_books_is_borrowed_due_date",
+        "ix_books_is_borrowed_title",
+        "ix_books_rfid_tag",
+    } <= names
+    assert "rfid_tag" in {column["name"] for column in inspect(old_engine).get_columns("books")}
+    old_engine.dispose()
@@ -0,0 +1,204 @@
+import bisect
+from typing import NamedTuple, Optional
+
+from PySide6 import QtCore
+
+from .book_operations import get_book_page
+
+PAGE_SIZE = 500
+
+
+class BookRow(NamedTuple):
+    """One book as the table shows it: plain values, no ORM object or session."""
+
+    id: int
+    title: str
+    author: str
+    isbn: str
+    is_borrowed: bool
+    due_date: object  # datetime.date or None
+    borrower_username: Optional[str]
+
+    @classmethod
+    def from_book(cls, book):
+        """The row for an ORM Book, e.g. one just returned by book_operations."""
+        borrower = book.borrower.username if book.borrower is not None else None
+        return cls(book.id, book.title, book.author, book.isbn, book.is_borrowed, book.due_date, borrower)
+
+    @property
+    def status(self):
+        if not self.is_borrowed:
+            return "Available"
+        return f"Borrowed by {self.borrower_username}" if self.borrower_username else "Borrowed"
+
+
+COLUMNS = (
+    ("Title", lambda row: row.title),
+    ("Author", lambda row: row.author),
+    ("ISBN", lambda row: row.isbn),
+    ("Status", lambda row: row.status),
+    ("Due date", lambda row: row.due_date.isoformat() if row.due_date else ""),
+)
+
+
+class BookRowsModel(QtCore.QAbstractTableModel):
+    """A table of BookRows; subclasses decide which rows and in what order."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return COLUMNS[index.column()][1](row)
+        if role == QtCore.Qt.UserRole:
+            return row.id
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return COLUMNS[section][0]
+        return None
+
+    def book_row(self, row) -> Optional[BookRow]:
+        return self._rows[row] if 0 <= row < len(self._rows) else None
+
+    def remove(self, book_id):
+        row = self.row_of(book_id)
+        if row >= 0:
+            self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            del self._rows[row]
+            self.endRemoveRows()
+
+
+class BookTableModel(BookRowsModel):
+    """The catalog as a table, fetched a page at a time as the view scrolls.
+
+    Pages are read on the TaskRunner's pool by keyset (id > last id seen,
+    which walks the primary key however deep the scroll) with borrower
+    names joined in, and appended through canFetchMore()/fetchMore(). Only
+    compact BookRows are kept, for the rows scrolled into so far.
+
+    Rows stay in id order, so a single book can be found by bisection and
+    patched in place (upsert(), remove()) after the window changes it,
+    instead of reloading the table.
+    """
+
+    loaded = QtCore.Signal(int)  # Rows now in the model, after each page
+    failed = QtCore.Signal(str)
+
+    def __init__(self, tasks, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.tasks = tasks
+        self.page_size = page_size
+        self._exhausted = False
+        self._fetching = False
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._fetching
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._fetching = True
+        after_id = self._rows[-1].id if self._rows else 0
+        limit = self.page_size
+        self.tasks.submit(
+            "books",
+            lambda db, cancelled: get_book_page(db, after_id, limit),
+            self._append_page,
+            self._page_failed,
+        )
+
+    def reload(self):
+        """Drops every row and starts again from the first page."""
+        self.tasks.cancel("books")
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = False
+        self._fetching = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def row_of(self, book_id) -> int:
+        """The row showing book `book_id`, or -1."""
+        row = bisect.bisect_left(self._rows, book_id, key=lambda book: book.id)
+        return row if row < len(self._rows) and self._rows[row].id == book_id else -1
+
+    def upsert(self, book: BookRow) -> int:
+        """Shows `book`'s current state; returns its row, or -1 if it is not loaded yet.
+
+        A book beyond the last loaded page is left for fetchMore() to bring in.
+        """
+        row = bisect.bisect_left(self._rows, book.id, key=lambda existing: existing.id)
+        if row < len(self._rows) and self._rows[row].id == book.id:
+            self._rows[row] = book
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+            return row
+        if row == len(self._rows) and not self._exhausted:
+            return -1
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self._rows.insert(row, book)
+        self.endInsertRows()
+        return row
+
+    def _append_page(self, page):
+        self._fetching = False
+        rows = [BookRow(*values) for values in page]
+        self._exhausted = len(rows) < self.page_size
+        if self._rows:  # Books upserted while the page was loading are already here
+            rows = [row for row in rows if row.id > self._rows[-1].id]
+        if rows:
+            self.beginInsertRows(QtCore.QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+        self.loaded.emit(len(self._rows))
+
+    def _page_failed(self, message):
+        self._fetching = False
+        self._exhausted = True  # Stop the view asking again; reload() retries
+        self.failed.emit(message)
+
+
+class SearchResultModel(BookRowsModel):
+    """The books matching a search, in the order the matches arrive.
+
+    Rows are streamed in with append_rows() as each query of
+    book_operations.search_book_rows() finishes. Patches after the window
+    changes a book only touch rows already shown: whether an edited book
+    still matches is settled by the next search, not guessed here.
+    """
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self.endResetModel()
+
+    def append_rows(self, rows):
+        shown = {row.id for row in self._rows}
+        rows = [row for row in rows if row.id not in shown]
+        if rows:
+            self.beginInsertRows(QtCore.QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+
+    def row_of(self, book_id) -> int:
+        """The row showing book `book_id`, or -1."""
+        return next((row for row, book in enumerate(self._rows) if book.id == book_id), -1)
+
+    def upsert(self, book: BookRow) -> int:
+        """Updates `book`'s row if it is shown; returns the row, or -1."""
+        row = self.row_of(book.id)
+        if row >= 0:
+            self._rows[row] = book
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+        return row
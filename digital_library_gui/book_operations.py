@@ -1,7 +1,9 @@
 from sqlalchemy.orm import Session
 from datetime import date, timedelta
 
-from digital_library_api.database import Book as DBBook
+from digital_library_api.database import Book as DBBook, User as DBUser, prefix_match, prefix_match_nocase
+
+SEARCH_LIMIT = 50  # Matches per field; enough to fill the window
 
 
 def get_all_books(db_session: Session):
@@ -9,6 +11,59 @@ def get_all_books(db_session: Session):
     return db_session.query(DBBook).all()
 
 
+def _book_rows(db_session: Session):
+    """Plain (id, title, author, isbn, is_borrowed, due_date, borrower username)
+    rows, with the borrower joined in rather than lazy-loaded."""
+    return db_session.query(
+        DBBook.id,
+        DBBook.title,
+        DBBook.author,
+        DBBook.isbn,
+        DBBook.is_borrowed,
+        DBBook.due_date,
+        DBUser.username,
+    ).outerjoin(DBUser, DBBook.borrower_id == DBUser.id)
+
+
+def get_book_page(db_session: Session, after_id: int = 0, limit: int = 500):
+    """Fetches up to `limit` books with ids above `after_id`, in id order.
+
+    Returns plain tuples from one query (see _book_rows), so the result can
+    leave the session's thread and borrowers cost no extra SELECTs. Paging
+    by id (keyset) seeks the primary key, so deep pages are as fast as the
+    first.
+    """
+    query = _book_rows(db_session).filter(DBBook.id > after_id).order_by(DBBook.id).limit(limit)
+    return [tuple(row) for row in query]
+
+
+def get_book_row(db_session: Session, book_id: int):
+    """One book as a plain tuple (see _book_rows), or None if it is gone."""
+    row = _book_rows(db_session).filter(DBBook.id == book_id).first()
+    return tuple(row) if row is not None else None
+
+
+def search_book_rows(db_session: Session, text: str, limit: int = SEARCH_LIMIT):
+    """Prefix search on title, then author, then ISBN, as a generator.
+
+    Yields one list of plain tuples (see _book_rows) per field, leaving out
+    books already yielded, so callers can show the title matches while the
+    rest load and can stop between fields. Each field is its own LIMITed
+    query reading an index in order (titles and authors ignore case), so
+    the cost does not depend on how many books match a short prefix.
+    """
+    seen = set()
+    for column, match, order in (
+        (DBBook.title, prefix_match_nocase, DBBook.title.collate("NOCASE")),
+        (DBBook.author, prefix_match_nocase, DBBook.author.collate("NOCASE")),
+        (DBBook.isbn, prefix_match, DBBook.isbn),
+    ):
+        query = _book_rows(db_session).filter(match(column, text)).order_by(order).limit(limit)
+        rows = [tuple(row) for row in query if row[0] not in seen]
+        seen.update(row[0] for row in rows)
+        yield rows
+
+
 def get_book_by_id(db_session: Session, book_id: int):
     """Fetches a single book by its ID."""
     return db_session.query(DBBook).filter(DBBook.id == book_id).first()
@@ -81,7 +136,7 @@ def delete_existing_book(db_session: Session, book_id: int):
 
 
 def borrow_selected_book(db_session: Session, book_id: int, borrower_name: str):
-    """Marks a book as borrowed.
+    """Lends a book to the registered user named `borrower_name`.
 
     Returns:
         Tuple (DBBook | None, str | None): (book_object, error_message)
@@ -90,10 +145,14 @@ def borrow_selected_book(db_session: Session, book_id: int, borrower_name: str):
     if not book_to_borrow:
         return None, "Book not found in database."
     if book_to_borrow.is_borrowed:
-        return None, f"'{book_to_borrow.title}' is already borrowed by {book_to_borrow.borrower_name}."
+        borrower = book_to_borrow.borrower.username if book_to_borrow.borrower else "another user"
+        return None, f"'{book_to_borrow.title}' is already borrowed by {borrower}."
+    borrower = db_session.query(DBUser).filter(DBUser.username == borrower_name).first()
+    if not borrower:
+        return None, f"Unknown borrower: {borrower_name}"
 
     book_to_borrow.is_borrowed = True
-    book_to_borrow.borrower_name = borrower_name
+    book_to_borrow.borrower = borrower
     book_to_borrow.due_date = date.today() + timedelta(weeks=2)
     db_session.commit()
     db_session.refresh(book_to_borrow)
@@ -113,7 +172,7 @@ def return_selected_book(db_session: Session, book_id: int):
         return None, f"'{book_to_return.title}' is not currently borrowed."
 
     book_to_return.is_borrowed = False
-    book_to_return.borrower_name = None
+    book_to_return.borrower = None
     book_to_return.due_date = None
     db_session.commit()
     db_session.refresh(book_to_return)
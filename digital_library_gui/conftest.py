@@ -0,0 +1,52 @@
+import os
+import time
+from datetime import date
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PySide6 import QtWidgets
+from sqlalchemy.orm import sessionmaker
+
+from digital_library_api.conftest import db_session  # noqa: F401 (fixture: the API's test database, for test_remote)
+from digital_library_api.database import Book as DBBook, User as DBUser, create_db_tables, make_engine
+
+
+@pytest.fixture(scope="session")
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def wait_for(app, condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    assert condition()
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """25 books; every fifth is on loan to "patron"."""
+    engine = make_engine(f"sqlite:///{tmp_path / 'gui.sqlite3'}")
+    create_db_tables(engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(DBUser(id=1, username="patron", hashed_password="x"))
+    for n in range(1, 26):
+        borrowed = n % 5 == 0
+        db.add(
+            DBBook(
+                id=n,
+                title=f"Book {n}",
+                author="Author",
+                isbn=f"{n:013d}",
+                is_borrowed=borrowed,
+                borrower_id=1 if borrowed else None,
+                due_date=date(2030, 1, n) if borrowed else None,
+            )
+        )
+    db.commit()
+    db.close()
+    yield factory
+    engine.dispose()
@@ -1,51 +1,242 @@
+import argparse
+import os
+import re
 import sys
 from PySide6 import QtWidgets, QtCore
 
-from digital_library_api.database import SessionLocal, create_db_tables
+from digital_library_api.database import SessionLocal
+from . import book_operations
 from .ui_setup import setup_main_window_ui
 from .dialogs import prompt_edit_book_details, prompt_borrower_name
-from .book_operations import (get_all_books, get_book_by_id, add_new_book,
-                              update_existing_book, delete_existing_book,
-                              borrow_selected_book, return_selected_book)
+from .book_model import BookRow, BookTableModel, SearchResultModel
+from .book_operations import get_book_row, search_book_rows
+from .workers import TaskRunner
 
-# Ensure database tables are created when the app starts
-create_db_tables()
+SEARCH_DELAY_MS = 250  # Typing pause before a search runs
+SYNC_INTERVAL_MS = 15000  # Remote mode: how often other desks' changes are fetched
+
+
+def as_row(outcome):
+    """An operation's (book, error) with the book as a BookRow, which may
+    leave the worker thread (the ORM object belongs to its session)."""
+    book, error = outcome
+    return (BookRow.from_book(book) if book is not None else None), error
 
 
 class LibraryApp(QtWidgets.QMainWindow):
-    def __init__(self):
+    def __init__(self, remote=None):
+        """`remote` is a remote.RemoteLibrary to work through the JSON API
+        and a local copy of the catalog instead of the database file."""
         super().__init__()
-        self.db_session = SessionLocal()
+        self.remote = remote
+        # Both have the same write operations; reads are book_operations
+        # queries, on the local copy in remote mode
+        self.ops = remote if remote is not None else book_operations
+        session_factory = remote.session_factory if remote is not None else SessionLocal
+        # Loads run on a thread pool with their own sessions; see workers.py
+        self.tasks = TaskRunner(self, session_factory)
+        # So do writes, which may wait on the server in remote mode; one at a
+        # time, with the action buttons off meanwhile
+        self.write_tasks = TaskRunner(self, session_factory)
+        if remote is not None:
+            # Syncs get a runner of their own, so they don't show as loading
+            self.sync_tasks = TaskRunner(self, session_factory)
+            self.sync_timer = QtCore.QTimer(self)
+            self.sync_timer.setInterval(SYNC_INTERVAL_MS)
 
         # Setup UI using the dedicated function
         setup_main_window_ui(self)
+        self.book_model = BookTableModel(self.tasks, parent=self)
+        self.search_model = SearchResultModel(self)
+        # Restarted by each keystroke, so only a pause in typing runs a search
+        self.search_timer = QtCore.QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
 
         # Connect signals to slots
         self.connect_signals()
 
         self.load_books()
         self.update_button_states()  # Initial state
+        if remote is not None:
+            self.sync_timer.start()
 
     def connect_signals(self):
+        self.tasks.busy.connect(self.set_loading)
+        self.write_tasks.busy.connect(self.set_saving)
+        self.book_model.loaded.connect(self.show_book_count)
+        self.book_model.failed.connect(self.show_load_error)
         self.add_button.clicked.connect(self.add_book)
         self.edit_button.clicked.connect(self.edit_book)
         self.delete_button.clicked.connect(self.delete_book)
         self.borrow_button.clicked.connect(self.borrow_book)
         self.return_button.clicked.connect(self.return_book)
         self.refresh_button.clicked.connect(self.load_books)
-        self.book_list_widget.itemDoubleClicked.connect(
+        self.book_table_view.doubleClicked.connect(
             self.edit_book_dialog
         )  # Edit on double click
-        self.book_list_widget.currentItemChanged.connect(self.update_button_states)
+        self.search_input.textChanged.connect(self.search_text_changed)
+        self.search_timer.timeout.connect(self.run_search)
+        if self.remote is not None:
+            self.sync_timer.timeout.connect(self.sync_catalog)
+        self.show_model(self.book_model)
+
+    def show_model(self, model):
+        """Shows the catalog or the search results in the table."""
+        if self.book_table_view.model() is model:
+            return
+        old_selection = self.book_table_view.selectionModel()
+        self.book_table_view.setModel(model)
+        if old_selection is not None:
+            old_selection.deleteLater()  # setModel() leaves it to us
+        self.book_table_view.selectionModel().currentRowChanged.connect(self.update_button_states)
+        self.update_button_states()
 
     def load_books(self):
-        self.book_list_widget.clear()
-        books = get_all_books(self.db_session)
-        for book in books:
-            item = QtWidgets.QListWidgetItem(str(book))
-            item.setData(QtCore.Qt.UserRole, book.id)  # Store book ID with the item
-            self.book_list_widget.addItem(item)
+        """Reloads the table from the first page, in the background.
+
+        In remote mode the local copy is brought up to date first, deleted
+        books included.
+        """
+        if self.remote is not None:
+            self.sync_catalog(prune=True, reload=True)
+            return
+        self.show_books()
+
+    def show_books(self):
+        self.book_model.reload()
+        if self.search_input.text().strip():
+            self.run_search()
+
+    def sync_catalog(self, prune=False, reload=False):
+        """Remote mode: copies other desks' changes in the background and patches their rows."""
+
+        def apply(result):
+            if result is None:
+                return
+            if reload or result.initial:
+                self.show_books()
+                return
+            for values in result.changed:
+                self.book_model.upsert(BookRow(*values))
+                self.search_model.upsert(BookRow(*values))
+            for book_id in result.removed:
+                self.book_model.remove(book_id)
+                self.search_model.remove(book_id)
+            self.update_button_states()
+
+        def failed(message):
+            self.statusBar().showMessage(f"Sync failed: {message}")
+            if reload:
+                self.show_books()  # What the local copy has
+
+        if reload:
+            self.statusBar().showMessage("Syncing books...")
+        elif self.sync_tasks.pending("sync"):
+            return  # Still busy with the last one (e.g. the first copy); don't restart it
+        self.sync_tasks.submit(
+            "sync", lambda db, cancelled: self.remote.sync(db, cancelled, prune=prune), apply, failed
+        )
+
+    def search_text_changed(self, text):
+        self.tasks.cancel("search")  # Whatever it finds is already out of date
+        if text.strip():
+            self.search_timer.start()
+        else:
+            self.search_timer.stop()
+            self.show_model(self.book_model)
+
+    def run_search(self):
+        """Streams the matches for the search text into the table, in the background."""
+        text = self.search_input.text().strip()
+        if not text:
+            return
+        self.search_model.clear()
+        self.show_model(self.search_model)
+
+        def add_matches(values):
+            self.search_model.append_rows([BookRow(*row) for row in values])
+
+        def done(_):
+            self.statusBar().showMessage(f"{self.search_model.rowCount()} matches for '{text}'")
+            self.update_button_states()
+
+        self.tasks.submit(
+            "search",
+            lambda db, cancelled: search_book_rows(db, text),
+            done,
+            lambda message: self.statusBar().showMessage(f"Search failed: {message}"),
+            add_matches,
+        )
+
+    def current_model(self):
+        return self.book_table_view.model()
+
+    def current_book_row(self):
+        """The selected book's BookRow, or None."""
+        index = self.book_table_view.currentIndex()
+        return self.current_model().book_row(index.row()) if index.isValid() else None
+
+    def show_book_count(self, count):
+        if self.current_model() is not self.book_model:
+            return  # The search's own count is showing
+        more = "+" if self.book_model.canFetchMore() else ""
+        self.statusBar().showMessage(f"{count}{more} books")
+        self.update_button_states()
+
+    def show_load_error(self, message):
+        self.statusBar().showMessage("Loading books failed")
+        QtWidgets.QMessageBox.critical(self, "Error", f"Could not load books: {message}")
+
+    def set_loading(self, loading):
+        if loading:
+            self.statusBar().showMessage("Loading books...")
+            self.book_table_view.setCursor(QtCore.Qt.BusyCursor)
+        else:
+            self.book_table_view.unsetCursor()
+
+    def set_saving(self, saving):
+        if saving:
+            self.statusBar().showMessage("Saving...")
+        self.update_button_states()
+
+    def submit_write(self, write, on_done):
+        """Runs `write(session)`, an operation returning (result, error), in
+        the background; `on_done(result, error)` gets its outcome."""
+        if self.saving():
+            return  # One at a time: resubmitting would drop the first outcome
+
+        def failed(message):
+            QtWidgets.QMessageBox.critical(self, "Error", f"Could not save: {message}")
+
+        self.write_tasks.submit("write", lambda db, cancelled: write(db), lambda outcome: on_done(*outcome), failed)
+
+    def saving(self):
+        return self.write_tasks.pending("write")
+
+    def show_book(self, book_row):
+        """Patches the row of a book the window just changed, and selects it."""
+        self.search_model.upsert(book_row)
+        self.book_model.upsert(book_row)
+        model = self.current_model()
+        row = model.row_of(book_row.id)
+        if row >= 0:
+            self.book_table_view.setCurrentIndex(model.index(row, 0))
         self.update_button_states()
+
+    def refresh_book(self, book_id):
+        """Re-reads one book in the background, after an action found its row stale."""
+
+        def apply(values):
+            for model in (self.book_model, self.search_model):
+                if values is None:
+                    model.remove(book_id)
+                else:
+                    model.upsert(BookRow(*values))
+            self.update_button_states()
+
+        self.tasks.submit(f"book-{book_id}", lambda db, cancelled: get_book_row(db, book_id), apply)
+
     def add_book(self):
         title = self.title_input.text().strip()
         author = self.author_input.text().strip()
@@ -57,35 +248,33 @@ class LibraryApp(QtWidgets.QMainWindow):
             )
             return
 
-        book, error = add_new_book(self.db_session, title, author, isbn)
-        if error:
-            QtWidgets.QMessageBox.warning(self, "Input Error", error)
-        else:
-            self.load_books()
-            self.clear_input_fields()
-            QtWidgets.QMessageBox.information(self, "Success", "Book added successfully.")
+        def done(book, error):
+            if error:
+                QtWidgets.QMessageBox.warning(self, "Input Error", error)
+            else:
+                self.show_book(book)
+                self.clear_input_fields()
+                QtWidgets.QMessageBox.information(self, "Success", "Book added successfully.")
+
+        self.submit_write(lambda db: as_row(self.ops.add_new_book(db, title, author, isbn)), done)
 
-    def edit_book_dialog(self, item=None):
-        if not item:  # Called from button click
-            current_item = self.book_list_widget.currentItem()
+    def edit_book_dialog(self, index=None):
+        if self.saving():
+            return  # Double click while the last change is still being saved
+        if index is None:  # Called from button click
+            current_row = self.current_book_row()
         else:  # Called from double click
-            current_item = item
+            current_row = self.current_model().book_row(index.row())
 
-        if not current_item:
+        if not current_row:
             QtWidgets.QMessageBox.warning(
                 self, "Selection Error", "Please select a book to edit."
             )
             return
 
-        book_id = current_item.data(QtCore.Qt.UserRole)
-        book_to_edit = get_book_by_id(self.db_session, book_id)
-
-        if not book_to_edit:
-            QtWidgets.QMessageBox.critical(self, "Error", "Book not found in database.")
-            self.load_books()  # Refresh list in case of inconsistency
-            return
-
-        new_details = prompt_edit_book_details(self, book_to_edit.title, book_to_edit.author, book_to_edit.isbn)
+        book_id = current_row.id
+        # Prefilled from the row; update_existing_book checks the book still exists
+        new_details = prompt_edit_book_details(self, current_row.title, current_row.author, current_row.isbn)
         if not new_details:
             return # User cancelled
 
@@ -97,20 +286,24 @@ class LibraryApp(QtWidgets.QMainWindow):
             )
             return
 
-        updated_book, error = update_existing_book(self.db_session, book_id, new_title, new_author, new_isbn)
+        def done(updated_book, error):
+            if error:
+                QtWidgets.QMessageBox.warning(self, "Update Error", error)
+                self.refresh_book(book_id)  # In case the row was out of date
+            else:
+                self.show_book(updated_book)
+                QtWidgets.QMessageBox.information(self, "Success", "Book updated successfully.")
 
-        if error:
-            QtWidgets.QMessageBox.warning(self, "Update Error", error)
-        else:
-            self.load_books()
-            QtWidgets.QMessageBox.information(self, "Success", "Book updated successfully.")
+        self.submit_write(
+            lambda db: as_row(self.ops.update_existing_book(db, book_id, new_title, new_author, new_isbn)), done
+        )
 
     def edit_book(self):  # Wrapper for button click
         self.edit_book_dialog()
 
     def delete_book(self):
-        current_item = self.book_list_widget.currentItem()
-        if not current_item:
+        current_row = self.current_book_row()
+        if not current_row:
             QtWidgets.QMessageBox.warning(
                 self, "Selection Error", "Please select a book to delete."
             )
@@ -119,20 +312,25 @@ class LibraryApp(QtWidgets.QMainWindow):
         reply = QtWidgets.QMessageBox.question(
             self,
             "Confirm Delete",
-            f"Are you sure you want to delete '{current_item.text()}'?",
+            f"Are you sure you want to delete '{current_row.title}'?",
             QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
             QtWidgets.QMessageBox.No,
         )
 
         if reply == QtWidgets.QMessageBox.Yes:
-            book_id = current_item.data(QtCore.Qt.UserRole)
-            success, error = delete_existing_book(self.db_session, book_id)
-            if error:
-                QtWidgets.QMessageBox.critical(self, "Error", error)
-                self.load_books() # Refresh list
-            else:
-                self.load_books()
-                QtWidgets.QMessageBox.information(self, "Success", "Book deleted successfully.")
+            book_id = current_row.id
+
+            def done(success, error):
+                if error:
+                    QtWidgets.QMessageBox.critical(self, "Error", error)
+                    self.refresh_book(book_id)
+                else:
+                    self.book_model.remove(book_id)
+                    self.search_model.remove(book_id)
+                    self.update_button_states()
+                    QtWidgets.QMessageBox.information(self, "Success", "Book deleted successfully.")
+
+            self.submit_write(lambda db: self.ops.delete_existing_book(db, book_id), done)
 
     def clear_input_fields(self):
         self.title_input.clear()
@@ -140,92 +338,129 @@ class LibraryApp(QtWidgets.QMainWindow):
         self.isbn_input.clear()
 
     def borrow_book(self):
-        current_item = self.book_list_widget.currentItem()
-        if not current_item:
+        current_row = self.current_book_row()
+        if not current_row:
             QtWidgets.QMessageBox.warning(
                 self, "Selection Error", "Please select a book to borrow."
             )
             return
 
-        book_id = current_item.data(QtCore.Qt.UserRole)
+        book_id = current_row.id
         # Check if book is already borrowed before prompting for name
-        book = get_book_by_id(self.db_session, book_id)
-        if not book:
-             QtWidgets.QMessageBox.critical(self, "Error", "Book not found in database.")
-             self.load_books()
-             return
-        if book.is_borrowed:
-            QtWidgets.QMessageBox.information(self, "Book Unavailable", f"'{book.title}' is already borrowed by {book.borrower_name}.")
+        if current_row.is_borrowed:
+            QtWidgets.QMessageBox.information(self, "Book Unavailable", f"'{current_row.title}' is {current_row.status.lower()}.")
             return
 
         borrower_name = prompt_borrower_name(self)
         if borrower_name:
-            borrowed_book, error = borrow_selected_book(self.db_session, book_id, borrower_name)
-            if error:
-                QtWidgets.QMessageBox.warning(self, "Borrow Error", error)
-            else:
-                self.load_books()
-                QtWidgets.QMessageBox.information(self, "Success", f"Book '{borrowed_book.title}' borrowed by {borrower_name}.")
+            def done(borrowed_book, error):
+                if error:
+                    QtWidgets.QMessageBox.warning(self, "Borrow Error", error)
+                    self.refresh_book(book_id)
+                else:
+                    self.show_book(borrowed_book)
+                    QtWidgets.QMessageBox.information(self, "Success", f"Book '{borrowed_book.title}' borrowed by {borrower_name}.")
+
+            self.submit_write(lambda db: as_row(self.ops.borrow_selected_book(db, book_id, borrower_name)), done)
         elif borrower_name is not None: # User pressed OK but entered empty name
             QtWidgets.QMessageBox.warning(
                 self, "Input Error", "Borrower's name cannot be empty."
             )
 
     def return_book(self):
-        current_item = self.book_list_widget.currentItem()
-        if not current_item:
+        current_row = self.current_book_row()
+        if not current_row:
             QtWidgets.QMessageBox.warning(
                 self, "Selection Error", "Please select a book to return."
             )
             return
 
-        book_id = current_item.data(QtCore.Qt.UserRole)
-        book_to_return = get_book_by_id(self.db_session, book_id)
-        if not book_to_return:
-            QtWidgets.QMessageBox.critical(self, "Error", "Book not found in database.")
-            self.load_books()
-            return
-        if not book_to_return.is_borrowed:
-            QtWidgets.QMessageBox.information(self, "Book Not Borrowed", f"'{book_to_return.title}' is not currently borrowed.")
+        book_id = current_row.id
+        if not current_row.is_borrowed:
+            QtWidgets.QMessageBox.information(self, "Book Not Borrowed", f"'{current_row.title}' is not currently borrowed.")
             return
 
         reply = QtWidgets.QMessageBox.question(
-            self, "Confirm Return", f"Return '{book_to_return.title}'?",
+            self, "Confirm Return", f"Return '{current_row.title}'?",
             QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
             QtWidgets.QMessageBox.No)
         if reply == QtWidgets.QMessageBox.Yes:
-            returned_book, error = return_selected_book(self.db_session, book_id)
-            if error: QtWidgets.QMessageBox.warning(self, "Return Error", error)
-            else: self.load_books(); QtWidgets.QMessageBox.information(self, "Success", f"Book '{returned_book.title}' returned.")
+            def done(returned_book, error):
+                if error: QtWidgets.QMessageBox.warning(self, "Return Error", error); self.refresh_book(book_id)
+                else: self.show_book(returned_book); QtWidgets.QMessageBox.information(self, "Success", f"Book '{returned_book.title}' returned.")
+
+            self.submit_write(lambda db: as_row(self.ops.return_selected_book(db, book_id)), done)
 
     def update_button_states(self):
-        current_item = self.book_list_widget.currentItem()
-        book_selected = current_item is not None
+        # From the row's cached state: selecting a book never queries the database
+        current_row = self.current_book_row()
+        book_selected = current_row is not None and not self.saving()
 
+        self.add_button.setEnabled(not self.saving())
         self.edit_button.setEnabled(book_selected)
         self.delete_button.setEnabled(book_selected)
-
-        if book_selected:
-            book_id = current_item.data(QtCore.Qt.UserRole)
-            book = get_book_by_id(self.db_session, book_id)
-            if book:
-                self.borrow_button.setEnabled(not book.is_borrowed)
-                self.return_button.setEnabled(book.is_borrowed)
-                return
-
-        self.borrow_button.setEnabled(False)
-        self.return_button.setEnabled(False)
+        self.borrow_button.setEnabled(book_selected and not current_row.is_borrowed)
+        self.return_button.setEnabled(book_selected and current_row.is_borrowed)
 
     def closeEvent(self, event):
-        self.db_session.close()
+        self.search_timer.stop()
+        self.tasks.cancel_all()
+        if self.remote is not None:
+            self.sync_timer.stop()
+            self.sync_tasks.cancel_all()
+        # A write that has started is left to finish; main_gui waits for it
         super().closeEvent(event)
 
 
+def connect_remote(args):
+    """The RemoteLibrary for --server, logged in; None if the user gave up."""
+    from .remote import LibraryClient, RemoteError, RemoteLibrary
+
+    password = os.environ.get("DIGITAL_LIBRARY_PASSWORD")
+    if password is None:
+        password, ok = QtWidgets.QInputDialog.getText(
+            None, "Log in", f"Password for {args.user} on {args.server}:", QtWidgets.QLineEdit.Password
+        )
+        if not ok:
+            return None
+    client = LibraryClient(args.server, args.user, password, branch=args.branch)
+    try:
+        client.login()
+    except RemoteError as e:
+        client.close()
+        QtWidgets.QMessageBox.critical(None, "Error", f"Could not log in: {e}")
+        return None
+    catalog = args.catalog
+    if catalog is None:
+        cache_dir = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.CacheLocation)
+        os.makedirs(cache_dir, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", f"{args.server}_{args.branch or ''}").strip("_")
+        catalog = os.path.join(cache_dir, f"catalog_{name}.sqlite3")
+    return RemoteLibrary(client, catalog)
+
+
 def main_gui():
-    app = QtWidgets.QApplication(sys.argv)
-    window = LibraryApp()
+    parser = argparse.ArgumentParser(description="Digital Library desk")
+    parser.add_argument("--server", default=os.environ.get("DIGITAL_LIBRARY_SERVER"),
+                        help="JSON API URL; work through it instead of the database file")
+    parser.add_argument("--user", default=os.environ.get("DIGITAL_LIBRARY_USER"), help="API user (remote mode)")
+    parser.add_argument("--branch", default=None, help="branch to log in to (remote mode)")
+    parser.add_argument("--catalog", default=None, help="local catalog copy (remote mode; default: in the user cache)")
+    args, qt_args = parser.parse_known_args()
+    if args.server and not args.user:
+        parser.error("--server needs --user")
+
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
+    remote = connect_remote(args) if args.server else None
+    if args.server and remote is None:
+        sys.exit(1)
+    window = LibraryApp(remote)
     window.show()
-    sys.exit(app.exec())
+    status = app.exec()
+    QtCore.QThreadPool.globalInstance().waitForDone(30000)  # Lets a started write reach the server
+    if remote is not None:
+        remote.close()
+    sys.exit(status)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,369 @@
+"""Remote mode: the desk GUI talks to the JSON API instead of the database file.
+
+Every desk opening the shared SQLite file contends for its lock, and on a
+network share that surfaces as "database is locked". In remote mode a desk
+keeps its own copy of the catalog in a local SQLite file (LocalCatalog) and
+RemoteLibrary keeps it current: changes are fetched with
+GET /books/?updated_since= and deletions with GET /books/deletions?since=,
+from the newest change already copied, so a sync moves only what other
+desks changed. Every read the window makes
+(pages, search, single rows) runs the usual book_operations queries on
+that copy, and writes go through the API over one pooled keep-alive
+connection, their responses being copied in straight away:
+
+    remote = RemoteLibrary(LibraryClient("http://server:9000", "desk1", password), "catalog.sqlite3")
+    book, error = remote.add_new_book(db, "Dune", "Frank Herbert", "9780441013593")
+
+RemoteLibrary has the same write operations as book_operations, with the
+same (result, error message) returns, so the window uses either.
+"""
+
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import httpx
+from sqlalchemy import delete, or_, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from digital_library_api.branches import BRANCH_HEADER
+from digital_library_api.database import Book as DBBook, User as DBUser, create_db_tables, make_engine
+
+logger = logging.getLogger(__name__)
+
+SYNC_PAGE_SIZE = 2000  # Books per request while syncing
+# Changes are fetched from a little before the newest one copied: a write
+# whose transaction commits after a later-stamped one would be missed otherwise.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Copied from BookInDB responses; borrower names go to the local users table
+_BOOK_COLUMNS = ("id", "title", "author", "isbn", "rfid_tag", "location", "is_borrowed", "due_date", "borrower_id")
+
+
+class RemoteError(Exception):
+    """The API refused a request or could not be reached; str(e) says why."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code  # None when the server was not reached
+
+
+class LibraryClient:
+    """The JSON API over a pool of keep-alive connections, logged in as one user.
+
+    Safe to share between threads. The bearer token is fetched on first use
+    and again when the server rejects it (tokens expire).
+    """
+
+    def __init__(self, base_url, username, password, branch=None, client: Optional[httpx.Client] = None, timeout=10.0):
+        if client is None:
+            client = httpx.Client(
+                base_url=base_url,
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=8, max_keepalive_connections=8, keepalive_expiry=60),
+            )
+        self.http = client
+        if branch is not None:
+            self.http.headers[BRANCH_HEADER] = branch
+        self.username = username
+        self._password = password
+        self._token = None
+        self._login_lock = threading.Lock()
+
+    def close(self):
+        self.http.close()
+
+    def login(self):
+        """Fetches a new token; raises RemoteError for bad credentials."""
+        with self._login_lock:
+            response = self._send("POST", "/token", data={"username": self.username, "password": self._password})
+            self._token = response.json()["access_token"]
+
+    def request(self, method, url, **kwargs) -> Any:
+        """Sends an authenticated request; returns the decoded JSON body (None if empty)."""
+        if self._token is None:
+            self.login()
+        token = self._token
+        try:
+            response = self._send(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        except RemoteError as e:
+            if e.status_code != 401:
+                raise
+            if self._token == token:  # Not already renewed by another thread
+                self.login()
+            response = self._send(method, url, headers={"Authorization": f"Bearer {self._token}"}, **kwargs)
+        return response.json() if response.content else None
+
+    def _send(self, method, url, **kwargs) -> httpx.Response:
+        try:
+            response = self.http.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            raise RemoteError(f"Library server unavailable: {e}") from e
+        if response.is_error:
+            try:
+                detail = response.json()["detail"]
+            except (ValueError, KeyError, TypeError):
+                detail = response.text or response.reason_phrase
+            raise RemoteError(detail if isinstance(detail, str) else str(detail), response.status_code)
+        return response
+
+    def books(self, after_id=0, limit=SYNC_PAGE_SIZE, updated_since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        params = {"after_id": after_id, "limit": limit}
+        if updated_since is not None:
+            params["updated_since"] = updated_since.isoformat()
+        return self.request("GET", "/books/", params=params)
+
+    def book_deletions(self, since: datetime) -> List[Dict[str, Any]]:
+        return self.request("GET", "/books/deletions", params={"since": since.isoformat()})
+
+    def book_ids(self) -> List[int]:
+        return [book["id"] for book in self.request("GET", "/books/", params={"fields": "id"})]
+
+    def book(self, book_id) -> Optional[Dict[str, Any]]:
+        try:
+            return self.request("GET", f"/books/{book_id}")
+        except RemoteError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    def create_book(self, title, author, isbn) -> Dict[str, Any]:
+        return self.request("POST", "/books/", json={"title": title, "author": author, "isbn": isbn})
+
+    def update_book(self, book_id, **fields) -> Dict[str, Any]:
+        return self.request("PUT", f"/books/{book_id}", json=fields)
+
+    def delete_book(self, book_id):
+        self.request("DELETE", f"/books/{book_id}")
+
+    def borrow_book(self, book_id, borrower_username=None) -> Dict[str, Any]:
+        body = {} if borrower_username is None else {"borrower_username": borrower_username}
+        return self.request("POST", f"/books/{book_id}/borrow", json=body)
+
+    def return_book(self, book_id) -> Dict[str, Any]:
+        return self.request("POST", f"/books/{book_id}/return")
+
+
+class LocalCatalog:
+    """A desk's own SQLite copy of the catalog, in the server's schema.
+
+    Having the same tables and indexes means book_operations' queries run
+    on it unchanged. Only borrower names are copied into its users table.
+    The newest change copied by a complete sync is kept in a table of its
+    own, which the server's schema does not have.
+    """
+
+    def __init__(self, path):
+        # WAL lets the window read while a sync writes
+        self.engine = make_engine(f"sqlite:///{path}", pragmas={"journal_mode": "WAL", "synchronous": "NORMAL"})
+        create_db_tables(self.engine)
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE IF NOT EXISTS sync_state (id INTEGER PRIMARY KEY, synced_until TEXT)"))
+        self.session_factory = sessionmaker(bind=self.engine, autocommit=False, autoflush=False)
+
+    def synced_until(self, db: Session) -> Optional[datetime]:
+        """updated_at of the newest change copied, or None before the first complete sync."""
+        value = db.scalar(text("SELECT synced_until FROM sync_state WHERE id = 1"))
+        return datetime.fromisoformat(value) if value else None
+
+    def set_synced_until(self, db: Session, value: datetime) -> None:
+        db.execute(
+            text("INSERT OR REPLACE INTO sync_state (id, synced_until) VALUES (1, :value)"),
+            {"value": value.isoformat()},
+        )
+
+    def store(self, db: Session, books: List[Dict[str, Any]]) -> List[tuple]:
+        """Copies books from API responses; returns the rows that changed.
+
+        Rows are plain tuples as book_operations returns them. A book whose
+        updated_at matches the copy is skipped. Does not commit.
+        """
+        if not books:
+            return []
+        known = dict(db.execute(select(DBBook.id, DBBook.updated_at).where(DBBook.id.in_([book["id"] for book in books]))).all())
+        values, users, rows = [], {}, []
+        for book in books:
+            updated_at = datetime.fromisoformat(book["updated_at"]) if book.get("updated_at") else None
+            if updated_at is not None and known.get(book["id"]) == updated_at:
+                continue
+            due_date = date.fromisoformat(book["due_date"]) if book.get("due_date") else None
+            values.append({**{name: book.get(name) for name in _BOOK_COLUMNS}, "due_date": due_date, "updated_at": updated_at})
+            if book.get("borrower_id") is not None and book.get("borrower_username"):
+                users[book["borrower_id"]] = book["borrower_username"]
+            rows.append((book["id"], book["title"], book["author"], book["isbn"], book["is_borrowed"], due_date, book.get("borrower_username")))
+        if not values:
+            return []
+        ids = [value["id"] for value in values]
+        # A copy still holding an ISBN or tag another book has since taken is
+        # stale; drop it, and it is copied again if it changed in this sync
+        isbns = [value["isbn"] for value in values]
+        tags = [value["rfid_tag"] for value in values if value["rfid_tag"]]
+        db.execute(delete(DBBook).where(or_(DBBook.isbn.in_(isbns), DBBook.rfid_tag.in_(tags)), DBBook.id.not_in(ids)))
+        if users:
+            db.execute(delete(DBUser).where(DBUser.username.in_(list(users.values())), DBUser.id.not_in(list(users))))
+            statement = insert(DBUser).values([{"id": id, "username": name, "hashed_password": ""} for id, name in users.items()])
+            db.execute(statement.on_conflict_do_update(index_elements=[DBUser.id], set_={"username": statement.excluded.username}))
+        statement = insert(DBBook).values(values)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[DBBook.id],
+                set_={name: statement.excluded[name] for name in values[0] if name != "id"},
+            )
+        )
+        return rows
+
+    def forget_deleted(self, db: Session, deletions: List[Dict[str, Any]]) -> List[int]:
+        """Drops copies of books deleted since they were copied; returns their ids.
+
+        A copy changed after the deletion is of a new book reusing the id,
+        and is kept. Does not commit.
+        """
+        removed = []
+        for deletion in deletions:
+            deleted_at = datetime.fromisoformat(deletion["deleted_at"])
+            statement = (
+                delete(DBBook)
+                .where(DBBook.id == deletion["id"], or_(DBBook.updated_at.is_(None), DBBook.updated_at <= deleted_at))
+                .returning(DBBook.id)
+            )
+            removed.extend(db.scalars(statement))
+        return removed
+
+    def forget(self, db: Session, book_ids) -> None:
+        """Drops copies of books the server no longer has. Does not commit."""
+        book_ids = list(book_ids)
+        for start in range(0, len(book_ids), SYNC_PAGE_SIZE):
+            db.execute(delete(DBBook).where(DBBook.id.in_(book_ids[start : start + SYNC_PAGE_SIZE])))
+
+
+class SyncResult(NamedTuple):
+    changed: List[tuple]  # Rows as book_operations returns them
+    removed: List[int]  # Ids of deleted books
+    initial: bool  # The first copy of the catalog: reload rather than patch
+
+
+class RemoteLibrary:
+    """A LocalCatalog kept in step with the server, plus the window's writes over the API."""
+
+    def __init__(self, client: LibraryClient, catalog_path):
+        self.client = client
+        self.catalog = LocalCatalog(catalog_path)
+        self.session_factory = self.catalog.session_factory
+        self._sync_lock = threading.Lock()  # One sync at a time, whichever thread asks
+
+    def close(self):
+        self.client.close()
+        self.catalog.engine.dispose()
+
+    def sync(self, db: Session, cancelled: Optional[threading.Event] = None, prune=False) -> Optional[SyncResult]:
+        """Copies the changes and deletions made since the last complete sync.
+
+        The first sync copies the whole catalog. Each page is committed as
+        it arrives, so the window is never locked out of the copy for long;
+        the sync only counts as complete, moving synced_until on, after the
+        last page. Deletions come from the server's record of deleted books
+        (GET /books/deletions), so another desk's deletion disappears here
+        with the next sync, at most one sync interval later. Books removed
+        without going through the ORM leave no record: `prune` also
+        compares every id with the server (one small request) and drops the
+        copies of books it no longer has. Returns None if cancelled.
+        """
+        with self._sync_lock:
+            synced_until = self.catalog.synced_until(db)
+            initial = synced_until is None
+            since = synced_until - SYNC_OVERLAP if synced_until is not None else None
+            # Taken before asking the server, so a book added meanwhile is not pruned
+            local_ids = list(db.scalars(select(DBBook.id))) if prune else []
+            changed, after_id, newest = [], 0, synced_until
+            while True:
+                page = self.client.books(after_id, SYNC_PAGE_SIZE, since)
+                rows = self.catalog.store(db, page)
+                db.commit()
+                if not initial:  # The window reloads after a first copy instead
+                    changed.extend(rows)
+                stamps = [datetime.fromisoformat(book["updated_at"]) for book in page if book.get("updated_at")]
+                if stamps:
+                    newest = max(stamps) if newest is None else max(newest, *stamps)
+                if len(page) < SYNC_PAGE_SIZE:
+                    break
+                if cancelled is not None and cancelled.is_set():
+                    return None
+                after_id = page[-1]["id"]
+            removed = []
+            if not initial:  # A first copy has only books that exist
+                deletions = self.client.book_deletions(since)
+                removed = self.catalog.forget_deleted(db, deletions)
+                stamps = [datetime.fromisoformat(deletion["deleted_at"]) for deletion in deletions]
+                if stamps:
+                    newest = max(newest, *stamps)
+            if prune:
+                server_ids = set(self.client.book_ids())
+                pruned = [book_id for book_id in local_ids if book_id not in server_ids and book_id not in removed]
+                self.catalog.forget(db, pruned)
+                removed.extend(pruned)
+            if removed:
+                gone = set(removed)
+                changed = [row for row in changed if row[0] not in gone]
+            if newest is not None:
+                self.catalog.set_synced_until(db, newest)
+            elif synced_until is None:
+                self.catalog.set_synced_until(db, datetime(1970, 1, 1))  # A complete copy, of books never stamped
+            db.commit()
+        logger.info("Synced %d changed and %d deleted books", len(changed), len(removed))
+        return SyncResult(changed, removed, initial)
+
+    def refresh(self, db: Session, book_id) -> None:
+        """Re-copies one book after the server refused a change to it (best effort; commits)."""
+        try:
+            book = self.client.book(book_id)
+        except RemoteError:
+            return
+        if book is None:
+            self.catalog.forget(db, [book_id])
+        else:
+            self.catalog.store(db, [book])
+        db.commit()
+
+    def _apply(self, db: Session, send, book_id=None):
+        """Sends a change; returns the local copy of the book the server returned, and an error."""
+        try:
+            book = send()
+        except RemoteError as e:
+            if book_id is not None:
+                self.refresh(db, book_id)
+            return None, str(e)
+        self.catalog.store(db, [book])
+        db.commit()
+        return db.get(DBBook, book["id"], populate_existing=True), None
+
+    # --- The write operations of book_operations ---
+
+    def add_new_book(self, db_session: Session, title: str, author: str, isbn: str):
+        if not title or not author or not isbn:
+            return None, "All fields must be filled."
+        return self._apply(db_session, lambda: self.client.create_book(title, author, isbn))
+
+    def update_existing_book(self, db_session: Session, book_id: int, title: str, author: str, isbn: str):
+        if not title or not author or not isbn:
+            return None, "All fields must be filled for editing."
+        return self._apply(
+            db_session, lambda: self.client.update_book(book_id, title=title, author=author, isbn=isbn), book_id
+        )
+
+    def delete_existing_book(self, db_session: Session, book_id: int):
+        try:
+            self.client.delete_book(book_id)
+        except RemoteError as e:
+            self.refresh(db_session, book_id)
+            return False, str(e)
+        self.catalog.forget(db_session, [book_id])
+        db_session.commit()
+        return True, None
+
+    def borrow_selected_book(self, db_session: Session, book_id: int, borrower_name: str):
+        return self._apply(db_session, lambda: self.client.borrow_book(book_id, borrower_name), book_id)
+
+    def return_selected_book(self, db_session: Session, book_id: int):
+        return self._apply(db_session, lambda: self.client.return_book(book_id), book_id)
@@ -0,0 +1,106 @@
+from PySide6 import QtCore
+from sqlalchemy import event
+
+from digital_library_api.database import Book as DBBook
+
+from .book_model import BookRow, BookTableModel, SearchResultModel
+from .book_operations import search_book_rows
+from .conftest import wait_for
+from .workers import TaskRunner
+
+
+def test_pages_fetched_on_demand(app, session_factory):
+    """Test that rows arrive a page at a time, one query per page including borrowers."""
+    statements = []
+    event.listen(session_factory.kw["bind"], "before_cursor_execute", lambda *args: statements.append(args[2]))
+    model = BookTableModel(TaskRunner(session_factory=session_factory), page_size=10)
+    model.reload()
+    wait_for(app, lambda: model.rowCount() == 10)
+    assert model.canFetchMore()
+
+    model.fetchMore()
+    assert not model.canFetchMore()  # Until the page in flight arrives
+    wait_for(app, lambda: model.rowCount() == 20)
+    model.fetchMore()
+    wait_for(app, lambda: model.rowCount() == 25)
+    assert not model.canFetchMore()
+    assert len(statements) == 3
+
+    assert model.headerData(3, QtCore.Qt.Horizontal) == "Status"
+    assert [model.data(model.index(4, column)) for column in range(5)] == [
+        "Book 5",
+        "Author",
+        "0000000000005",
+        "Borrowed by patron",
+        "2030-01-05",
+    ]
+    assert model.data(model.index(0, 3)) == "Available"
+    assert model.data(model.index(24, 0), QtCore.Qt.UserRole) == 25
+
+
+def test_reload_discards_page_in_flight(app, session_factory):
+    """Test that reloading while a page loads starts over without duplicate rows."""
+    model = BookTableModel(TaskRunner(session_factory=session_factory), page_size=10)
+    model.reload()
+    model.reload()
+    wait_for(app, lambda: model.rowCount() == 10)
+    model.fetchMore()
+    model.reload()
+    wait_for(app, lambda: model.rowCount() == 10 and model.canFetchMore())
+    app.processEvents()
+    assert [model.book_row(row).id for row in range(model.rowCount())] == list(range(1, 11))
+
+
+def test_rows_patched_in_place(app, session_factory):
+    """Test that upsert() and remove() change single rows and that paging skips patched ones."""
+    model = BookTableModel(TaskRunner(session_factory=session_factory), page_size=10)
+    model.reload()
+    wait_for(app, lambda: model.rowCount() == 10)
+    changed, inserted = [], []
+    model.dataChanged.connect(lambda first, last: changed.append((first.row(), last.row())))
+    model.rowsInserted.connect(lambda parent, first, last: inserted.append(first))
+
+    book = model.book_row(2)._replace(title="Renamed", is_borrowed=True, borrower_username="patron")
+    assert model.upsert(book) == 2
+    assert changed == [(2, 2)] and model.data(model.index(2, 0)) == "Renamed"
+
+    model.remove(3)
+    assert model.row_of(3) == -1 and model.row_of(4) == 2
+    assert model.upsert(book._replace(id=3)) == 2  # Back in id order
+    # Beyond the loaded pages: left for fetchMore(), which must not repeat it
+    assert model.upsert(book._replace(id=11, title="Page two")) == -1
+    assert model.upsert(book._replace(id=10, title="Last loaded")) == 9
+    model.fetchMore()
+    wait_for(app, lambda: model.rowCount() == 20)
+    ids = [model.book_row(row).id for row in range(model.rowCount())]
+    assert ids == sorted(set(ids)) and inserted == [2, 10]
+
+
+def test_search_streams_prefix_matches(app, session_factory):
+    """Test that a search matches title, author and ISBN prefixes, ignoring case, each book once."""
+    db = session_factory()
+    db.add(DBBook(id=26, title="Authority", author="Book 2 Fan", isbn="9780000000026"))
+    db.commit()
+    chunks = list(search_book_rows(db, "book 2", limit=3))
+    assert [[row[0] for row in chunk] for chunk in chunks] == [[2, 20, 21], [26], []]
+    assert [[row[0] for row in chunk] for chunk in search_book_rows(db, "AUTH")] == [[26], list(range(1, 26)), []]
+    assert [row[0] for row in next(search_book_rows(db, "Book 25"))] == [25]
+    assert [[row[0] for row in chunk] for chunk in search_book_rows(db, "978")] == [[], [], [26]]
+    db.close()
+
+    model = SearchResultModel()
+    runner = TaskRunner(session_factory=session_factory)
+    runner.submit(
+        "search",
+        lambda db, cancelled: search_book_rows(db, "book 1"),
+        lambda result: None,
+        on_progress=lambda rows: model.append_rows([BookRow(*row) for row in rows]),
+    )
+    wait_for(app, lambda: model.rowCount() == 11)
+    assert model.data(model.index(0, 0)) == "Book 1"
+
+    book = model.book_row(1)._replace(title="Renamed")
+    assert model.upsert(book) == 1 and model.data(model.index(1, 0)) == "Renamed"
+    assert model.upsert(book._replace(id=2)) == -1  # Not a match; not added
+    model.remove(book.id)
+    assert model.rowCount() == 10 and model.row_of(book.id) == -1
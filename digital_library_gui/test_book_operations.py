@@ -0,0 +1,18 @@
+from .book_model import BookRow
+from .book_operations import borrow_selected_book, get_book_row, return_selected_book
+
+
+def test_borrow_records_borrower(session_factory):
+    """Test that borrowing lends to a registered user and returning clears the borrower."""
+    db = session_factory()
+    assert borrow_selected_book(db, 1, "nobody") == (None, "Unknown borrower: nobody")
+    assert get_book_row(db, 1)[4] is False
+
+    book, error = borrow_selected_book(db, 1, "patron")
+    assert error is None and book.borrower_id == 1
+    assert BookRow.from_book(book).status == "Borrowed by patron"
+    assert borrow_selected_book(db, 1, "patron") == (None, "'Book 1' is already borrowed by patron.")
+
+    book, error = return_selected_book(db, 1)
+    assert error is None and book.borrower_id is None and book.due_date is None
+    db.close()
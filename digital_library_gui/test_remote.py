@@ -0,0 +1,105 @@
+import pytest
+from PySide6 import QtWidgets
+
+from digital_library_api.database import Book as DBBook
+from digital_library_api.conftest import client
+
+from .book_model import BookRow
+from .book_operations import get_book_page, get_book_row
+from .conftest import wait_for
+from .gui import LibraryApp
+from .remote import LibraryClient, RemoteLibrary
+
+
+@pytest.fixture
+def remote(db_session, tmp_path):
+    """A desk logged in as "desk", with "patron" registered to lend to."""
+    for username in ("desk", "patron"):
+        assert client.post("/users/", json={"username": username, "password": "pw"}).status_code == 201
+    # The TestClient is an httpx.Client, so requests go straight to the app
+    library = RemoteLibrary(LibraryClient("http://testserver", "desk", "pw", client=client), tmp_path / "catalog.sqlite3")
+    yield library
+    library.catalog.engine.dispose()
+
+
+def test_sync_copies_only_changes(remote, db_session):
+    """Test that syncs copy the catalog once, then only what other desks changed."""
+    api = remote.client  # Changes made through it directly stand in for another desk
+    ids = [api.create_book(f"Book {n}", "Author", f"130000000000{n}")["id"] for n in range(3)]
+    db = remote.session_factory()
+
+    result = remote.sync(db)
+    assert result.initial and result.changed == []  # The window reloads instead
+    assert [row[0] for row in get_book_page(db)] == ids
+    assert remote.sync(db) == ([], [], False)  # Overlapping re-reads are recognised
+
+    api.borrow_book(ids[1], "patron")
+    api.update_book(ids[2], title="Renamed")
+    changed = {row[0]: row for row in remote.sync(db).changed}
+    assert sorted(changed) == ids[1:]
+    assert changed[ids[1]][4:] == get_book_row(db, ids[1])[4:]
+    assert get_book_row(db, ids[1])[6] == "patron" and get_book_row(db, ids[2])[1] == "Renamed"
+
+    api.delete_book(ids[0])
+    assert remote.sync(db).removed == [ids[0]]  # From the server's record of deletions
+    assert get_book_row(db, ids[0]) is None
+    assert remote.sync(db).removed == []
+
+    # Removed behind the API's back: no record, so only a prune finds it
+    db_session.query(DBBook).filter(DBBook.id == ids[1]).delete()
+    db_session.commit()
+    assert remote.sync(db).removed == []
+    assert remote.sync(db, prune=True).removed == [ids[1]]
+    db.close()
+
+
+def test_write_operations(remote):
+    """Test the book_operations writes over the API, and that refusals refresh the copy."""
+    api = remote.client
+    db = remote.session_factory()
+    remote.sync(db)
+
+    book, error = remote.add_new_book(db, "Dune", "Frank Herbert", "9780441013593")
+    assert error is None and get_book_row(db, book.id)[1] == "Dune"
+    assert remote.add_new_book(db, "Dune", "Frank Herbert", "9780441013593") == (
+        None,
+        "Book with ISBN 9780441013593 already exists.",
+    )
+
+    borrowed, error = remote.borrow_selected_book(db, book.id, "patron")
+    assert error is None and BookRow.from_book(borrowed).status == "Borrowed by patron"
+    assert remote.borrow_selected_book(db, book.id, "patron") == (None, "Book is already borrowed by patron")
+
+    api.return_book(book.id)  # At another desk
+    assert remote.return_selected_book(db, book.id) == (None, "Book is not currently borrowed")
+    assert get_book_row(db, book.id)[4] is False
+
+    api._token = "expired"
+    updated, error = remote.update_existing_book(db, book.id, "Dune Messiah", "Frank Herbert", "9780441013593")
+    assert error is None and updated.title == "Dune Messiah"
+
+    api.delete_book(book.id)
+    assert remote.update_existing_book(db, book.id, "Dune", "Frank Herbert", "9780441013593") == (None, "Book not found")
+    assert get_book_row(db, book.id) is None
+    assert remote.delete_existing_book(db, book.id) == (False, "Book not found")
+    db.close()
+
+
+def test_desk_writes_in_background(app, remote, monkeypatch):
+    """Test that the desk sends a write off the GUI thread and applies its outcome when it lands."""
+    messages = []
+    monkeypatch.setattr(QtWidgets.QMessageBox, "information", lambda parent, title, text: messages.append(text))
+    window = LibraryApp(remote)
+    wait_for(app, lambda: not window.sync_tasks.pending("sync"))
+
+    window.title_input.setText("Dune")
+    window.author_input.setText("Frank Herbert")
+    window.isbn_input.setText("9780441013593")
+    window.add_book()
+    assert window.saving() and not window.add_button.isEnabled()  # Returned before the server answered
+    wait_for(app, lambda: not window.saving())
+
+    assert messages == ["Book added successfully."] and window.add_button.isEnabled()
+    row = window.book_model.book_row(window.book_model.row_of(remote.client.books()[0]["id"]))
+    assert row.title == "Dune" and window.title_input.text() == ""
+    window.close()
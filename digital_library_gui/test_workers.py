@@ -0,0 +1,89 @@
+import threading
+import time
+
+from PySide6 import QtCore
+
+from .conftest import wait_for
+from .workers import TaskRunner
+
+
+class FakeSession:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_newer_task_supersedes_older(app):
+    """Test that only the newest task's result is delivered, on the GUI thread."""
+    sessions = []
+
+    def factory():
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    pool = QtCore.QThreadPool()
+    pool.setMaxThreadCount(1)
+    runner = TaskRunner(session_factory=factory, pool=pool)
+    busy, results = [], []
+    runner.busy.connect(busy.append)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(db, cancelled):
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    runner.submit("books", slow, results.append)
+    assert started.wait(5)
+    runner.submit("books", lambda db, cancelled: "queued", results.append)  # Superseded before it starts
+    runner.submit("books", lambda db, cancelled: (threading.current_thread(), "newest"), results.append)
+    release.set()
+    wait_for(app, lambda: results and not runner._started)
+
+    assert len(results) == 1
+    worker_thread, value = results[0]
+    assert value == "newest" and worker_thread is not threading.main_thread()
+    assert busy == [True, False]
+    assert len(sessions) == 2 and all(session.closed for session in sessions)  # The queued one never ran
+
+
+def test_task_error_is_reported(app):
+    """Test that an exception in a task reaches on_error, not on_result."""
+    runner = TaskRunner(session_factory=FakeSession)
+    results, errors = [], []
+
+    def broken(db, cancelled):
+        raise RuntimeError("database is locked")
+
+    runner.submit("books", broken, results.append, errors.append)
+    wait_for(app, lambda: errors)
+    assert errors == ["database is locked"] and results == []
+
+
+def test_generator_task_streams_until_cancelled(app):
+    """Test that a generator task delivers each item and stops between items once cancelled."""
+    runner = TaskRunner(session_factory=FakeSession)
+    chunks, results = [], []
+    resume, stopped = threading.Event(), threading.Event()
+
+    def stream(db, cancelled):
+        try:
+            yield "first"
+            resume.wait(5)
+            yield "second"
+            yield "third"
+        finally:
+            stopped.set()
+
+    runner.submit("search", stream, results.append, on_progress=chunks.append)
+    wait_for(app, lambda: chunks)
+    runner.cancel("search")
+    resume.set()
+    assert stopped.wait(5)
+    wait_for(app, lambda: not runner._started)
+    assert chunks == ["first"] and results == []
+
+    runner.submit("search", lambda db, cancelled: (chunk for chunk in "ab"), results.append, on_progress=chunks.append)
+    wait_for(app, lambda: results)
+    assert chunks == ["first", "a", "b"] and results == [None]
@@ -51,6 +51,20 @@ def setup_main_window_ui(main_window):
     button_layout.addWidget(main_window.return_button)
     button_layout.addWidget(main_window.refresh_button)
 
-    # Book list
-    main_window.book_list_widget = QtWidgets.QListWidget()
-    main_window.layout.addWidget(main_window.book_list_widget)
\ No newline at end of file
+    # Search as you type; the window debounces it and queries in the background
+    main_window.search_input = QtWidgets.QLineEdit()
+    main_window.search_input.setPlaceholderText("Search title, author or ISBN")
+    main_window.search_input.setClearButtonEnabled(True)
+    main_window.layout.addWidget(main_window.search_input)
+
+    # Book table; the model is set by the window (see book_model.py)
+    main_window.book_table_view = QtWidgets.QTableView()
+    main_window.book_table_view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+    main_window.book_table_view.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+    main_window.book_table_view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+    main_window.book_table_view.verticalHeader().setVisible(False)
+    # Fixed row heights and header sizes keep Qt from measuring every row
+    main_window.book_table_view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+    main_window.book_table_view.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
+    main_window.book_table_view.horizontalHeader().setStretchLastSection(True)
+    main_window.layout.addWidget(main_window.book_table_view)
@@ -0,0 +1,149 @@
+import inspect
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+from PySide6 import QtCore
+
+from digital_library_api.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class TaskSignals(QtCore.QObject):
+    """Carries a task's outcome back to the GUI thread (queued across threads)."""
+
+    finished = QtCore.Signal(object, object)  # Task, result
+    progress = QtCore.Signal(object, object)  # Task, one item yielded by a generator task
+    failed = QtCore.Signal(object, str)  # Task, error message
+
+
+class DatabaseTask(QtCore.QRunnable):
+    """Runs `fn(session, cancelled)` on a pool thread with a session of its own.
+
+    SQLAlchemy sessions must not be shared between threads, so the task
+    opens one from `session_factory` and closes it when done; `fn` should
+    return plain data, not ORM objects tied to that session. `cancelled` is
+    a threading.Event that `fn` may check to stop early.
+
+    If `fn` is a generator, each item it yields is delivered as it comes
+    (streaming results into a view) and it is stopped between items once
+    cancelled; the result is then None.
+    """
+
+    def __init__(self, name, fn: Callable, on_result, on_error=None, on_progress=None, session_factory=SessionLocal):
+        super().__init__()
+        self.name = name
+        self.fn = fn
+        self.on_result = on_result
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.session_factory = session_factory
+        self.cancelled = threading.Event()
+        self.signals = TaskSignals()  # Created on the GUI thread, so its slots run there
+
+    def run(self):
+        # Always emits one of the signals, so the runner knows the task is over
+        if self.cancelled.is_set():
+            self.signals.finished.emit(self, None)
+            return
+        db = self.session_factory()
+        try:
+            result = self.fn(db, self.cancelled)
+            if inspect.isgenerator(result):
+                for item in result:
+                    if self.cancelled.is_set():
+                        result.close()
+                        break
+                    self.signals.progress.emit(self, item)
+                result = None
+        except Exception as e:
+            logger.exception("Background database task failed")
+            self.signals.failed.emit(self, str(e))
+            return
+        finally:
+            db.close()
+        self.signals.finished.emit(self, result)
+
+
+class TaskRunner(QtCore.QObject):
+    """Starts DatabaseTasks on a thread pool, one live task per name.
+
+    Submitting a task under a name cancels the previous one with that name:
+    it is taken off the queue if it has not started, and its result is
+    ignored if it has. So a burst of reloads costs at most one query
+    running and delivers only the newest result. `busy` is emitted with True
+    when the first task starts and False when none are left.
+    """
+
+    busy = QtCore.Signal(bool)
+
+    def __init__(self, parent=None, session_factory=SessionLocal, pool: Optional[QtCore.QThreadPool] = None):
+        super().__init__(parent)
+        self.session_factory = session_factory
+        self.pool = pool if pool is not None else QtCore.QThreadPool.globalInstance()
+        self._tasks: Dict[str, DatabaseTask] = {}  # The live task for each name
+        self._started = set()  # Every task the pool may still run; keeps it alive until then
+
+    def submit(self, name, fn, on_result, on_error=None, on_progress=None):
+        """Runs `fn(session, cancelled)` in the background; calls `on_result(result)` on the GUI thread.
+
+        `on_progress` receives each item a generator `fn` yields.
+        """
+        was_busy = bool(self._tasks)
+        self._cancel(name)
+        task = DatabaseTask(name, fn, on_result, on_error, on_progress, self.session_factory)
+        task.setAutoDelete(False)  # Owned here, through _started
+        # Bound methods of this QObject run on its (the GUI) thread
+        task.signals.finished.connect(self._finished)
+        task.signals.failed.connect(self._failed)
+        task.signals.progress.connect(self._progress)
+        self._tasks[name] = task
+        self._started.add(task)
+        self.pool.start(task)
+        if not was_busy:
+            self.busy.emit(True)
+        return task
+
+    def pending(self, name):
+        """True while the task last submitted under `name` has not delivered its outcome."""
+        return name in self._tasks
+
+    def cancel(self, name):
+        if self._cancel(name) and not self._tasks:
+            self.busy.emit(False)
+
+    def cancel_all(self):
+        for name in list(self._tasks):
+            self.cancel(name)
+
+    def _cancel(self, name):
+        task = self._tasks.pop(name, None)
+        if task is None:
+            return False
+        task.cancelled.set()
+        if self.pool.tryTake(task):  # It was still queued and will never run
+            self._started.discard(task)
+        return True
+
+    def _finished(self, task, result):
+        if self._end(task):
+            task.on_result(result)
+
+    def _progress(self, task, item):
+        if self._tasks.get(task.name) is task and task.on_progress is not None:
+            task.on_progress(item)
+
+    def _failed(self, task, message):
+        if self._end(task) and task.on_error is not None:
+            task.on_error(message)
+
+    def _end(self, task):
+        """Forgets a task that has run; True if its outcome is still wanted."""
+        self._started.discard(task)
+        if self._tasks.get(task.name) is not task:
+            return False  # Superseded; its result is stale
+        del self._tasks[task.name]
+        if not self._tasks:
+            self.busy.emit(False)
+        return True
@@ -0,0 +1,100 @@
+"""Drives RFIDReader through a VirtualReader and reports throughput and latency.
+
+Reads decoded per second, how many were lost, arrival latency (from the
+simulator writing a tag's first read to the reader's first arrival event)
+and the CPU the whole process used:
+
+    python -m digital_library_rfid.bench_reader --rate 5000 --tags 500 --churn 0.2 --duration 10
+"""
+
+import argparse
+import json
+import time
+
+from .protocol import PROTOCOLS
+from .reader import ARRIVED, RFIDReader
+from .simulator import VirtualReader
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+
+def run(args):
+    virtual = VirtualReader(
+        args.protocol,
+        tags=args.tags,
+        rate=args.rate,
+        duplicates=args.duplicates,
+        noise=args.noise,
+        partial=args.partial,
+        churn=args.churn,
+        seed=args.seed,
+    )
+    latencies = []
+    seen = set()
+
+    def on_event(event):
+        # Only first arrivals: a tag that departs and comes back was written long before
+        if event.kind == ARRIVED and event.epc not in seen:
+            seen.add(event.epc)
+            latencies.append(time.monotonic() - virtual.first_written[event.epc])
+
+    with virtual:
+        reader = RFIDReader(virtual.port, args.protocol, window=args.window, on_event=on_event)
+        with reader:
+            cpu_start, start = time.process_time(), time.monotonic()
+            time.sleep(args.duration)
+            virtual.pause()
+            written = virtual.reads_written
+            deadline = time.monotonic() + 5
+            while reader.reads < written and time.monotonic() < deadline:
+                time.sleep(0.01)
+            elapsed = time.monotonic() - start
+            cpu = time.process_time() - cpu_start
+
+    latencies.sort()
+    stats = reader.stats()
+    return {
+        "protocol": args.protocol,
+        "configured_reads_per_second": args.rate,
+        "reads_written": written,
+        "reads_decoded": stats["reads"],
+        "reads_lost": written - stats["reads"],
+        "decoded_per_second": round(stats["reads"] / elapsed),
+        "arrivals": stats["arrivals"],
+        "decoder_errors": stats["errors"],
+        "simulator_overflows": virtual.overflows,
+        # Simulator and reader together; the reader alone uses less
+        "process_cpu_percent": round(100 * cpu / elapsed, 1),
+        "arrival_latency_ms": {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in (
+                ("p50", percentile(latencies, 0.50)),
+                ("p90", percentile(latencies, 0.90)),
+                ("p99", percentile(latencies, 0.99)),
+                ("max", latencies[-1] if latencies else None),
+            )
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--protocol", choices=sorted(PROTOCOLS), default="r200")
+    parser.add_argument("--rate", type=float, default=2000.0, help="reads per second")
+    parser.add_argument("--tags", type=int, default=200, help="tags in the field")
+    parser.add_argument("--duplicates", type=int, default=1)
+    parser.add_argument("--noise", type=float, default=0.01)
+    parser.add_argument("--partial", type=float, default=0.2)
+    parser.add_argument("--churn", type=float, default=0.1, help="fraction of tags replaced per second")
+    parser.add_argument("--window", type=float, default=1.0)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
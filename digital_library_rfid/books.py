@@ -0,0 +1,49 @@
+"""Resolves tag reads to books in the library database.
+
+Books carry their tag's EPC in books.rfid_tag (see digital_library_api.tags).
+Lookups go through the shared tag_cache, so a gate reporting the same tags
+over and over queries the database once per tag rather than once per read.
+"""
+
+from typing import Optional
+
+from digital_library_api.tags import book_id_for_tag, normalize_epc
+
+
+class BookResolver:
+    """Maps EPCs to book ids; use one per thread (it holds a database session).
+
+    The session is opened on first use and kept; the read transaction is
+    ended after each lookup that reached the database, so it does not pin
+    an old snapshot while the reader runs.
+    """
+
+    def __init__(self, session_factory=None, branch: Optional[str] = None):
+        if session_factory is None:
+            from digital_library_api.database import SessionLocal as session_factory
+        self.session_factory = session_factory
+        self.branch = branch
+        self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def book_id(self, epc) -> Optional[int]:
+        canonical = normalize_epc(epc)
+        if canonical is None:
+            return None
+        if self._db is None:
+            self._db = self.session_factory()
+        try:
+            return book_id_for_tag(self._db, canonical, self.branch)
+        finally:
+            if self._db.in_transaction():
+                self._db.rollback()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,40 @@
+from typing import Dict, Iterable
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from digital_library_api.database import Book as DBBook, User as DBUser, create_db_tables, make_engine
+
+
+def epc(n):
+    """The EPC test book `n` is tagged with."""
+    return f"E2801160{n:016X}"
+
+
+@pytest.fixture
+def make_library(tmp_path):
+    """Builds a fresh database seeded with test books; returns its session factory.
+
+    `books` maps each book number to overrides of its defaults (title
+    "Book n", author "Author", ISBN n zero-padded, tagged epc(n)); `users`
+    are (id, username) pairs.
+    """
+    engines = []
+
+    def make(books: Dict[int, dict], users: Iterable[tuple] = ()):
+        engine = make_engine(f"sqlite:///{tmp_path / f'library{len(engines)}.sqlite3'}")
+        engines.append(engine)
+        create_db_tables(engine)
+        factory = sessionmaker(bind=engine)
+        db = factory()
+        db.add_all(DBUser(id=id, username=username, hashed_password="x") for id, username in users)
+        for n, overrides in books.items():
+            fields = dict(id=n, title=f"Book {n}", author="Author", isbn=f"{n:013d}", rfid_tag=epc(n))
+            db.add(DBBook(**{**fields, **overrides}))
+        db.commit()
+        db.close()
+        return factory
+
+    yield make
+    for engine in engines:
+        engine.dispose()
@@ -0,0 +1,299 @@
+"""Checkout and checkin of whole stacks of tagged books on an RFID pad.
+
+A patron (or a member of staff returning books) puts a stack on the pad;
+the reader reports each tag once (see reader.py) in quick succession.
+StackBatcher collects those arrivals per pad session until no new tag has
+arrived for `settle` seconds, then lends or returns the whole stack in one
+transaction with a single UPDATE (circulation.checkout_many/checkin_many)
+and reports one StackResult for it:
+
+    batcher = StackBatcher(on_result=show_on_screen)
+    batcher.open_session("desk-1", CHECKOUT, patron_id=42)
+    with batcher, RFIDReader("/dev/ttyUSB0", on_event=batcher.on_event_for("desk-1")):
+        ...
+
+A tag already handled in the session is ignored when it arrives again
+(lifting the stack and putting it back), so it is not lent twice or
+reported as "already borrowed".
+
+    python -m digital_library_rfid.pads --port /dev/ttyUSB0 --mode checkout --patron alice
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from typing import Callable, Dict, Hashable, List, Optional
+
+from digital_library_api.circulation import DEFAULT_LOAN_DAYS, checkin_many, checkout_many
+from digital_library_api.database import Book as DBBook
+from digital_library_api.log import configure_logging
+from digital_library_api.tags import normalize_epc
+
+from .protocol import PROTOCOLS
+from .reader import ARRIVED
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT = "checkout"
+CHECKIN = "checkin"
+
+DEFAULT_SETTLE = 0.5  # Seconds without a new tag before a stack is complete
+MAX_DELAY = 3.0  # Longest a tag waits, however long the stack keeps growing
+MAX_STACK = 200  # Tags per transaction
+
+
+@dataclass
+class StackItem:
+    epc: str
+    ok: bool
+    book_id: Optional[int] = None
+    title: Optional[str] = None
+    due_date: Optional[date] = None  # Checkouts only
+    error: Optional[str] = None
+
+
+@dataclass
+class StackResult:
+    session: Hashable
+    mode: str
+    patron_id: Optional[int]
+    items: List[StackItem] = field(default_factory=list)
+    seconds: float = 0.0  # From the first tag's arrival to the commit
+    error: Optional[str] = None  # The whole stack failed (e.g. the database was unavailable)
+
+    @property
+    def ok(self):
+        return self.error is None and all(item.ok for item in self.items)
+
+
+@dataclass
+class PadSession:
+    key: Hashable
+    mode: str
+    patron_id: Optional[int] = None
+    loan_days: int = DEFAULT_LOAN_DAYS
+    handled: set = field(default_factory=set)  # EPCs lent or returned in this session
+    pending: Dict[str, None] = field(default_factory=dict)  # Ordered set of EPCs
+    first_pending: float = 0.0
+    last_pending: float = 0.0
+
+
+def apply_stack(db, session: PadSession, epcs: List[str]) -> StackResult:
+    """Lends or returns the books tagged `epcs` in one transaction; commits."""
+    result = StackResult(session.key, session.mode, session.patron_id)
+    if session.mode == CHECKOUT:
+        done, errors = checkout_many(db, DBBook.rfid_tag, epcs, session.patron_id, session.loan_days)
+    else:
+        done, errors = checkin_many(db, DBBook.rfid_tag, epcs)
+    db.commit()
+    for epc in epcs:
+        row = done.get(epc)
+        if row is None:
+            result.items.append(StackItem(epc, ok=False, error=str(errors[epc])))
+        else:
+            due_date = row.due_date if session.mode == CHECKOUT else None
+            result.items.append(StackItem(epc, ok=True, book_id=row.id, title=row.title, due_date=due_date))
+    return result
+
+
+class StackBatcher:
+    """Turns tag arrivals on pads into one checkout or checkin per stack.
+
+    Each pad session (a key such as the desk name) is opened with a mode
+    and, for checkouts, a patron. add() is cheap and thread-safe, so it can
+    be called straight from a reader's on_event; stacks are applied on the
+    batcher's own thread, which calls `on_result` with each StackResult.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        settle=DEFAULT_SETTLE,
+        max_delay=MAX_DELAY,
+        max_stack=MAX_STACK,
+        on_result: Optional[Callable[[StackResult], None]] = None,
+    ):
+        if session_factory is None:
+            from digital_library_api.database import SessionLocal as session_factory
+        self.session_factory = session_factory
+        self.settle = settle
+        self.max_delay = max_delay
+        self.max_stack = max_stack
+        self.on_result = on_result
+        self._sessions: Dict[Hashable, PadSession] = {}
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.stacks = 0
+        self.items = 0
+        self.ignored = 0  # Re-reads of tags already handled, and tags with no open session
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="rfid-stacks", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Applies any pending stacks, then stops the thread."""
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def open_session(self, key, mode, patron_id=None, loan_days=DEFAULT_LOAN_DAYS):
+        """Starts a new session on a pad, replacing (and first flushing) any open one."""
+        if mode not in (CHECKOUT, CHECKIN):
+            raise ValueError(f"Unknown pad mode {mode!r}; use {CHECKOUT!r} or {CHECKIN!r}")
+        if mode == CHECKOUT and patron_id is None:
+            raise ValueError("A checkout session needs a patron")
+        self.close_session(key)
+        with self._condition:
+            self._sessions[key] = PadSession(key, mode, patron_id, loan_days)
+
+    def close_session(self, key):
+        """Ends a pad's session; a stack still settling is applied first."""
+        with self._condition:
+            session = self._sessions.get(key)
+            if session is not None and session.pending:
+                session.last_pending = session.first_pending = float("-inf")
+                self._condition.notify()
+                while session.pending and self._thread is not None:
+                    self._condition.wait(0.1)
+            self._sessions.pop(key, None)
+
+    def add(self, key, epc):
+        epc = normalize_epc(epc)
+        now = time.monotonic()
+        with self._condition:
+            session = self._sessions.get(key)
+            if session is None or epc is None or epc in session.handled or epc in session.pending:
+                self.ignored += 1
+                return
+            if not session.pending:
+                session.first_pending = now
+            session.pending[epc] = None
+            session.last_pending = now
+            self._condition.notify()
+
+    def on_event_for(self, key):
+        """An RFIDReader on_event callback feeding the pad session `key`."""
+
+        def on_event(event):
+            if event.kind == ARRIVED:
+                self.add(key, event.epc)
+
+        return on_event
+
+    def _due(self, now):
+        """Sessions whose stack is complete, and how long until the next one is."""
+        due, wait = [], None
+        for session in self._sessions.values():
+            if not session.pending:
+                continue
+            ready_at = min(session.last_pending + self.settle, session.first_pending + self.max_delay)
+            if ready_at <= now or self._stop or len(session.pending) >= self.max_stack:
+                due.append(session)
+            elif wait is None or ready_at - now < wait:
+                wait = ready_at - now
+        return due, wait
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due, wait = self._due(time.monotonic())
+                while not due and not self._stop:
+                    self._condition.wait(wait)
+                    due, wait = self._due(time.monotonic())
+                if not due and self._stop:
+                    return
+                stacks = []
+                for session in due:
+                    epcs = list(session.pending)[: self.max_stack]
+                    stacks.append((session, epcs, session.first_pending))
+            for session, epcs, first in stacks:
+                result = self._apply(session, epcs, first)
+                with self._condition:
+                    for epc in epcs:
+                        session.pending.pop(epc, None)
+                    if session.pending:
+                        session.first_pending = time.monotonic()
+                    session.handled.update(item.epc for item in result.items if item.ok)
+                    self._condition.notify_all()  # Wakes close_session()
+                self._publish(result)
+
+    def _apply(self, session, epcs, first):
+        db = self.session_factory()
+        try:
+            result = apply_stack(db, session, epcs)
+        except Exception as e:
+            db.rollback()
+            logger.exception("Applying a %s stack of %d tags failed", session.mode, len(epcs))
+            result = StackResult(session.key, session.mode, session.patron_id, error=str(e))
+        finally:
+            db.close()
+        result.seconds = time.monotonic() - first
+        self.stacks += 1
+        self.items += len(result.items)
+        return result
+
+    def _publish(self, result):
+        if self.on_result is not None:
+            try:
+                self.on_result(result)
+            except Exception:
+                logger.exception("Stack result callback failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RFID pad: lend or return stacks of tagged books")
+    parser.add_argument("--port", default="COM3", help="serial device or pyserial URL")
+    parser.add_argument("--protocol", choices=sorted(PROTOCOLS), default="r200")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--mode", choices=(CHECKOUT, CHECKIN), default=CHECKIN)
+    parser.add_argument("--patron", default=None, help="username the books are lent to (checkout)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE, help="seconds without a new tag that end a stack")
+    args = parser.parse_args()
+    configure_logging()  # LOG_LEVEL, LOG_FORMAT and LOG_SAMPLE_RATE
+
+    from digital_library_api.database import SessionLocal, User as DBUser
+
+    from .reader import RFIDReader
+
+    patron_id = None
+    if args.patron is not None:
+        db = SessionLocal()
+        try:
+            patron_id = db.query(DBUser.id).filter(DBUser.username == args.patron).scalar()
+        finally:
+            db.close()
+        if patron_id is None:
+            parser.error(f"Unknown patron {args.patron!r}")
+
+    def print_result(result):
+        print(json.dumps(asdict(result), default=str), flush=True)
+
+    batcher = StackBatcher(SessionLocal, settle=args.settle, on_result=print_result)
+    batcher.open_session(args.port, args.mode, patron_id)
+    with batcher, RFIDReader(args.port, args.protocol, args.baudrate, on_event=batcher.on_event_for(args.port)):
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Incremental decoding of RFID reader output into tag reads.
+
+Two reader protocols are understood:
+
+"r200"  Binary frames used by the common R200/JRD-100 UHF modules:
+
+            BB | type | command | length (2, big-endian) | payload | checksum | 7E
+
+        The checksum is the low byte of the sum of type through payload. Tag
+        reads are notice frames (type 02, command 22) whose payload is RSSI
+        (1, signed), PC (2), EPC and CRC (2). START_INVENTORY puts the module
+        into continuous multi-poll mode.
+
+"line"  One read per text line, as sent by readers in keyboard/serial
+        output mode: the EPC in hex, optionally followed by a comma or space
+        and the RSSI, e.g. "E28011606000020A3B4C5D6E,-52\\r\\n".
+
+Bytes from the serial port are written into a RingBuffer of fixed size;
+a decoder's reads() then yields every complete read and leaves a partial
+frame in the buffer for the next call. Noise and corrupted frames are
+skipped and counted in `errors`.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator, NamedTuple, Optional
+
+FRAME_HEADER = 0xBB
+FRAME_END = 0x7E
+TYPE_COMMAND = 0x00
+TYPE_RESPONSE = 0x01
+TYPE_NOTICE = 0x02
+CMD_INVENTORY = 0x22
+CMD_MULTI_POLL = 0x27
+CMD_STOP_MULTI_POLL = 0x28
+
+# Header, type, command, two length bytes, checksum, end
+FRAME_OVERHEAD = 7
+# Longest payload we accept; a length beyond it means we are not at a frame
+MAX_PAYLOAD = 512
+# Longest line in the line protocol (a 496-bit EPC is 124 hex digits)
+MAX_LINE = 256
+
+DEFAULT_BUFFER_SIZE = 16 * 1024
+
+
+class TagRead(NamedTuple):
+    epc: str  # Upper-case hex
+    rssi: Optional[int]  # dBm, if the reader reports it
+    time: float  # time.monotonic() when decoded
+
+
+def r200_frame(frame_type, command, payload=b""):
+    """Builds an R200 frame (also used by the simulator and tests)."""
+    body = bytes([frame_type, command]) + len(payload).to_bytes(2, "big") + payload
+    return bytes([FRAME_HEADER]) + body + bytes([sum(body) & 0xFF, FRAME_END])
+
+
+def r200_tag_frame(epc, rssi=-60):
+    """An R200 inventory notice reporting `epc` (hex) at `rssi` dBm."""
+    epc_bytes = bytes.fromhex(epc)
+    pc = (len(epc_bytes) // 2) << 11  # EPC length in words, bits 15-11
+    payload = bytes([rssi & 0xFF]) + pc.to_bytes(2, "big") + epc_bytes + b"\x00\x00"  # CRC not checked
+    return r200_frame(TYPE_NOTICE, CMD_INVENTORY, payload)
+
+
+class RingBuffer:
+    """Fixed-size byte FIFO that wraps around instead of moving data.
+
+    Positions passed to find(), peek() and indexing are offsets from the
+    oldest unconsumed byte. When a write does not fit, the oldest bytes are
+    dropped and counted in `overruns`; a reader that keeps up never hits it.
+    """
+
+    def __init__(self, capacity=DEFAULT_BUFFER_SIZE):
+        self._data = bytearray(capacity)
+        self.capacity = capacity
+        self._head = 0  # Total bytes consumed
+        self._tail = 0  # Total bytes written
+        self.overruns = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def write(self, data):
+        if len(data) > self.capacity:
+            self.overruns += len(data) - self.capacity
+            data = data[-self.capacity:]
+        excess = len(self) + len(data) - self.capacity
+        if excess > 0:
+            self.overruns += excess
+            self._head += excess
+        start = self._tail % self.capacity
+        first = min(len(data), self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        self._data[:len(data) - first] = data[first:]
+        self._tail += len(data)
+
+    def __getitem__(self, offset):
+        return self._data[(self._head + offset) % self.capacity]
+
+    def find(self, value, start=0):
+        """Offset of the first byte equal to `value` at or after `start`, or -1."""
+        length = len(self)
+        if start >= length:
+            return -1
+        begin = (self._head + start) % self.capacity
+        end = begin + length - start
+        if end <= self.capacity:
+            index = self._data.find(value, begin, end)
+            return -1 if index < 0 else index - begin + start
+        index = self._data.find(value, begin)
+        if index >= 0:
+            return index - begin + start
+        index = self._data.find(value, 0, end - self.capacity)
+        return -1 if index < 0 else index + self.capacity - begin + start
+
+    def peek(self, offset, size):
+        """`size` bytes starting at `offset`, without consuming them."""
+        begin = (self._head + offset) % self.capacity
+        end = begin + size
+        if end <= self.capacity:
+            return bytes(self._data[begin:end])
+        return bytes(self._data[begin:]) + bytes(self._data[:end - self.capacity])
+
+    def consume(self, size):
+        self._head += min(size, len(self))
+
+    def clear(self):
+        self._head = self._tail
+
+
+class _Decoder(ABC):
+    """Shared buffering and counters; subclasses implement reads()."""
+
+    name = None
+    start_command = None  # Sent when the port is opened
+    stop_command = None  # Sent before it is closed
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.buffer = RingBuffer(buffer_size)
+        self.frames = 0  # Complete frames or lines, including non-read ones
+        self.errors = 0
+        self.bytes_discarded = 0
+
+    def feed(self, data):
+        self.buffer.write(data)
+
+    @abstractmethod
+    def reads(self) -> Iterator[TagRead]:
+        """Yields the tag reads in the buffered bytes, consuming them."""
+
+    def _discard(self, size):
+        self.buffer.consume(size)
+        self.bytes_discarded += size
+
+
+class R200Decoder(_Decoder):
+    name = "r200"
+    # Multi-poll inventory, 65535 rounds (the module repeats it indefinitely)
+    start_command = r200_frame(TYPE_COMMAND, CMD_MULTI_POLL, b"\x22\xff\xff")
+    stop_command = r200_frame(TYPE_COMMAND, CMD_STOP_MULTI_POLL)
+
+    def reads(self):
+        buffer = self.buffer
+        now = time.monotonic()
+        while True:
+            start = buffer.find(FRAME_HEADER)
+            if start < 0:
+                self._discard(len(buffer))
+                return
+            if start:
+                self._discard(start)
+            if len(buffer) < FRAME_OVERHEAD:
+                return
+            payload_length = buffer[3] << 8 | buffer[4]
+            size = FRAME_OVERHEAD + payload_length
+            if payload_length > MAX_PAYLOAD:
+                self._skip_header()
+                continue
+            if len(buffer) < size:
+                return  # Partial frame; wait for the rest
+            frame = buffer.peek(0, size)
+            if frame[-1] != FRAME_END or sum(frame[1:-2]) & 0xFF != frame[-2]:
+                self._skip_header()  # Noise that happened to contain BB
+                continue
+            buffer.consume(size)
+            self.frames += 1
+            if frame[1] == TYPE_NOTICE and frame[2] == CMD_INVENTORY:
+                read = self._tag_read(frame[5:-2], now)
+                if read is not None:
+                    yield read
+
+    def _skip_header(self):
+        self.errors += 1
+        self._discard(1)
+
+    def _tag_read(self, payload, now):
+        if len(payload) < 5:
+            self.errors += 1
+            return None
+        epc_length = (payload[1] >> 3) * 2  # PC bits 15-11: EPC length in words
+        if epc_length == 0 or 3 + epc_length + 2 > len(payload):  # RSSI, PC, EPC, CRC
+            epc_length = len(payload) - 5  # Trust the frame length instead
+        rssi = payload[0] - 256 if payload[0] > 127 else payload[0]
+        return TagRead(payload[3:3 + epc_length].hex().upper(), rssi, now)
+
+
+class LineDecoder(_Decoder):
+    name = "line"
+    _HEX_DIGITS = frozenset(b"0123456789abcdefABCDEF")
+
+    def reads(self):
+        buffer = self.buffer
+        now = time.monotonic()
+        while True:
+            end = buffer.find(0x0A)  # LF; a CR before it is stripped below
+            if end < 0:
+                if len(buffer) > MAX_LINE:
+                    self.errors += 1
+                    self._discard(len(buffer))
+                return
+            line = buffer.peek(0, end).strip()
+            buffer.consume(end + 1)
+            if not line:
+                continue
+            self.frames += 1
+            read = self._parse(line, now)
+            if read is None:
+                self.errors += 1
+                self.bytes_discarded += end + 1
+            else:
+                yield read
+
+    def _parse(self, line, now):
+        epc, _, rssi = line.replace(b",", b" ").partition(b" ")
+        if not epc or len(epc) % 2 or not self._HEX_DIGITS.issuperset(epc):
+            return None
+        try:
+            rssi = int(rssi) if rssi.strip() else None
+        except ValueError:
+            return None
+        return TagRead(epc.decode("ascii").upper(), rssi, now)
+
+
+PROTOCOLS = {decoder.name: decoder for decoder in (R200Decoder, LineDecoder)}
+
+
+def make_decoder(protocol, buffer_size=DEFAULT_BUFFER_SIZE):
+    try:
+        return PROTOCOLS[protocol](buffer_size)
+    except KeyError:
+        raise ValueError(f"Unknown RFID protocol {protocol!r}; use one of {sorted(PROTOCOLS)}") from None
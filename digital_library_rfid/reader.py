@@ -0,0 +1,327 @@
+"""Long-running RFID reader service.
+
+RFIDReader reads a serial port on a background thread, decodes tag reads
+(see protocol.py) and turns the stream of repeated reads into events: a
+tag "arrived" the first time it is read and "departed" once it has not
+been read for `window` seconds. Pads and gates report each tag many times a
+second; consumers see each tag once per visit.
+
+    with RFIDReader("/dev/ttyUSB0", protocol="r200", on_event=print):
+        ...
+
+or from asyncio:
+
+    async with reader.events() as events:
+        async for event in events:
+            ...
+
+Command line (prints one JSON event per line):
+
+    python -m digital_library_rfid.reader --port /dev/ttyUSB0 --protocol r200
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional
+
+from digital_library_api.log import configure_logging
+
+from .protocol import DEFAULT_BUFFER_SIZE, PROTOCOLS, make_decoder
+
+logger = logging.getLogger(__name__)
+
+ARRIVED = "arrived"
+DEPARTED = "departed"
+
+DEFAULT_WINDOW = 1.0  # Seconds without a read before a tag counts as gone
+READ_TIMEOUT = 0.05  # Longest a read waits, so departures are noticed promptly
+RECONNECT_DELAY = 1.0
+
+
+@dataclass
+class TagEvent:
+    kind: str  # ARRIVED or DEPARTED
+    epc: str
+    time: float  # time.monotonic() of the first (arrived) or last (departed) read
+    rssi: Optional[int] = None  # Strongest RSSI seen during the visit
+    reads: int = 1  # Reads during the visit, duplicates included
+
+
+class TagTracker:
+    """Collapses repeated reads of the same EPC into arrival and departure events.
+
+    Tags are kept in least-recently-read order, so both a read and the
+    departure check cost O(1) per tag however many tags are in the field.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._present = OrderedDict()  # epc -> TagEvent for the current visit
+
+    def __len__(self):
+        return len(self._present)
+
+    @property
+    def present(self):
+        return list(self._present)
+
+    def observe(self, read):
+        """Records a read; returns the arrival event if the tag was not present."""
+        visit = self._present.get(read.epc)
+        if visit is None:
+            self._present[read.epc] = TagEvent(ARRIVED, read.epc, read.time, read.rssi)
+            return TagEvent(ARRIVED, read.epc, read.time, read.rssi)
+        self._present.move_to_end(read.epc)
+        visit.time = read.time
+        visit.reads += 1
+        if read.rssi is not None and (visit.rssi is None or read.rssi > visit.rssi):
+            visit.rssi = read.rssi
+        return None
+
+    def expire(self, now):
+        """Departure events for tags not read since `now - window`."""
+        departed = []
+        cutoff = now - self.window
+        while self._present:
+            epc, visit = next(iter(self._present.items()))
+            if visit.time >= cutoff:
+                break
+            del self._present[epc]
+            visit.kind = DEPARTED
+            departed.append(visit)
+        return departed
+
+
+class EventStream:
+    """Async iterator over a reader's TagEvents, returned by RFIDReader.events().
+
+    It receives events from the moment it is created, not from the first
+    iteration, so none are missed in between. close() it (or use it with
+    `async with`) when done.
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()  # Batches of events from the reader thread
+        self._pending = deque()
+        reader._subscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._pending:
+            self._pending.extend(await self.queue.get())
+        return self._pending.popleft()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._reader._unsubscribe(self)
+
+
+class RFIDReader:
+    """Reads tags from a serial port and publishes arrival/departure events.
+
+    `port` is anything serial.serial_for_url() accepts: a device ("COM3",
+    "/dev/ttyUSB0"), a pty, or a URL such as "socket://host:port".
+    `on_event` is called on the reader thread with each TagEvent; events()
+    gives the same events to asyncio code. The port is reopened if it goes
+    away (a USB reader being unplugged).
+    """
+
+    def __init__(
+        self,
+        port,
+        protocol="r200",
+        baudrate=115200,
+        window=DEFAULT_WINDOW,
+        on_event: Optional[Callable[[TagEvent], None]] = None,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        serial_factory=None,
+    ):
+        self.port = port
+        self.protocol = protocol
+        self.baudrate = baudrate
+        self.decoder = make_decoder(protocol, buffer_size)
+        self.tracker = TagTracker(window)
+        self.on_event = on_event
+        self._serial_factory = serial_factory
+        self._subscribers = []  # EventStreams
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reads = 0
+        self.arrivals = 0
+        self.departures = 0
+        self.reconnects = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"rfid-{self.port}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        decoder = self.decoder
+        return {
+            "reads": self.reads,
+            "arrivals": self.arrivals,
+            "departures": self.departures,
+            "present": len(self.tracker),
+            "frames": decoder.frames,
+            "errors": decoder.errors,
+            "bytes_discarded": decoder.bytes_discarded,
+            "buffer_overruns": decoder.buffer.overruns,
+            "reconnects": self.reconnects,
+        }
+
+    def events(self):
+        """An EventStream of TagEvents for the running event loop."""
+        return EventStream(self)
+
+    def _subscribe(self, stream):
+        with self._lock:
+            self._subscribers.append(stream)
+
+    def _unsubscribe(self, stream):
+        with self._lock:
+            if stream in self._subscribers:
+                self._subscribers.remove(stream)
+
+    def _open(self):
+        if self._serial_factory is not None:
+            return self._serial_factory()
+        import serial
+
+        return serial.serial_for_url(self.port, baudrate=self.baudrate, timeout=READ_TIMEOUT)
+
+    def _run(self):
+        import serial
+
+        while not self._stop.is_set():
+            try:
+                port = self._open()
+            except (serial.SerialException, OSError) as e:
+                logger.warning("Cannot open RFID reader %s: %s", self.port, e)
+                self._stop.wait(RECONNECT_DELAY)
+                continue
+            try:
+                self._read_port(port)
+            except (serial.SerialException, OSError) as e:
+                logger.warning("RFID reader %s failed: %s; reopening", self.port, e)
+                self.reconnects += 1
+                self._stop.wait(RECONNECT_DELAY)
+            finally:
+                port.close()
+        self._publish(self.tracker.expire(float("inf")))  # Everything departs on stop
+
+    def _read_port(self, port):
+        decoder, tracker = self.decoder, self.tracker
+        decoder.buffer.clear()  # A partial frame from before a reconnect is useless
+        if decoder.start_command:
+            port.write(decoder.start_command)
+        try:
+            while not self._stop.is_set():
+                # Block for the first byte (up to the port timeout), then take
+                # whatever else has arrived: one call per burst, not per byte.
+                data = port.read(max(1, port.in_waiting))
+                events = []
+                if data:
+                    decoder.feed(data)
+                    for read in decoder.reads():
+                        self.reads += 1
+                        event = tracker.observe(read)
+                        if event is not None:
+                            events.append(event)
+                events += tracker.expire(time.monotonic())
+                if events:
+                    self._publish(events)
+        finally:
+            if decoder.stop_command:
+                try:
+                    port.write(decoder.stop_command)
+                except (OSError, ValueError):
+                    pass
+
+    def _publish(self, events):
+        for event in events:
+            if event.kind == ARRIVED:
+                self.arrivals += 1
+            else:
+                self.departures += 1
+            if self.on_event is not None:
+                try:
+                    self.on_event(event)
+                except Exception:
+                    logger.exception("RFID event callback failed")
+        with self._lock:
+            subscribers = list(self._subscribers)
+        # One wake-up per batch and subscriber rather than per event
+        for stream in subscribers:
+            try:
+                stream.loop.call_soon_threadsafe(stream.queue.put_nowait, events)
+            except RuntimeError:
+                pass  # The subscriber's loop has closed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RFID reader service")
+    parser.add_argument("--port", default="COM3", help="serial device or pyserial URL")
+    parser.add_argument("--protocol", choices=sorted(PROTOCOLS), default="r200")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW, help="seconds before an unread tag departs")
+    parser.add_argument("--books", action="store_true", help="add the id of each tag's book from the library database")
+    args = parser.parse_args()
+    configure_logging()  # LOG_LEVEL, LOG_FORMAT and LOG_SAMPLE_RATE
+    resolver = None
+    if args.books:
+        from .books import BookResolver
+
+        resolver = BookResolver()
+
+    def print_event(event):
+        record = asdict(event)
+        if resolver is not None:
+            record["book_id"] = resolver.book_id(event.epc)
+        print(json.dumps(record), flush=True)
+
+    reader = RFIDReader(args.port, args.protocol, args.baudrate, args.window, on_event=print_event)
+    reader.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.stop()
+        if resolver is not None:
+            resolver.close()
+        print(json.dumps(reader.stats()), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Virtual RFID reader on a pseudo-terminal, for testing without hardware.
+
+VirtualReader opens a pty and writes reader output into it at a set rate:
+reads of a population of tags, with repeats, junk bytes between frames,
+frames split across writes, and tags leaving and new ones arriving. Point
+RFIDReader (or anything else that opens serial ports) at `port`:
+
+    with VirtualReader(tags=200, rate=2000, noise=0.01) as virtual:
+        with RFIDReader(virtual.port, on_event=print):
+            time.sleep(10)
+
+Like a real R200 module it only reports reads between the multi-poll
+start and stop commands; line-protocol readers report all the time.
+Linux and macOS only (pty).
+
+    python -m digital_library_rfid.simulator --tags 200 --rate 2000
+"""
+
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+from .protocol import PROTOCOLS, R200Decoder, r200_tag_frame
+
+TICK = 0.005  # Seconds between bursts of writes
+
+
+class VirtualReader:
+    """A pty that behaves like an RFID reader with tags in its field.
+
+    `rate` is reads per second; each read is repeated `duplicates` times
+    back to back. `noise` is the chance of junk bytes after a read, and
+    `partial` the chance that a burst is written in two parts with a pause
+    between, so frames arrive split. `churn` is the fraction of the tag
+    population replaced per second.
+
+    `first_written` maps each EPC to when its first read was written
+    (time.monotonic()), for measuring latency; `reads_written` counts reads,
+    duplicates included.
+    """
+
+    def __init__(
+        self,
+        protocol="r200",
+        tags=50,
+        rate=1000.0,
+        duplicates=1,
+        noise=0.0,
+        partial=0.0,
+        churn=0.0,
+        seed=None,
+    ):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown RFID protocol {protocol!r}; use one of {sorted(PROTOCOLS)}")
+        self.protocol = protocol
+        self.rate = rate
+        self.duplicates = duplicates
+        self.noise = noise
+        self.partial = partial
+        self.churn = churn
+        self._rng = random.Random(seed)
+        self._next_tag = 0
+        self.population = [self._new_tag() for _ in range(tags)]
+        self._frames = {}  # EPC -> encoded read, built once per tag
+        self.first_written = {}
+        self.reads_written = 0
+        self.bytes_written = 0
+        self.overflows = 0  # Bursts dropped because nobody was reading the pty
+        self.inventory = protocol != R200Decoder.name  # R200 waits for the start command
+        self._master = self._slave = None
+        self.port = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._burst_lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # No echo or newline translation
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rfid-simulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def pause(self):
+        """Stops reporting reads, like the stop command; returns after any burst in progress."""
+        with self._burst_lock:
+            self.inventory = False
+
+    def _new_tag(self):
+        self._next_tag += 1
+        return f"E2801160{self._rng.getrandbits(32):08X}{self._next_tag:08X}"
+
+    def _encode(self, epc):
+        frame = self._frames.get(epc)
+        if frame is None:
+            if self.protocol == R200Decoder.name:
+                frame = r200_tag_frame(epc, rssi=-self._rng.randrange(40, 80))
+            else:
+                frame = f"{epc},{-self._rng.randrange(40, 80)}\r\n".encode("ascii")
+            self._frames[epc] = frame
+        return frame
+
+    def _junk(self):
+        junk = bytes(self._rng.getrandbits(8) for _ in range(self._rng.randrange(1, 16)))
+        if self.protocol != R200Decoder.name:
+            junk = junk.replace(b"\n", b"") + b"\r\n"  # A garbage line, not a damaged read
+        return junk
+
+    def _run(self):
+        start = last = time.monotonic()
+        sent = 0  # Reads due so far, whether or not they could be written
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], TICK)
+            if readable:
+                self._handle_commands()
+            now = time.monotonic()
+            self._replace_tags((now - last) * self.churn * len(self.population))
+            last = now
+            with self._burst_lock:
+                if not self.inventory:
+                    start, sent = now, 0
+                    continue
+                due = int(self.rate * (now - start)) - sent
+                if due >= 1:
+                    self._write_burst(due)
+                    sent += due
+
+    def _handle_commands(self):
+        try:
+            data = os.read(self._master, 4096)
+        except OSError:
+            return
+        if R200Decoder.start_command in data:
+            self.inventory = True
+        if R200Decoder.stop_command in data:
+            self.inventory = False
+
+    def _replace_tags(self, expected):
+        # Poisson-ish: whole tags plus a chance for the fraction
+        count = int(expected) + (self._rng.random() < expected % 1)
+        for _ in range(min(count, len(self.population))):
+            index = self._rng.randrange(len(self.population))
+            self._frames.pop(self.population[index], None)
+            self.population[index] = self._new_tag()
+
+    def _write_burst(self, reads):
+        chunks = []
+        now = time.monotonic()
+        for _ in range(reads):
+            epc = self._rng.choice(self.population)
+            self.first_written.setdefault(epc, now)
+            chunks.append(self._encode(epc) * self.duplicates)
+            if self.noise and self._rng.random() < self.noise:
+                chunks.append(self._junk())
+        burst = b"".join(chunks)
+        if self.partial and self._rng.random() < self.partial:
+            split = self._rng.randrange(1, len(burst))
+            written = self._write(burst[:split])
+            if written:
+                time.sleep(TICK / 5)  # The reader sees the first part on its own
+                written = self._write(burst[split:])
+        else:
+            written = self._write(burst)
+        if written:
+            self.reads_written += reads * self.duplicates
+
+    def _write(self, data):
+        view = memoryview(data)
+        deadline = time.monotonic() + 1.0
+        while view:
+            try:
+                view = view[os.write(self._master, view):]
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    self.overflows += 1
+                    return False
+                select.select([], [self._master], [], TICK)
+        self.bytes_written += len(data)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="virtual RFID reader on a pty")
+    parser.add_argument("--protocol", choices=sorted(PROTOCOLS), default="r200")
+    parser.add_argument("--tags", type=int, default=50, help="tags in the field")
+    parser.add_argument("--rate", type=float, default=1000.0, help="reads per second")
+    parser.add_argument("--duplicates", type=int, default=1, help="copies of each read")
+    parser.add_argument("--noise", type=float, default=0.0, help="chance of junk bytes after a read")
+    parser.add_argument("--partial", type=float, default=0.0, help="chance a burst is split across writes")
+    parser.add_argument("--churn", type=float, default=0.0, help="fraction of tags replaced per second")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    virtual = VirtualReader(
+        args.protocol, args.tags, args.rate, args.duplicates, args.noise, args.partial, args.churn, args.seed
+    )
+    with virtual:
+        print(f"Virtual {args.protocol} reader on {virtual.port}", flush=True)
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
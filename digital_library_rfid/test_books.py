@@ -0,0 +1,24 @@
+from sqlalchemy import event
+
+from digital_library_api.tags import tag_cache
+
+from .books import BookResolver
+from .conftest import epc
+
+
+def test_resolver_caches_tags(make_library):
+    """Test that repeated reads of a tag, known or not, query the database once."""
+    factory = make_library({1: {}})
+    engine = factory.kw["bind"]
+    tag_cache.clear()
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+    with BookResolver(factory) as resolver:
+        for _ in range(3):
+            assert resolver.book_id(epc(1).lower()) == 1
+            assert resolver.book_id("E2801160FFFFFFFFFFFFFFFF") is None
+            assert resolver.book_id("junk") is None
+        assert not resolver._db.in_transaction()
+    assert len(queries) == 2
+    tag_cache.clear()
@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+
+from .conftest import epc
+from .inventory import InventorySession
+from .reader import ARRIVED, DEPARTED, TagEvent
+
+
+@pytest.fixture
+def db(make_library):
+    """Shelf A holds books 1-4 (book 3 on loan, book 4 untagged); book 5 belongs on shelf B."""
+    books = {n: dict(location="A") for n in range(1, 5)}
+    books[3].update(is_borrowed=True, due_date=date(2030, 1, 1))
+    books[4].update(rfid_tag=None)
+    books[5] = dict(location="B")
+    session = make_library(books)()
+    yield session
+    session.close()
+
+
+def test_reconcile_shelf(db):
+    """Test that a shelf count reports missing, misshelved, on-loan and unknown items."""
+    inventory = InventorySession("A")
+    for _ in range(3):  # Readers repeat themselves
+        for tag in (epc(1), epc(3), epc(5), epc(99), "not hex"):
+            inventory.add(tag)
+    inventory.on_event(TagEvent(ARRIVED, epc(1).lower(), 0.0))
+    inventory.on_event(TagEvent(DEPARTED, epc(2), 0.0))
+    assert len(inventory) == 4 and inventory.rejected == 3
+
+    report = inventory.reconcile(db, chunk_size=2)
+    assert report.missing == [2]  # Book 4 has no tag, so it cannot be missed
+    assert report.misshelved == [5]
+    assert report.on_loan == [3]
+    assert report.unknown == [epc(99)]
+    assert report.summary()["matched"] == 3
+    assert not db.in_transaction()
+
+    # The temporary table is emptied, so a second count starts afresh
+    assert InventorySession("A").reconcile(db).missing == [1, 2]
+
+
+def test_reconcile_whole_collection(db):
+    """Test that without a location nothing is misshelved and every shelf counts."""
+    inventory = InventorySession()
+    for n in (1, 2):
+        inventory.add(epc(n))
+    report = inventory.reconcile(db)
+    assert report.missing == [5]
+    assert report.misshelved == [] and report.on_loan == [] and report.unknown == []
@@ -0,0 +1,85 @@
+import queue
+import threading
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from digital_library_api.database import Book as DBBook
+
+from .conftest import epc
+from .pads import CHECKIN, CHECKOUT, StackBatcher
+from .reader import ARRIVED, DEPARTED, TagEvent
+
+
+@pytest.fixture
+def session_factory(make_library):
+    """Books 1-5 are tagged; book 5 is on loan to someone else."""
+    on_loan = dict(is_borrowed=True, borrower_id=2, due_date=date(2030, 1, 1))
+    return make_library({n: on_loan if n == 5 else {} for n in range(1, 6)}, users=[(1, "patron"), (2, "other")])
+
+
+def test_stack_checkout_in_one_transaction(session_factory):
+    """Test that a stack read tag by tag becomes one result from one UPDATE and one commit."""
+    results = queue.Queue()
+    engine = session_factory.kw["bind"]
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement.split()[0]),
+    )
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+
+    with StackBatcher(session_factory, settle=0.1, on_result=results.put) as batcher:
+        batcher.open_session("desk", CHECKOUT, patron_id=1)
+        on_event = batcher.on_event_for("desk")
+        # Duplicates, a departure and a tag read from two threads at once
+        readers = [
+            threading.Thread(target=lambda: [on_event(TagEvent(ARRIVED, epc(n), 0.0)) for n in (1, 2, 5, 99, 1)])
+            for _ in range(2)
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        on_event(TagEvent(DEPARTED, epc(3), 0.0))
+        result = results.get(timeout=5)
+
+        assert [item.epc for item in result.items] == [epc(1), epc(2), epc(5), epc(99)]
+        assert [item.ok for item in result.items] == [True, True, False, False]
+        assert result.items[0].title == "Book 1" and result.items[0].due_date is not None
+        assert result.items[2].error == "Book is already borrowed by other"
+        assert result.items[3].error == "Book not found"
+        assert not result.ok and result.patron_id == 1
+        assert statements.count("UPDATE") == 1 and len(commits) == 1
+
+        # Putting the stack back down does not lend anything twice
+        for n in (1, 2, 3):
+            batcher.add("desk", epc(n))
+        result = results.get(timeout=5)
+        assert [(item.epc, item.ok) for item in result.items] == [(epc(3), True)]
+        assert batcher.ignored >= 6
+
+    db = session_factory()
+    assert sorted(book_id for (book_id,) in db.query(DBBook.id).filter(DBBook.borrower_id == 1)) == [1, 2, 3]
+    db.close()
+
+
+def test_stack_checkin_and_close_session(session_factory):
+    """Test that closing a session applies the stack still settling."""
+    results = []
+    with StackBatcher(session_factory, settle=60, on_result=results.append) as batcher:
+        batcher.open_session("desk", CHECKIN)
+        batcher.add("desk", epc(5))
+        batcher.add("desk", epc(1))
+        batcher.close_session("desk")
+        assert len(results) == 1
+        assert [(item.epc, item.ok) for item in results[0].items] == [(epc(5), True), (epc(1), False)]
+        assert results[0].items[1].error == "Book is not currently borrowed"
+        batcher.add("desk", epc(2))  # No session any more
+    assert len(results) == 1
+
+    with pytest.raises(ValueError):
+        StackBatcher(session_factory).open_session("desk", CHECKOUT)
@@ -0,0 +1,67 @@
+import pytest
+
+from .protocol import (
+    CMD_INVENTORY,
+    TYPE_NOTICE,
+    LineDecoder,
+    R200Decoder,
+    RingBuffer,
+    make_decoder,
+    r200_frame,
+    r200_tag_frame,
+)
+
+EPC = "E28011606000020A3B4C5D6E"
+
+
+def test_ring_buffer_wraps():
+    """Test find/peek across the end of the buffer and dropping on overrun."""
+    ring = RingBuffer(8)
+    ring.write(b"abcdef")
+    ring.consume(5)
+    ring.write(b"ghijk")  # Wraps: f g h | i j k
+    assert len(ring) == 6
+    assert ring.peek(0, 6) == b"fghijk"
+    assert ring.find(ord("j")) == 4 and ring.find(ord("f"), 1) == -1
+    assert ring[3] == ord("i")
+    ring.write(b"lmnop")
+    assert ring.overruns == 3 and ring.peek(0, 8) == b"ijklmnop"
+
+
+def test_r200_decodes_split_frames_and_skips_noise():
+    """Test that reads survive arbitrary split points, noise and a corrupted frame."""
+    good = r200_tag_frame(EPC, rssi=-52)
+    corrupted = bytearray(r200_tag_frame("300833B2DDD9014000000000"))
+    corrupted[8] ^= 0xFF
+    stream = b"\x00\xbb\x11" + good + bytes(corrupted) + b"noise" + good
+    for split in range(1, len(stream)):
+        decoder = R200Decoder(128)
+        reads = []
+        for chunk in (stream[:split], stream[split:]):
+            decoder.feed(chunk)
+            reads += decoder.reads()
+        assert [(read.epc, read.rssi) for read in reads] == [(EPC, -52)] * 2, split
+        assert decoder.errors >= 1
+
+
+def test_r200_overlong_pc_length_falls_back_to_frame_length():
+    """Test that a PC word claiming more EPC words than the frame holds never reads the CRC as EPC."""
+    epc_bytes = bytes.fromhex(EPC)
+    decoder = R200Decoder(128)
+    for extra_words in (1, 2):
+        pc = (len(epc_bytes) // 2 + extra_words) << 11
+        payload = bytes([-55 & 0xFF]) + pc.to_bytes(2, "big") + epc_bytes + b"\x12\x34"  # CRC
+        decoder.feed(r200_frame(TYPE_NOTICE, CMD_INVENTORY, payload))
+    assert [(read.epc, read.rssi) for read in decoder.reads()] == [(EPC, -55)] * 2
+
+
+def test_line_protocol():
+    decoder = LineDecoder()
+    decoder.feed(f"{EPC},-61\r\n{EPC.lower()}\r\nnot a tag\r\n30083".encode())
+    reads = list(decoder.reads())
+    assert [(read.epc, read.rssi) for read in reads] == [(EPC, -61), (EPC, None)]
+    assert decoder.errors == 1
+    decoder.feed(b"3B2DDD9014000000000\n")
+    assert [read.epc for read in decoder.reads()] == ["300833B2DDD9014000000000"]
+    with pytest.raises(ValueError):
+        make_decoder("morse")
@@ -0,0 +1,52 @@
+import asyncio
+import serial
+
+from .protocol import TagRead, r200_tag_frame
+from .reader import ARRIVED, DEPARTED, RFIDReader, TagTracker
+
+EPC = "E28011606000020A3B4C5D6E"
+
+
+def test_tracker_deduplicates_within_window():
+    tracker = TagTracker(window=1.0)
+    assert tracker.observe(TagRead("AA", None, 10.0)).kind == ARRIVED
+    assert tracker.observe(TagRead(EPC, -60, 10.0)).kind == ARRIVED
+    for n in range(1, 20):
+        assert tracker.observe(TagRead(EPC, -60 + n % 3, 10.0 + n * 0.05)) is None
+    assert tracker.expire(10.9) == []
+
+    departed = tracker.expire(11.5)
+    assert [(event.kind, event.epc, event.reads, event.rssi) for event in departed] == [(DEPARTED, "AA", 1, None)]
+    departed = tracker.expire(12.0)
+    assert [(event.epc, event.reads, event.rssi) for event in departed] == [(EPC, 20, -58)]
+    assert len(tracker) == 0
+
+
+def test_reader_publishes_events_from_a_port():
+    """Test the reader thread end to end over a pyserial loopback port."""
+    port = serial.serial_for_url("loop://", timeout=0.01)
+    callback_events = []
+
+    async def scenario():
+        reader = RFIDReader("loop://", window=0.2, on_event=callback_events.append, serial_factory=lambda: port)
+        async with reader.events() as events:
+            reader.start()
+            try:
+                for _ in range(50):
+                    port.write(r200_tag_frame(EPC) + r200_tag_frame("AABBCCDD"))
+                received = [await asyncio.wait_for(events.__anext__(), 2) for _ in range(4)]
+            finally:
+                reader.stop()
+        return received, reader.stats()
+
+    events, stats = asyncio.run(scenario())
+    assert [(event.kind, event.epc) for event in events] == [
+        (ARRIVED, EPC),
+        (ARRIVED, "AABBCCDD"),
+        (DEPARTED, EPC),
+        (DEPARTED, "AABBCCDD"),
+    ]
+    assert events[2].reads == 50
+    assert stats["reads"] == 100 and stats["arrivals"] == 2 and stats["departures"] == 2
+    assert stats["frames"] >= 101  # The echoed start command is a frame too
+    assert callback_events == events
@@ -0,0 +1,30 @@
+import os
+import time
+
+import pytest
+
+from .reader import RFIDReader
+from .simulator import VirtualReader
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="needs a pty")
+
+
+@pytest.mark.parametrize("protocol", ["r200", "line"])
+def test_reader_against_virtual_reader(protocol):
+    """Test that every read survives noise and split frames through a real pty."""
+    arrived = set()
+    virtual = VirtualReader(protocol, tags=20, rate=2000, duplicates=2, noise=0.05, partial=0.5, seed=1)
+    with virtual:
+        reader = RFIDReader(virtual.port, protocol, on_event=lambda event: arrived.add(event.epc))
+        with reader:
+            deadline = time.monotonic() + 5
+            while virtual.reads_written < 500 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            virtual.pause()  # Stop reading tags, then let the reader catch up
+            written = virtual.reads_written
+            while reader.reads < written and time.monotonic() < deadline:
+                time.sleep(0.01)
+    assert written >= 500 and virtual.overflows == 0
+    assert reader.reads == written
+    assert arrived == set(virtual.first_written)
+    assert reader.decoder.bytes_discarded > 0  # The junk was noticed and skipped
@@ -0,0 +1,57 @@
+"""Microbenchmark for the SIP2 codec: encode and decode time per message.
+
+    python -m digital_library_sip2.bench_codec --number 20000
+"""
+
+import argparse
+import json
+import timeit
+
+from .codec import SIP2Message, decode_message, encode_message, sip2_timestamp
+
+NOW = sip2_timestamp()
+
+MESSAGES = {
+    "93 Login": SIP2Message("93", {"uid_algorithm": "0", "pwd_algorithm": "0"}, [("CN", "terminal"), ("CO", "secret")], 1),
+    "11 Checkout": SIP2Message(
+        "11",
+        {"no_block": False, "transaction_date": NOW},
+        [("AO", "lib"), ("AA", "patron42"), ("AB", "9780441013593"), ("AC", "")],
+        2,
+    ),
+    "12 Checkout Response": SIP2Message(
+        "12",
+        {"ok": True, "magnetic_media": "U", "desensitize": "Y", "transaction_date": NOW},
+        [("AO", "lib"), ("AA", "patron42"), ("AB", "9780441013593"), ("AJ", "Dune"), ("AH", "2025-01-15")],
+        2,
+    ),
+    "64 Patron Information Response": SIP2Message(
+        "64",
+        {"language": "001", "transaction_date": NOW, "charged_items_count": 3},
+        [("AO", "lib"), ("AA", "patron42"), ("AE", "Patron, A")] + [("AU", f"97800000000{n}") for n in range(3)],
+        3,
+    ),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20_000, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=3, help="report the best of this many runs")
+    args = parser.parse_args()
+
+    results = {}
+    for name, message in MESSAGES.items():
+        frame = encode_message(message)[:-1]
+        encode = min(timeit.repeat(lambda: encode_message(message), number=args.number, repeat=args.repeat))
+        decode = min(timeit.repeat(lambda: decode_message(frame), number=args.number, repeat=args.repeat))
+        results[name] = {
+            "bytes": len(frame) + 1,
+            "encode_us": round(encode / args.number * 1e6, 2),
+            "decode_us": round(decode / args.number * 1e6, 2),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
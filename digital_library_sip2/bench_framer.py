@@ -0,0 +1,77 @@
+"""Measures SIP2 framing throughput: string buffer re-slicing vs SIP2Framer.
+
+Feeds a pipelined stream to each approach in socket-sized reads and parses
+every message, like a server connection would:
+
+    python -m digital_library_sip2.bench_framer --messages 100000 --read-size 4096
+"""
+
+import argparse
+import json
+import time
+
+from .framer import SIP2Framer
+from .codec import SIP2DecodeError, decode_message
+from .sip2_mock_server import build_sip2_message, parse_sip2_message
+
+MESSAGE = build_sip2_message("23", "00120250101    120000AOlib|AApatron1|AC|AD|", 1)
+MESSAGE = f"{len(MESSAGE) + 4:04d}{MESSAGE}"  # Length-prefixed, as the old loop expects
+
+
+def string_buffer(chunks):
+    """The previous per-connection loop: decode, append, re-slice per message."""
+    count = 0
+    buffer = ""
+    for data in chunks:
+        buffer += data.decode("ascii")
+        while "\r" in buffer:
+            cr_index = buffer.find("\r")
+            parsed_msg, error = parse_sip2_message(buffer[: cr_index + 1])
+            count += parsed_msg is not None
+            buffer = buffer[cr_index + 1 :]
+    return count
+
+
+def framer(chunks):
+    count = 0
+    framer = SIP2Framer()
+    for data in chunks:
+        size = len(data)
+        framer.get_buffer(size)[:size] = data  # Stands in for recv_into()
+        framer.buffer_updated(size)
+        for frame in framer.frames():
+            try:
+                decode_message(frame)
+            except SIP2DecodeError:
+                continue
+            count += 1
+    return count
+
+
+def measure(function, chunks, messages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        assert function(chunks) == messages
+        best = min(best, time.perf_counter() - start)
+    return {"seconds": round(best, 4), "messages_per_second": round(messages / best)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--read-size", type=int, default=4096, help="bytes per simulated recv()")
+    parser.add_argument("--repeat", type=int, default=3, help="report the best of this many runs")
+    args = parser.parse_args()
+
+    stream = (MESSAGE * args.messages).encode("ascii")
+    chunks = [stream[i : i + args.read_size] for i in range(0, len(stream), args.read_size)]
+    results = {
+        "string_buffer": measure(string_buffer, chunks, args.messages, args.repeat),
+        "framer": measure(framer, chunks, args.messages, args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measures SIP2 message throughput as sip2_multiproc workers are added.
+
+For each worker count the supervisor is started, then several client
+processes (so the load generator is not limited by one GIL either) each
+pipeline requests over a few connections. Throughput should grow with the
+worker count up to the number of cores (Linux, SO_REUSEPORT):
+
+    python -m digital_library_sip2.bench_multiproc --workers 1,2,4 --client-processes 4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+from .bench_servers import PATRON_STATUS
+from .sip2_multiproc import SIP2Supervisor
+
+
+async def _pipeline(port, connections, messages):
+    async def run_connection():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(PATRON_STATUS * messages)
+        await writer.drain()
+        for _ in range(messages):
+            await reader.readuntil(b"\r")
+        writer.close()
+
+    await asyncio.gather(*(run_connection() for _ in range(connections)))
+
+
+def _client(port, connections, messages, start_at):
+    """Client process: waits for the common start time, then returns its elapsed seconds."""
+    time.sleep(max(0.0, start_at - time.time()))
+    start = time.perf_counter()
+    asyncio.run(_pipeline(port, connections, messages))
+    return time.perf_counter() - start
+
+
+def measure(workers, args):
+    supervisor = SIP2Supervisor("127.0.0.1", 0, workers=workers, max_connections=10_000, quiet=True)
+    supervisor.start()
+    try:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(args.client_processes) as pool:
+            start_at = time.time() + 1.0  # Time for the client processes to start
+            elapsed = pool.starmap(
+                _client, [(supervisor.port, args.connections, args.messages, start_at)] * args.client_processes
+            )
+    finally:
+        supervisor.shutdown()
+    total = args.client_processes * args.connections * args.messages
+    return {"workers": workers, "messages": total, "messages_per_second": round(total / max(elapsed))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    default_workers = ",".join(str(n) for n in sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--workers", default=default_workers, help=f"worker counts to try (default {default_workers})")
+    parser.add_argument("--client-processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--connections", type=int, default=8, help="connections per client process")
+    parser.add_argument("--messages", type=int, default=2000, help="messages per connection")
+    args = parser.parse_args()
+
+    results = [measure(int(workers), args) for workers in args.workers.split(",")]
+    baseline = results[0]["messages_per_second"]
+    for result in results:
+        result["speedup"] = round(result["messages_per_second"] / baseline, 2)
+    print(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compares the threaded MockSIP2Server with AsyncSIP2Server.
+
+Measures how many concurrent (mostly idle) connections each server holds and
+how many messages per second it answers when clients pipeline requests:
+
+    python -m digital_library_sip2.bench_servers --connections 500 --messages 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import threading
+import time
+
+from .sip2_async_server import AsyncSIP2Server
+from .sip2_mock_server import MockSIP2Server, build_sip2_message
+
+PATRON_STATUS = build_sip2_message("23", "00120250101    120000AOlib|AApatron1|AC|AD|", 1).encode("ascii")
+
+
+async def hold_connections(port, count, timeout):
+    """Opens `count` connections, then checks each still gets an answer."""
+    connections = []
+    for _ in range(count):
+        try:
+            connections.append(
+                await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), timeout)
+            )
+        except (OSError, asyncio.TimeoutError):
+            break
+
+    async def probe(reader, writer):
+        writer.write(PATRON_STATUS)
+        await writer.drain()
+        await asyncio.wait_for(reader.readuntil(b"\r"), timeout)
+
+    results = await asyncio.gather(
+        *(probe(r, w) for r, w in connections), return_exceptions=True
+    )
+    for _, writer in connections:
+        writer.close()
+    return sum(1 for result in results if result is None)
+
+
+async def pipeline_throughput(port, clients, messages):
+    """Each client sends `messages` requests back to back and reads all replies."""
+
+    async def run_client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(PATRON_STATUS * messages)
+        await writer.drain()
+        for _ in range(messages):
+            await reader.readuntil(b"\r")
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client() for _ in range(clients)))
+    return clients * messages / (time.perf_counter() - start)
+
+
+async def measure(port, args):
+    held = await hold_connections(port, args.connections, args.timeout)
+    threads = threading.active_count()
+    rate = await pipeline_throughput(port, args.clients, args.messages)
+    return {"connections_held": held, "threads_while_holding": threads, "messages_per_second": round(rate)}
+
+
+def bench_threaded(args):
+    server = MockSIP2Server("127.0.0.1", 0)
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    while server.server_socket is None or server.port == 0:
+        time.sleep(0.01)
+    try:
+        return asyncio.run(measure(server.port, args))
+    finally:
+        server.running = False
+        server.stop()
+
+
+def bench_async(args):
+    async def run():
+        server = AsyncSIP2Server(
+            "127.0.0.1", 0, backlog=args.connections, max_connections=args.connections + args.clients
+        )
+        await server.start()
+        try:
+            return await measure(server.port, args)
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, default=500, help="idle connections to hold")
+    parser.add_argument("--clients", type=int, default=10, help="pipelining clients")
+    parser.add_argument("--messages", type=int, default=200, help="messages per client")
+    parser.add_argument("--timeout", type=float, default=5.0, help="connect/reply timeout")
+    args = parser.parse_args()
+
+    results = {}
+    # Both servers print per connection (the threaded one per message too);
+    # keep that out of the measurement.
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["threaded"] = bench_threaded(args)
+        results["asyncio"] = bench_async(args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
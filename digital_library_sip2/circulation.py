@@ -0,0 +1,246 @@
+import logging
+from datetime import date
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import SQLAlchemyError
+
+from digital_library_api.circulation import (
+    DEFAULT_LOAN_DAYS,
+    BookNotFoundError,
+    CirculationError,
+    checkin,
+    checkout,
+)
+from digital_library_api.database import Book as DBBook, SessionLocal, User as DBUser
+from digital_library_api.security import verify_password
+from digital_library_api.tags import book_filter_for_tag, invalidate_tags, normalize_epc
+
+from .codec import acs_status_response, sip2_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Most items listed in one 64 response; kiosks page through longer lists
+# with BP/BQ. Keeps responses small however many loans a patron has.
+MAX_ITEMS_PER_RESPONSE = 20
+
+# Positions in the 63 summary field, and the 64 field each list goes in
+SUMMARY_OVERDUE = 1
+SUMMARY_CHARGED = 2
+
+# Requests a CirculationSession answers (97 is handled by the server)
+SUPPORTED_MESSAGES = {"09", "11", "23", "63", "93", "97", "99"}
+
+
+class SIP2Circulation:
+    """Handler factory for AsyncSIP2Server that runs real circulation.
+
+    Checkouts (11), checkins (09), patron status (23) and patron information
+    (63) are answered from the Book/User tables using the same atomic rules
+    as the JSON API, and SC Status (99) heartbeats with an ACS Status (98).
+    Items are identified by ISBN or by the EPC of their RFID tag, and
+    patrons by username. Each connection gets a CirculationSession holding
+    its database session and login state.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        loan_days=DEFAULT_LOAN_DAYS,
+        require_login=True,
+        max_items=MAX_ITEMS_PER_RESPONSE,
+    ):
+        self.session_factory = session_factory
+        self.loan_days = loan_days
+        self.require_login = require_login
+        self.max_items = max_items
+
+    def __call__(self):
+        return CirculationSession(self)
+
+
+class CirculationSession:
+    """State for one SIP2 connection.
+
+    The database session is opened on first use and kept for the life of
+    the connection, and patron ids are cached after their first lookup, so
+    a checkout or checkin costs a single UPDATE ... RETURNING.
+    """
+
+    def __init__(self, circulation):
+        self.circulation = circulation
+        self._db = None
+        self.login_user = None  # CN of a successful 93 Login
+        self.patron_ids = {}  # username -> users.id
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = self.circulation.session_factory()
+        return self._db
+
+    @property
+    def logged_in(self):
+        return self.login_user is not None or not self.circulation.require_login
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __call__(self, message):
+        handler = {
+            "93": self.login,
+            "11": self.checkout,
+            "09": self.checkin,
+            "23": self.patron_status,
+            "63": self.patron_information,
+            "99": self.sc_status,
+        }.get(message.code)
+        if handler is None:
+            logger.warning("Unhandled SIP2 command: %s", message.code)
+            return None
+
+        try:
+            return handler(message)
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error("Database error handling SIP2 %s: %s", message.code, e)
+            return None
+
+    def patron_id(self, username):
+        """Looks up a patron's user id, caching it for this connection."""
+        if username not in self.patron_ids:
+            user_id = self.db.query(DBUser.id).filter(DBUser.username == username).scalar()
+            if user_id is None:
+                return None
+            self.patron_ids[username] = user_id
+        return self.patron_ids[username]
+
+    def circulate(self, operation, item, *args):
+        """Runs circulation.checkout/checkin on the item an AB field names.
+
+        EPCs resolve through tags.tag_cache. A miss through a cached entry is
+        retried once from the database, in case another process moved the tag.
+        """
+        epc = normalize_epc(item)
+        if epc is None:
+            return operation(self.db, DBBook.isbn == item, *args)
+        try:
+            return operation(self.db, book_filter_for_tag(self.db, epc), *args)
+        except BookNotFoundError:
+            invalidate_tags([epc])
+            return operation(self.db, book_filter_for_tag(self.db, epc), *args)
+
+    def login(self, message):
+        username, password = message.get("CN", ""), message.get("CO", "")
+        user = self.db.query(DBUser).filter(DBUser.username == username).first()
+        self.db.rollback()  # End the read transaction; nothing to commit
+        ok = user is not None and verify_password(password, user.hashed_password)
+        self.login_user = username if ok else None
+        if ok:
+            self.patron_ids[user.username] = user.id
+        return message.response("94", {"ok": ok})
+
+    def sc_status(self, message):
+        """Answers the kiosk's 99 heartbeat without touching the database."""
+        return acs_status_response(message, SUPPORTED_MESSAGES)
+
+    def checkout(self, message):
+        patron, item = message.get("AA", ""), message.get("AB", "")
+        fields = [("AO", message.get("AO", "")), ("AA", patron), ("AB", item)]
+        fixed = {"magnetic_media": "U", "transaction_date": sip2_timestamp()}
+        if not self.logged_in:
+            error = "Terminal not logged in"
+        elif (patron_id := self.patron_id(patron)) is None:
+            error = "Unknown patron"
+        else:
+            try:
+                book = self.circulate(checkout, item, patron_id, self.circulation.loan_days)
+            except CirculationError as e:
+                self.db.rollback()
+                error = str(e)
+            else:
+                self.db.commit()
+                fixed.update(ok=True, desensitize="Y")
+                fields += [("AJ", book.title), ("AH", book.due_date.isoformat())]
+                return message.response("12", fixed, fields)
+        fixed["desensitize"] = "N"
+        return message.response("12", fixed, fields + [("AF", error)])
+
+    def checkin(self, message):
+        item = message.get("AB", "")
+        fields = [("AO", message.get("AO", "")), ("AB", item), ("AQ", "")]
+        fixed = {"magnetic_media": "U", "transaction_date": sip2_timestamp()}
+        if not self.logged_in:
+            error = "Terminal not logged in"
+        else:
+            try:
+                book = self.circulate(checkin, item)
+            except CirculationError as e:
+                self.db.rollback()
+                error = str(e)
+            else:
+                self.db.commit()
+                fixed.update(ok=True, resensitize=True)
+                return message.response("10", fixed, fields + [("AJ", book.title)])
+        fixed["alert"] = True
+        return message.response("10", fixed, fields + [("AF", error)])
+
+    def patron_status(self, message):
+        patron = message.get("AA", "")
+        valid = self.logged_in and self.patron_id(patron) is not None
+        self.db.rollback()  # End the read transaction, if any
+        # Patron status flags all clear, language 001 (English)
+        fixed = {"language": "001", "transaction_date": sip2_timestamp()}
+        fields = [("AO", message.get("AO", "")), ("AA", patron), ("AE", patron), ("BL", "Y" if valid else "N")]
+        return message.response("24", fixed, fields)
+
+    def patron_information(self, message):
+        """63 Patron Information: loan counts, plus one page of one item list.
+
+        The summary field picks the list (charged or overdue items) and BP/BQ
+        the 1-based range of it to return, capped at max_items. Counts and
+        lists come from the (borrower_id, due_date) index.
+        """
+        patron = message.get("AA", "")
+        patron_id = self.patron_id(patron) if self.logged_in else None
+        fixed = {"language": "001", "transaction_date": sip2_timestamp()}
+        fields = [("AO", message.get("AO", "")), ("AA", patron)]
+        if patron_id is None:
+            self.db.rollback()
+            fixed["patron_status"] = "Y" * 4  # Charge, renewal, recall and hold privileges denied
+            return message.response("64", fixed, fields + [("AE", ""), ("BL", "N")])
+
+        today = date.today()
+        charged, overdue = (
+            self.db.query(func.count(), func.sum(case((DBBook.due_date < today, 1), else_=0)))
+            .filter(DBBook.borrower_id == patron_id)
+            .one()
+        )
+        fixed.update(charged_items_count=charged, overdue_items_count=overdue or 0)
+        fields += [("AE", patron), ("BL", "Y")]
+
+        summary = message.fixed.get("summary", "")
+        list_field = None
+        if summary[SUMMARY_OVERDUE : SUMMARY_OVERDUE + 1] == "Y":
+            list_field, only_overdue = "AT", True
+        elif summary[SUMMARY_CHARGED : SUMMARY_CHARGED + 1] == "Y":
+            list_field, only_overdue = "AU", False
+        start, end = self.item_range(message)
+        if list_field and end >= start:
+            query = self.db.query(DBBook.isbn).filter(DBBook.borrower_id == patron_id)
+            if only_overdue:
+                query = query.filter(DBBook.due_date < today)
+            items = query.order_by(DBBook.due_date, DBBook.id).offset(start - 1).limit(end - start + 1)
+            fields += [(list_field, isbn) for (isbn,) in items]
+        self.db.rollback()  # End the read transaction
+        return message.response("64", fixed, fields)
+
+    def item_range(self, message):
+        """The 1-based, inclusive BP/BQ range, clamped to max_items items (empty if BQ < BP)."""
+        try:
+            start = max(1, int(message.get("BP") or 1))
+            end = int(message.get("BQ") or start + self.circulation.max_items - 1)
+        except ValueError:
+            start, end = 1, self.circulation.max_items
+        return start, min(end, start + self.circulation.max_items - 1)
@@ -0,0 +1,331 @@
+"""SIP2 message encoding and decoding.
+
+A SIP2 message is a two-character code, the fixed-length fields for that
+code, variable fields ("AAvalue|"), and, with error detection on, a
+sequence number and checksum ("AY3AZF8D2") before the closing CR. The
+checksum is the 16-bit two's complement of the sum of every byte up to and
+including "AZ", written as four hex digits.
+
+Fixed fields are described by FIXED_FIELDS, so adding a message type is
+one table entry; decode_message() turns a frame (from SIP2Framer) into a
+SIP2Message and encode_message() does the reverse.
+"""
+
+from collections import namedtuple
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+ENCODING = "ascii"
+
+# How fixed field values are typed in a SIP2Message
+TEXT = "text"  # str, padded with spaces
+COUNT = "count"  # int, zero-padded
+YES_NO = "yes_no"  # bool, "Y"/"N"
+ONE_ZERO = "one_zero"  # bool, "1"/"0"
+
+FixedField = namedtuple("FixedField", "name length kind")
+
+
+def _fixed(*fields):
+    return tuple(FixedField(name, length, kind) for name, length, kind in fields)
+
+
+DATE = 18  # "YYYYMMDDZZZZHHMMSS"
+
+MESSAGE_NAMES = {
+    "09": "Checkin",
+    "10": "Checkin Response",
+    "11": "Checkout",
+    "12": "Checkout Response",
+    "17": "Item Information",
+    "18": "Item Information Response",
+    "23": "Patron Status Request",
+    "24": "Patron Status Response",
+    "63": "Patron Information",
+    "64": "Patron Information Response",
+    "93": "Login",
+    "94": "Login Response",
+    "96": "Request SC Resend",
+    "97": "Request ACS Resend",
+    "98": "ACS Status",
+    "99": "SC Status",
+}
+
+FIXED_FIELDS = {
+    "09": _fixed(("no_block", 1, YES_NO), ("transaction_date", DATE, TEXT), ("return_date", DATE, TEXT)),
+    "10": _fixed(
+        ("ok", 1, ONE_ZERO),
+        ("resensitize", 1, YES_NO),
+        ("magnetic_media", 1, TEXT),  # Y, N or U (unknown)
+        ("alert", 1, YES_NO),
+        ("transaction_date", DATE, TEXT),
+    ),
+    "11": _fixed(
+        ("sc_renewal_policy", 1, YES_NO),
+        ("no_block", 1, YES_NO),
+        ("transaction_date", DATE, TEXT),
+        ("nb_due_date", DATE, TEXT),
+    ),
+    "12": _fixed(
+        ("ok", 1, ONE_ZERO),
+        ("renewal_ok", 1, YES_NO),
+        ("magnetic_media", 1, TEXT),
+        ("desensitize", 1, TEXT),  # Y, N or U
+        ("transaction_date", DATE, TEXT),
+    ),
+    "17": _fixed(("transaction_date", DATE, TEXT)),
+    "18": _fixed(
+        ("circulation_status", 2, TEXT),
+        ("security_marker", 2, TEXT),
+        ("fee_type", 2, TEXT),
+        ("transaction_date", DATE, TEXT),
+    ),
+    "23": _fixed(("language", 3, TEXT), ("transaction_date", DATE, TEXT)),
+    "24": _fixed(("patron_status", 14, TEXT), ("language", 3, TEXT), ("transaction_date", DATE, TEXT)),
+    "63": _fixed(("language", 3, TEXT), ("transaction_date", DATE, TEXT), ("summary", 10, TEXT)),
+    "64": _fixed(
+        ("patron_status", 14, TEXT),
+        ("language", 3, TEXT),
+        ("transaction_date", DATE, TEXT),
+        ("hold_items_count", 4, COUNT),
+        ("overdue_items_count", 4, COUNT),
+        ("charged_items_count", 4, COUNT),
+        ("fine_items_count", 4, COUNT),
+        ("recall_items_count", 4, COUNT),
+        ("unavailable_holds_count", 4, COUNT),
+    ),
+    "93": _fixed(("uid_algorithm", 1, TEXT), ("pwd_algorithm", 1, TEXT)),
+    "94": _fixed(("ok", 1, ONE_ZERO)),
+    "96": (),
+    "97": (),
+    "98": _fixed(
+        ("online_status", 1, YES_NO),
+        ("checkin_ok", 1, YES_NO),
+        ("checkout_ok", 1, YES_NO),
+        ("acs_renewal_policy", 1, YES_NO),
+        ("status_update_ok", 1, YES_NO),
+        ("offline_ok", 1, YES_NO),
+        ("timeout_period", 3, COUNT),
+        ("retries_allowed", 3, COUNT),
+        ("date_time_sync", DATE, TEXT),
+        ("protocol_version", 4, TEXT),
+    ),
+    "99": _fixed(("status_code", 1, TEXT), ("max_print_width", 3, COUNT), ("protocol_version", 4, TEXT)),
+}
+
+# Message codes in the order of the 98 ACS Status "supported messages"
+# (BX) field: one Y or N per position. 99/98 and 97/96 share a position.
+SUPPORTED_MESSAGES_ORDER = (
+    ("23",),
+    ("11",),
+    ("09",),
+    ("01",),
+    ("99", "98"),
+    ("97", "96"),
+    ("93",),
+    ("63",),
+    ("35",),
+    ("37",),
+    ("17",),
+    ("19",),
+    ("25",),
+    ("15",),
+    ("29",),
+    ("65",),
+)
+
+# Field separators cannot appear inside a value
+_SEPARATORS = str.maketrans({"|": " ", "\r": " "})
+
+
+class SIP2DecodeError(ValueError):
+    """The frame is not a valid SIP2 message."""
+
+
+class ChecksumError(SIP2DecodeError):
+    """The message's AZ checksum does not match its contents.
+
+    The receiver should ask for the message again (96 or 97).
+    """
+
+    def __init__(self, message):
+        self.message = message  # What was decoded, for its sequence number
+        super().__init__("Checksum mismatch")
+
+
+def checksum(data):
+    """SIP2 checksum of `data` (bytes up to and including "AZ")."""
+    return f"{-sum(data) & 0xFFFF:04X}"
+
+
+def sip2_timestamp(when=None):
+    """SIP2 18-character date: YYYYMMDD, four spaces (local time zone), HHMMSS."""
+    return (when or datetime.now()).strftime("%Y%m%d    %H%M%S")
+
+
+@dataclass
+class SIP2Message:
+    """One SIP2 message.
+
+    `fixed` maps the FIXED_FIELDS names for `code` to typed values; fields
+    left out are sent as spaces, zeros or "N". `fields` lists the variable
+    fields as (field id, value) pairs in wire order, since some (screen
+    messages, item lists) may repeat.
+    """
+
+    code: str
+    fixed: dict = field(default_factory=dict)
+    fields: list = field(default_factory=list)
+    sequence_number: Optional[int] = None  # AY; None when not sent
+    checksum: Optional[str] = None  # AZ of a decoded message
+
+    @property
+    def name(self):
+        return MESSAGE_NAMES.get(self.code, f"Message {self.code}")
+
+    def get(self, field_id, default=None):
+        """Value of the first `field_id` variable field."""
+        for key, value in self.fields:
+            if key == field_id:
+                return value
+        return default
+
+    def get_all(self, field_id):
+        """Values of every `field_id` variable field, in order."""
+        return [value for key, value in self.fields if key == field_id]
+
+    def response(self, code, fixed=None, fields=()):
+        """A reply to this message, echoing its sequence number."""
+        return SIP2Message(code, fixed or {}, list(fields), self.sequence_number)
+
+
+def supported_messages(codes):
+    """The 16-character BX field advertising the request codes in `codes`."""
+    return "".join("Y" if codes.intersection(position) else "N" for position in SUPPORTED_MESSAGES_ORDER)
+
+
+def acs_status_response(
+    message,
+    supported,
+    institution="",
+    library_name="",
+    checkin_ok=True,
+    checkout_ok=True,
+    timeout_period=0,
+    retries_allowed=3,
+):
+    """The 98 ACS Status answering a 99 SC Status heartbeat.
+
+    `supported` is the set of request codes the ACS handles; timeout_period
+    is in tenths of a second (0: no timeout).
+    """
+    fixed = {
+        "online_status": True,
+        "checkin_ok": checkin_ok,
+        "checkout_ok": checkout_ok,
+        "acs_renewal_policy": False,
+        "status_update_ok": False,
+        "offline_ok": False,
+        "timeout_period": timeout_period,
+        "retries_allowed": retries_allowed,
+        "date_time_sync": sip2_timestamp(),
+        "protocol_version": "2.00",
+    }
+    fields = [("AO", institution), ("AM", library_name), ("BX", supported_messages(set(supported)))]
+    return message.response("98", fixed, fields)
+
+
+def _count(text):
+    return int(text) if text.isdigit() else 0
+
+
+# Text conversions per fixed field kind; TEXT values are used as they are
+_DECODERS = {TEXT: None, COUNT: _count, YES_NO: "Y".__eq__, ONE_ZERO: "1".__eq__}
+_ENCODERS = {
+    TEXT: lambda value, length: (value or "").ljust(length),
+    COUNT: lambda value, length: str(value or 0).zfill(length),
+    YES_NO: lambda value, length: "Y" if value else "N",
+    ONE_ZERO: lambda value, length: "1" if value else "0",
+}
+
+
+def _layout(specs):
+    """(name, start, end, decoder, encoder, length) for each fixed field of a message."""
+    layout, position = [], 2
+    for spec in specs:
+        layout.append(
+            (spec.name, position, position + spec.length, _DECODERS[spec.kind], _ENCODERS[spec.kind], spec.length)
+        )
+        position += spec.length
+    return tuple(layout), position
+
+
+# Offsets and converters worked out once per message code, not per message
+_LAYOUTS = {code: _layout(specs) for code, specs in FIXED_FIELDS.items()}
+_NO_FIXED_FIELDS = ((), 2)
+
+
+def encode_fixed(code, values):
+    parts = []
+    for name, _, _, _, encoder, length in _LAYOUTS.get(code, _NO_FIXED_FIELDS)[0]:
+        text = encoder(values.get(name), length)
+        if len(text) != length:
+            raise ValueError(f"{name} must be {length} characters, got {text!r}")
+        parts.append(text)
+    return "".join(parts)
+
+
+def encode_message(message, error_detection=True):
+    """Encodes a SIP2Message as bytes, including the CR."""
+    parts = [message.code, encode_fixed(message.code, message.fixed)]
+    for field_id, value in message.fields:
+        value = str(value)
+        if "|" in value or "\r" in value:  # Rare; skip translate() otherwise
+            value = value.translate(_SEPARATORS)
+        parts.append(f"{field_id}{value}|")
+    if error_detection:
+        if message.sequence_number is not None:
+            parts.append(f"AY{message.sequence_number}")
+        parts.append("AZ")
+        data = "".join(parts).encode(ENCODING, "replace")
+        return data + checksum(data).encode(ENCODING) + b"\r"
+    return "".join(parts).encode(ENCODING, "replace") + b"\r"
+
+
+def decode_message(frame):
+    """Decodes one message (code through checksum, no CR) into a SIP2Message.
+
+    Raises SIP2DecodeError for malformed frames and ChecksumError when the
+    AZ checksum is present but wrong.
+    """
+    text = str(frame, ENCODING, "replace")
+    if len(text) < 2:
+        raise SIP2DecodeError("Too short")
+    message = SIP2Message(text[:2])
+
+    end = len(text)
+    checksum_ok = True
+    if end >= 6 and text[end - 6 : end - 4] == "AZ":
+        message.checksum = text[end - 4 :]
+        checksum_ok = message.checksum.upper() == checksum(bytes(frame[: end - 4]))
+        end -= 6
+    if end >= 3 and text[end - 3 : end - 1] == "AY" and text[end - 1].isdigit():
+        message.sequence_number = int(text[end - 1])
+        end -= 3
+
+    layout, position = _LAYOUTS.get(message.code, _NO_FIXED_FIELDS)
+    if position > end:
+        raise SIP2DecodeError(f"Message {message.code} is too short for its fixed fields")
+    fixed = message.fixed
+    for name, start, stop, decoder, _, _ in layout:
+        value = text[start:stop]
+        fixed[name] = decoder(value) if decoder else value
+
+    for part in text[position:end].split("|"):
+        if len(part) >= 2:
+            message.fields.append((part[:2], part[2:]))
+
+    if not checksum_ok:
+        raise ChecksumError(message)
+    return message
@@ -0,0 +1,163 @@
+"""Incremental, zero-copy splitting of a SIP2 byte stream into messages.
+
+SIP2 messages end with a carriage return. Some clients (including older
+versions of this package) also put a four-digit total length in front of
+each message; real self-check machines usually do not. The framer
+understands both.
+
+Usage with a socket:
+
+    framer = SIP2Framer()
+    nbytes = sock.recv_into(framer.get_buffer())
+    framer.buffer_updated(nbytes)
+    for frame in framer.frames():
+        message = decode_message(frame)
+
+or with bytes from elsewhere, `framer.feed(data)`. get_buffer() and
+buffer_updated() follow asyncio.BufferedProtocol, so a framer can back one.
+"""
+
+AUTO = "auto"  # Length prefix when present and consistent, else up to CR
+LENGTH_PREFIXED = "length"  # Always a four-digit length prefix
+CR_TERMINATED = "cr"  # No length prefix; frames end at the first CR
+
+CR = 0x0D
+LF = 0x0A
+PREFIX_SIZE = 4
+READ_SIZE = 64 * 1024
+
+# Message code, plus prefix and CR
+MIN_PREFIXED_LENGTH = PREFIX_SIZE + 2 + 1
+
+
+class SIP2Framer:
+    """Splits a byte stream into SIP2 messages, tracking an offset into one buffer.
+
+    frames() yields a memoryview of each complete message, from its message
+    code up to the end of its checksum (no length prefix, no CR). The views
+    point into the framer's buffer and are only valid until the next
+    get_buffer() or feed() call; use bytes(frame) to keep one longer.
+
+    Malformed input (a length prefix that does not end at a CR, in
+    LENGTH_PREFIXED mode) is skipped up to the next CR and counted in
+    `errors`. Data without any CR is kept until more arrives; callers should
+    drop the connection if `pending` grows past what they are willing to
+    buffer.
+    """
+
+    def __init__(self, mode=AUTO, max_message_size=64 * 1024):
+        if mode not in (AUTO, LENGTH_PREFIXED, CR_TERMINATED):
+            raise ValueError(f"Unknown framing mode: {mode!r}")
+        self.mode = mode
+        self.max_message_size = max_message_size
+        self._buffer = bytearray(READ_SIZE)
+        self._start = 0  # First unconsumed byte
+        self._end = 0  # End of received data
+        self.frames_total = 0
+        self.errors = 0
+        self.bytes_discarded = 0
+
+    @property
+    def pending(self):
+        """Bytes received but not yet returned as part of a frame."""
+        return self._end - self._start
+
+    def get_buffer(self, sizehint=-1):
+        """Returns a writable view of at least `sizehint` free bytes."""
+        if sizehint <= 0:
+            sizehint = READ_SIZE
+        self._make_room(sizehint)
+        return memoryview(self._buffer)[self._end :]
+
+    def buffer_updated(self, nbytes):
+        """Records that `nbytes` were written into the last get_buffer() view."""
+        self._end += nbytes
+
+    def feed(self, data):
+        """Appends received bytes (one copy, into the framer's buffer)."""
+        size = len(data)
+        self.get_buffer(size)[:size] = data
+        self.buffer_updated(size)
+
+    def _make_room(self, size):
+        buffer = self._buffer
+        pending = self._end - self._start
+        if pending + size > len(buffer):
+            # Grow into a new buffer, keeping only the unconsumed bytes. The
+            # old one is left alone, so views a caller still holds stay
+            # intact (and a bytearray with exported views cannot be resized).
+            new_buffer = bytearray(max(2 * len(buffer), pending + size))
+            new_buffer[:pending] = buffer[self._start : self._end]
+            self._buffer = new_buffer
+        elif self._start == self._end:
+            self._start = self._end = 0
+            return
+        elif self._start >= len(buffer) // 2 or self._end + size > len(buffer):
+            # Move the partial message to the front. Same-size slice
+            # assignment never resizes, so this is legal with views exported.
+            buffer[:pending] = buffer[self._start : self._end]
+        else:
+            return
+        self._start, self._end = 0, pending
+
+    def frames(self):
+        """Yields each complete message received so far, in order."""
+        buffer = self._buffer
+        view = memoryview(buffer)
+        try:
+            while self._start < self._end:
+                start, end = self._start, self._end
+                if buffer[start] == LF:
+                    self._start += 1  # Tolerate CRLF line endings
+                    continue
+
+                if self.mode == LENGTH_PREFIXED:
+                    frame_end = self._prefixed_frame_end(buffer, start, end)
+                    if frame_end is None:
+                        return  # Wait for the rest of the message
+                    if frame_end < 0:
+                        self._skip_garbled(buffer, start, end)
+                        continue
+                    frame = view[start + PREFIX_SIZE : frame_end]
+                else:
+                    cr = buffer.find(b"\r", start, end)
+                    if cr < 0:
+                        return
+                    frame_end = cr
+                    body_start = start
+                    if self.mode == AUTO and self._declared_length(buffer, start) == cr - start + 1:
+                        body_start += PREFIX_SIZE
+                    frame = view[body_start:frame_end]
+
+                self._start = frame_end + 1
+                self.frames_total += 1
+                yield frame
+        finally:
+            view.release()
+
+    def _declared_length(self, buffer, start):
+        prefix = buffer[start : start + PREFIX_SIZE]
+        if len(prefix) == PREFIX_SIZE and prefix.isdigit():
+            return int(prefix)
+        return None
+
+    def _prefixed_frame_end(self, buffer, start, end):
+        """Index of the frame's CR; None if incomplete, -1 if garbled."""
+        if end - start < PREFIX_SIZE:
+            return None
+        declared = self._declared_length(buffer, start)
+        if declared is None or not MIN_PREFIXED_LENGTH <= declared <= self.max_message_size:
+            return -1
+        # SIP2 messages never contain a CR, so one before the declared end
+        # means the prefix is wrong; look no further than the declared end.
+        cr = buffer.find(b"\r", start, min(end, start + declared))
+        if cr < 0:
+            return None if end - start < declared else -1
+        return cr if cr == start + declared - 1 else -1
+
+    def _skip_garbled(self, buffer, start, end):
+        cr = buffer.find(b"\r", start, end)
+        skip_to = end if cr < 0 else cr + 1
+        self.errors += 1
+        self.bytes_discarded += skip_to - start
+        self._start = skip_to
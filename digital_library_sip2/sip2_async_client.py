@@ -0,0 +1,314 @@
+"""asyncio SIP2 client with a pool of logged-in, pipelined connections.
+
+Each connection keeps up to ten requests in flight and matches responses to
+requests by their AY sequence number, so a single ACS connection is not
+idle while it waits for a reply. Connections log in (93) when they are
+opened and are reopened, and logged in again, when they drop.
+
+    async with SIP2ClientPool("acs.example.org", 6001, username="sc", password="pw") as pool:
+        statuses = await asyncio.gather(*(pool.patron_status(p) for p in patrons))
+"""
+
+import asyncio
+import dataclasses
+import itertools
+from collections import deque
+
+from .codec import ChecksumError, SIP2DecodeError, SIP2Message, decode_message, encode_message, sip2_timestamp
+from .framer import SIP2Framer
+
+READ_SIZE = 64 * 1024
+SEQUENCE_NUMBERS = 10  # AY is a single digit
+
+# Requests that change nothing on the ACS, so they can safely be sent again
+# after a connection drops with them unanswered.
+IDEMPOTENT_CODES = {"17", "23", "63", "93", "99"}
+
+
+class SIP2ConnectionError(ConnectionError):
+    """The connection failed; `sent` says whether the request reached the ACS."""
+
+    def __init__(self, message, sent=False):
+        super().__init__(message)
+        self.sent = sent
+
+
+class SIP2TimeoutError(SIP2ConnectionError):
+    """No response arrived in time (the connection is closed and reopened)."""
+
+
+class SIP2LoginError(Exception):
+    """The ACS rejected the 93 Login."""
+
+
+class SIP2Connection:
+    """One ACS connection with pipelined requests.
+
+    Use through SIP2ClientPool, or directly with `await connection.request(msg)`;
+    the connection is opened (and logged in) on first use and after it drops.
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        username=None,
+        password=None,
+        location="",
+        timeout=5.0,
+        max_in_flight=SEQUENCE_NUMBERS,
+    ):
+        if not 1 <= max_in_flight <= SEQUENCE_NUMBERS:
+            raise ValueError(f"max_in_flight must be between 1 and {SEQUENCE_NUMBERS}")
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.location = location
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._connect_lock = asyncio.Lock()
+        self._sequence = itertools.cycle(range(SEQUENCE_NUMBERS))
+        self._pending = {}  # Sequence number -> future for its response
+        self._order = deque()  # Sequence numbers in the order they were sent
+        self._writer = None
+        self._reader_task = None
+        self._ready = False  # Connected and logged in
+        self.load = 0  # Requests waiting for a slot, in flight or reconnecting
+        self.connects = 0
+        self.requests_sent = 0
+
+    @property
+    def connected(self):
+        return self._ready
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self._ready:
+                return
+            try:
+                reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                raise SIP2ConnectionError(f"Could not connect to {self.host}:{self.port}: {e!r}") from e
+            self.connects += 1
+            # Fresh bookkeeping per connection, so the old connection's reader
+            # shutting down late cannot fail requests on the new one.
+            self._pending, self._order = {}, deque()
+            self._reader_task = asyncio.create_task(
+                self._read_responses(reader, self._writer, self._pending, self._order)
+            )
+            if self.username is not None:
+                login = SIP2Message(
+                    "93",
+                    {"uid_algorithm": "0", "pwd_algorithm": "0"},
+                    [("CN", self.username), ("CO", self.password or ""), ("CP", self.location)],
+                )
+                response = await self._send(login)
+                if not response.fixed.get("ok"):
+                    self.close()
+                    raise SIP2LoginError(f"Login as {self.username!r} rejected")
+            self._ready = True
+
+    async def request(self, message):
+        """Sends a SIP2Message and returns the response SIP2Message."""
+        self.load += 1
+        try:
+            await self.connect()
+            return await self._send(message)
+        finally:
+            self.load -= 1
+
+    async def _send(self, message):
+        async with self._slots:
+            writer, pending, order = self._writer, self._pending, self._order
+            if writer is None or writer.is_closing():
+                raise SIP2ConnectionError("Connection closed")
+            sequence_number = next(number for number in self._sequence if number not in pending)
+            future = asyncio.get_running_loop().create_future()
+            pending[sequence_number] = future
+            order.append(sequence_number)
+            writer.write(encode_message(dataclasses.replace(message, sequence_number=sequence_number)))
+            self.requests_sent += 1
+            try:
+                await writer.drain()
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                # A late response could be matched to a reused sequence
+                # number, so give up on this connection altogether.
+                self.close()
+                raise SIP2TimeoutError(f"No response to {message.name} in {self.timeout}s", sent=True) from None
+            except OSError as e:
+                raise SIP2ConnectionError(f"Connection lost: {e!r}", sent=True) from e
+            finally:
+                del pending[sequence_number]
+                order.remove(sequence_number)
+
+    async def _read_responses(self, reader, writer, pending, order):
+        framer = SIP2Framer()
+        error = SIP2ConnectionError("Connection closed by the ACS", sent=True)
+        try:
+            while data := await reader.read(READ_SIZE):
+                framer.feed(data)
+                for frame in framer.frames():
+                    self._dispatch(frame, pending, order)
+        except (OSError, SIP2DecodeError) as e:
+            error = SIP2ConnectionError(f"Connection lost: {e!r}", sent=True)
+        finally:
+            if writer is self._writer:
+                self._ready = False
+            writer.close()
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    def _dispatch(self, frame, pending, order):
+        try:
+            response = decode_message(frame)
+        except ChecksumError as e:
+            # With several requests in flight a 97 (resend) is ambiguous;
+            # fail the request and let the caller decide whether to retry.
+            future = pending.get(e.message.sequence_number)
+            if future is not None and not future.done():
+                future.set_exception(e)
+            return
+        sequence_number = response.sequence_number
+        if sequence_number not in pending:
+            if not order:
+                return  # Nothing is waiting for it
+            sequence_number = order[0]  # No AY: replies come in order
+        future = pending[sequence_number]
+        if not future.done():
+            future.set_result(response)
+
+    def close(self):
+        self._ready = False
+        if self._writer is not None:
+            self._writer.close()
+
+    async def wait_closed(self):
+        self.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+class SIP2ClientPool:
+    """A pool of SIP2Connections that spreads requests over the least busy one.
+
+    Requests that fail because a connection dropped are retried on a fresh
+    connection, up to `retries` times, when it is safe: if the request never
+    reached the ACS, or if it is read-only (IDEMPOTENT_CODES).
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        size=4,
+        username=None,
+        password=None,
+        location="",
+        institution="",
+        timeout=5.0,
+        max_in_flight=SEQUENCE_NUMBERS,
+        retries=2,
+        retry_delay=0.1,
+    ):
+        self.institution = institution
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.connections = [
+            SIP2Connection(host, port, username, password, location, timeout, max_in_flight) for _ in range(size)
+        ]
+        self.retried = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        """Opens and logs in every connection up front."""
+        await asyncio.gather(*(connection.connect() for connection in self.connections))
+
+    async def close(self):
+        await asyncio.gather(*(connection.wait_closed() for connection in self.connections))
+
+    def stats(self):
+        return {
+            "connections": len(self.connections),
+            "connected": sum(connection.connected for connection in self.connections),
+            "in_flight": sum(connection.in_flight for connection in self.connections),
+            "connects": sum(connection.connects for connection in self.connections),
+            "requests_sent": sum(connection.requests_sent for connection in self.connections),
+            "retried": self.retried,
+        }
+
+    async def request(self, message):
+        """Sends a SIP2Message on the least busy connection and returns the response."""
+        for attempt in itertools.count():
+            connection = min(self.connections, key=lambda c: c.load)
+            try:
+                return await connection.request(message)
+            except SIP2ConnectionError as e:
+                if attempt >= self.retries or (e.sent and message.code not in IDEMPOTENT_CODES):
+                    raise
+            self.retried += 1
+            await asyncio.sleep(self.retry_delay * 2**attempt)
+
+    def patron_status(self, patron, institution=None):
+        return self.request(patron_status_request(patron, self._institution(institution)))
+
+    def checkout(self, patron, item, institution=None):
+        return self.request(checkout_request(patron, item, self._institution(institution)))
+
+    def checkin(self, item, institution=None):
+        return self.request(checkin_request(item, self._institution(institution)))
+
+    def item_information(self, item, institution=None):
+        return self.request(item_information_request(item, self._institution(institution)))
+
+    def patron_information(self, patron, summary="", start=None, end=None, institution=None):
+        return self.request(patron_information_request(patron, self._institution(institution), summary, start, end))
+
+    def _institution(self, institution):
+        return self.institution if institution is None else institution
+
+
+def patron_status_request(patron, institution=""):
+    fixed = {"language": "001", "transaction_date": sip2_timestamp()}
+    return SIP2Message("23", fixed, [("AO", institution), ("AA", patron), ("AC", ""), ("AD", "")])
+
+
+def checkout_request(patron, item, institution=""):
+    fixed = {"transaction_date": sip2_timestamp()}
+    return SIP2Message("11", fixed, [("AO", institution), ("AA", patron), ("AB", item), ("AC", "")])
+
+
+def checkin_request(item, institution=""):
+    now = sip2_timestamp()
+    fixed = {"transaction_date": now, "return_date": now}
+    return SIP2Message("09", fixed, [("AP", ""), ("AO", institution), ("AB", item), ("AC", "")])
+
+
+def item_information_request(item, institution=""):
+    fixed = {"transaction_date": sip2_timestamp()}
+    return SIP2Message("17", fixed, [("AO", institution), ("AB", item)])
+
+
+def patron_information_request(patron, institution="", summary="", start=None, end=None):
+    """63 Patron Information; `summary` "  Y" asks for charged items, " Y" for overdue ones."""
+    fixed = {"language": "001", "transaction_date": sip2_timestamp(), "summary": summary}
+    fields = [("AO", institution), ("AA", patron)]
+    if start is not None:
+        fields.append(("BP", str(start)))
+    if end is not None:
+        fields.append(("BQ", str(end)))
+    return SIP2Message("63", fixed, fields)
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from digital_library_api.log import configure_logging, connection_id, dropped_records, sampled
+
+from .framer import SIP2Framer
+from .codec import ENCODING, ChecksumError, SIP2DecodeError, SIP2Message, decode_message, encode_message
+from .sip2_mock_server import generate_mock_response
+
+READ_SIZE = 64 * 1024
+
+# Longest message we accept before giving up on a client; real SIP2 messages
+# are a few hundred bytes.
+MAX_MESSAGE_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+# Every message received and sent, when verbose; subject to the log sample rate
+message_logger = logging.getLogger("digital_library_sip2.messages")
+
+
+class ClientConnection:
+    """Bookkeeping for one connected client."""
+
+    def __init__(self, writer, id):
+        self.id = id
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.connected_at = time.monotonic()
+        self.last_activity = self.connected_at
+        self.messages = 0
+        self.heartbeats = 0  # 99 SC Status
+        self.last_response = None  # For 97 Request ACS Resend
+        self.reaped = False  # Closed by the idle reaper
+
+    def info(self, now):
+        return {
+            "id": self.id,
+            "addr": f"{self.addr[0]}:{self.addr[1]}" if self.addr else None,
+            "connected_seconds": round(now - self.connected_at, 3),
+            "idle_seconds": round(now - self.last_activity, 3),
+            "messages": self.messages,
+            "heartbeats": self.heartbeats,
+        }
+
+
+class AsyncSIP2Server:
+    """asyncio SIP2 server: one coroutine per connection instead of one thread.
+
+    Idle self-check machines cost a socket and a small coroutine frame, so a
+    single process can hold thousands of long-lived connections. Kiosks keep
+    their connection alive with 99 SC Status heartbeats; a reaper task closes
+    connections that have sent nothing for `idle_timeout` seconds, so dead
+    kiosks do not hold sockets and database sessions, and TCP keepalive
+    catches peers that vanished without closing.
+
+    `handler_factory` is called once per connection and returns the callable
+    that answers that connection's messages: it takes a decoded SIP2Message
+    and returns the response SIP2Message or None. It may keep per-connection
+    state and may have a close() method. The default answers with the same canned
+    responses as the threaded MockSIP2Server. Handlers that block, such as
+    database-backed ones, should be given `workers` > 0 so they run in a
+    thread pool instead of on the event loop.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=6000,
+        handler_factory=lambda: generate_mock_response,
+        backlog=128,
+        max_connections=1024,
+        idle_timeout=300.0,
+        workers=0,
+        reuse_port=False,
+        verbose=False,
+    ):
+        self.host = host
+        self.port = port
+        self.handler_factory = handler_factory
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout  # Seconds; None disables it
+        self.reuse_port = reuse_port  # Share the port with other processes (see sip2_multiproc)
+        self.verbose = verbose  # Log every message (sampled), like MockSIP2Server
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="sip2-db") if workers else None
+        self._server = None
+        self._reaper = None
+        self._connections = {}  # StreamWriter -> ClientConnection
+        self._connection_ids = itertools.count(1)
+        self._tasks = set()  # Connection handler tasks, awaited on stop()
+        self.connections_total = 0
+        self.connections_peak = 0
+        self.connections_rejected = 0
+        self.idle_disconnects = 0
+        self.messages_handled = 0
+        self.heartbeats = 0
+
+    @property
+    def connections_active(self):
+        return len(self._connections)
+
+    def stats(self, connections=False):
+        """Server counters; with `connections`, also one entry per client."""
+        stats = {
+            "connections_active": self.connections_active,
+            "connections_peak": self.connections_peak,
+            "connections_total": self.connections_total,
+            "connections_rejected": self.connections_rejected,
+            "idle_disconnects": self.idle_disconnects,
+            "messages_handled": self.messages_handled,
+            "heartbeats": self.heartbeats,
+            "log_records_dropped": dropped_records(),
+        }
+        if connections:
+            now = time.monotonic()
+            stats["connections"] = [connection.info(now) for connection in self._connections.values()]
+        return stats
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection,
+            self.host,
+            self.port,
+            backlog=self.backlog,
+            reuse_port=self.reuse_port or None,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]  # Resolves port 0
+        if self.idle_timeout:
+            self._reaper = asyncio.create_task(self._reap_idle())
+        logger.info("Async SIP2 Server listening on %s:%s", self.host, self.port)
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self, grace=0.0):
+        """Stops accepting, then closes every connection.
+
+        With `grace`, connected clients get that many seconds to finish and
+        disconnect on their own first (used for graceful reloads).
+        """
+        if self._server is None:
+            return
+        self._server.close()
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+        if grace and self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=grace)
+        for writer in list(self._connections):
+            writer.close()
+        # Let handlers see their connection close and finish cleanly
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        logger.info("Async SIP2 Server stopped.")
+
+    async def _reap_idle(self):
+        """Closes connections that have been silent for idle_timeout.
+
+        One periodic sweep instead of a timeout per read keeps the cost of
+        thousands of idle connections to a loop over a dict.
+        """
+        interval = self.idle_timeout / 4
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = time.monotonic() - self.idle_timeout
+            for connection in list(self._connections.values()):
+                if connection.last_activity < cutoff and not connection.reaped:
+                    connection.reaped = True
+                    self.idle_disconnects += 1
+                    logger.info(
+                        "Idle for %ss, disconnecting",
+                        self.idle_timeout,
+                        extra={"connection_id": connection.id},
+                    )
+                    connection.writer.close()  # The handler's read() sees EOF
+
+    async def _handle_connection(self, reader, writer):
+        connection = ClientConnection(writer, next(self._connection_ids))
+        connection_id.set(connection.id)  # This task's context: tags its log records
+        addr = connection.addr
+        if self.connections_active >= self.max_connections:
+            self.connections_rejected += 1
+            logger.warning("Connection from %s rejected: limit of %s reached", addr, self.max_connections)
+            writer.close()
+            return
+
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._connections[writer] = connection
+        self._tasks.add(asyncio.current_task())
+        self.connections_total += 1
+        self.connections_peak = max(self.connections_peak, self.connections_active)
+        logger.info("Client connected: %s", addr)
+        handler = self.handler_factory()
+        framer = SIP2Framer(max_message_size=MAX_MESSAGE_SIZE)
+        try:
+            while data := await reader.read(READ_SIZE):
+                connection.last_activity = time.monotonic()
+
+                # Answer every complete message in this read with a single
+                # write, so pipelined requests cost one drain() per batch.
+                # The frames are views into the framer's buffer, which is
+                # not touched again until the batch has been answered.
+                framer.feed(data)
+                messages = list(framer.frames())
+                if framer.pending > MAX_MESSAGE_SIZE:
+                    logger.warning("Message exceeds %s bytes, disconnecting", MAX_MESSAGE_SIZE)
+                    break
+                if not messages:
+                    continue
+                # Counted here rather than in _respond, which may run on a worker thread
+                heartbeats = sum(frame[:2] == b"99" for frame in messages)
+                connection.heartbeats += heartbeats
+                self.heartbeats += heartbeats
+                responses = await self._run(self._respond_all, connection, handler, messages)
+                connection.messages += len(messages)
+                self.messages_handled += len(messages)
+                if responses:
+                    writer.write(responses)
+                    await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            del self._connections[writer]
+            self._tasks.discard(asyncio.current_task())
+            writer.close()
+            if hasattr(handler, "close"):
+                await self._run(handler.close)
+            logger.info("Client handler closed: %s", addr)
+
+    async def _run(self, function, *args):
+        """Calls function on the worker pool if there is one, else inline."""
+        if self._executor is None:
+            return function(*args)
+        # run_in_executor does not carry context variables (the connection id) over
+        call = functools.partial(contextvars.copy_context().run, function, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def _respond_all(self, connection, handler, frames):
+        """Answers a batch of frames; returns the bytes to send."""
+        responses = []
+        for frame in frames:
+            response = self._respond(connection, handler, frame)
+            if response:
+                responses.append(response)
+                connection.last_response = response
+        return b"".join(responses)
+
+    def _respond(self, connection, handler, frame):
+        try:
+            message = decode_message(frame)
+        except ChecksumError:
+            return encode_message(SIP2Message("96"))  # Ask the client to resend
+        except SIP2DecodeError as e:
+            logger.warning("Error parsing message: %s", e, extra={"raw": bytes(frame)})
+            return None
+        log_message = self.verbose and sampled()
+        if log_message:
+            message_logger.info(
+                "Received %s", bytes(frame).decode(ENCODING, "replace"), extra={"direction": "received"}
+            )
+        if message.code == "97":
+            return connection.last_response
+        response = handler(message)
+        if response is None:
+            return None
+        response = encode_message(response)
+        if log_message:
+            message_logger.info("Sending %s", response.decode(ENCODING).strip(), extra={"direction": "sent"})
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio SIP2 server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6000)
+    parser.add_argument("--backlog", type=int, default=128, help="listen() backlog")
+    parser.add_argument("--max-connections", type=int, default=1024)
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="seconds")
+    parser.add_argument(
+        "--database",
+        action="store_true",
+        help="run real circulation against the library database instead of canned responses",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="database worker threads (with --database)")
+    parser.add_argument("--verbose", action="store_true", help="log every message")
+    parser.add_argument("--log-format", choices=["json", "text"], default="json")
+    parser.add_argument("--log-sample-rate", type=float, default=1.0, help="fraction of messages logged with --verbose")
+    args = parser.parse_args()
+    configure_logging(json_format=args.log_format == "json", sample_rate=args.log_sample_rate)
+
+    if args.database:
+        from .circulation import SIP2Circulation
+
+        handler_options = dict(handler_factory=SIP2Circulation(), workers=args.workers)
+    else:
+        handler_options = {}
+    server = AsyncSIP2Server(
+        args.host,
+        args.port,
+        **handler_options,
+        backlog=args.backlog,
+        max_connections=args.max_connections,
+        idle_timeout=args.idle_timeout,
+        verbose=args.verbose,
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Server shutting down due to KeyboardInterrupt.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
 import socket
 import time
 
+from .codec import (
+    ENCODING,
+    ChecksumError,
+    SIP2DecodeError,
+    SIP2Message,
+    decode_message,
+    encode_message,
+    sip2_timestamp,
+)
+from .framer import SIP2Framer
+
+RESEND_ATTEMPTS = 3
+
 
 # Assume a basic SIP2 client library is available or you build one
 # This is a conceptual example of how a library might be used.
@@ -10,6 +23,7 @@ class SIP2Client:
         self.port = port
         self.sock = None
         self.sequence_number = 0
+        self._framer = SIP2Framer()
 
     def connect(self):
         try:
@@ -27,45 +41,55 @@ class SIP2Client:
             print("Disconnected from SIP2 server.")
         self.sock = None
 
-    def send_message(self, message_code, fields):
-        # This is highly simplified. A real library would handle checksums,
-        # sequence numbers, field formatting (e.g., 'AOusername|')
-        # and message framing (length prefix).
-        self.sequence_number = (self.sequence_number + 1) % 10  # 0-9
-        seq_str = str(self.sequence_number)
-
-        # Build the message string (example for a Login message)
-        # 9300BNusername|COpassword|
-        # A proper library would handle escape characters, etc.
-        sip_message = f"{message_code}"
-        for key, value in fields.items():
-            sip_message += f"{key}{value}|"
+    def send_message(self, message_code, fields, fixed=None):
+        """Sends one message and returns the decoded response (or None).
 
-        # Add sequence number and checksum (crucial for SIP2)
-        # This is a placeholder for actual SIP2 checksum calculation
-        checksum = "0000"  # Placeholder
-        full_message = f"{sip_message}{seq_str}{checksum}\r"  # CR terminator
+        `fields` maps variable field ids to values, e.g. {"CN": "user"};
+        `fixed` maps the message's fixed field names (see codec.FIXED_FIELDS).
+        """
+        self.sequence_number = (self.sequence_number + 1) % 10  # 0-9
+        message = SIP2Message(message_code, fixed or {}, list(fields.items()), self.sequence_number)
+        data = encode_message(message)
 
-        print(f"Sending: {full_message.strip()}")
+        print(f"Sending: {data.decode(ENCODING).strip()}")
         try:
-            self.sock.sendall(full_message.encode("ascii"))
-            response = self.sock.recv(4096).decode("ascii")
-            print(f"Received: {response.strip()}")
-            return response
-        except socket.error as e:
+            self.sock.sendall(data)
+            for _ in range(RESEND_ATTEMPTS + 1):
+                try:
+                    response = decode_message(self._read_frame())
+                except ChecksumError:
+                    # Corrupted in transit: ask the server to send it again
+                    self.sock.sendall(encode_message(SIP2Message("97")))
+                    continue
+                if response.code == "96":  # The server got a corrupted copy
+                    self.sock.sendall(data)
+                    continue
+                print(f"Received: {response.name} {response.fixed} {response.fields}")
+                return response
+            print("Giving up after repeated checksum errors.")
+            return None
+        except (socket.error, SIP2DecodeError) as e:
             print(f"Error sending/receiving SIP2 message: {e}")
             return None
 
+    def _read_frame(self):
+        while True:
+            for frame in self._framer.frames():
+                return bytes(frame)
+            nbytes = self.sock.recv_into(self._framer.get_buffer(4096))
+            if not nbytes:
+                raise socket.error("Connection closed by server")
+            self._framer.buffer_updated(nbytes)
+
     def login(self, username, password):
         # Example of a common SIP2 operation: Login (93)
-        fields = {"BN": username, "CO": password}
-        return self.send_message("93", fields)
+        fields = {"CN": username, "CO": password}
+        return self.send_message("93", fields, {"uid_algorithm": "0", "pwd_algorithm": "0"})
 
-    def patron_status(self, patron_id):
+    def patron_status(self, patron_id, institution=""):
         # Example: Patron Status Request (23)
-        # This needs proper formatting with 'AA' for patron ID
-        fields = {"AA": patron_id}
-        return self.send_message("23", fields)
+        fields = {"AO": institution, "AA": patron_id, "AC": "", "AD": ""}
+        return self.send_message("23", fields, {"language": "001", "transaction_date": sip2_timestamp()})
 
     # ... other SIP2 commands like check-out (11), check-in (09), etc.
 
@@ -79,14 +103,13 @@ if __name__ == "__main__":
     if client.connect():
         # Perform a login (essential for most SIP2 operations)
         login_response = client.login("mylibuser", "mypassword")
-        if login_response and login_response.startswith("94"):  # 94 is Login Response
+        if login_response and login_response.code == "94" and login_response.fixed["ok"]:
             print("Login successful!")
 
             # Example: Get patron status
             patron_response = client.patron_status("12345")
-            # You'd parse patron_response based on SIP2 spec (e.g., 24 message)
-            if patron_response and patron_response.startswith("24"):
-                print("Patron status received.")
+            if patron_response and patron_response.code == "24":
+                print(f"Patron status received: {patron_response.get('AE')}")
         else:
             print("Login failed or unexpected response.")
 
@@ -0,0 +1,224 @@
+"""Load generator that simulates many self-check kiosks against a SIP2 server.
+
+Each kiosk opens its own connection, logs in (93), then sends one request
+at a time from a weighted mix of message types (09, 11, 17, 23, 63),
+pausing for a random think time between them. The report (JSON) gives
+throughput, latency percentiles and error rates per message type:
+
+    python -m digital_library_sip2.sip2_loadgen --port 6000 --kiosks 200 \\
+        --duration 60 --mix 23=50,11=20,09=20,17=10 --think-time 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+
+from .codec import SIP2DecodeError
+from .sip2_async_client import (
+    SIP2Connection,
+    SIP2ConnectionError,
+    SIP2LoginError,
+    checkin_request,
+    checkout_request,
+    item_information_request,
+    patron_information_request,
+    patron_status_request,
+)
+
+DEFAULT_MIX = "23=50,11=20,09=20,17=10"
+SUPPORTED_CODES = {"09", "11", "17", "23", "63"}
+
+
+def parse_mix(text):
+    """Parses "23=50,11=20" into {"23": 50.0, "11": 20.0}."""
+    mix = {}
+    for part in text.split(","):
+        code, _, weight = part.strip().partition("=")
+        if code not in SUPPORTED_CODES:
+            raise ValueError(f"Unsupported message type {code!r}; use {sorted(SUPPORTED_CODES)}")
+        mix[code] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Results:
+    """Latencies and outcomes per message type."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)  # Seconds, successful requests only
+        self.errors = defaultdict(int)  # Timeouts, dropped connections, bad responses
+        self.rejected = defaultdict(int)  # Answered, with the ok flag off
+        self.logins = 0
+        self.login_failures = 0
+
+    def record(self, code, latency=None, ok=True, error=False):
+        if error:
+            self.errors[code] += 1
+            return
+        self.latencies[code].append(latency)
+        if not ok:
+            self.rejected[code] += 1
+
+    def report(self, elapsed, kiosks):
+        by_type = {}
+        for code in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[code])
+            total = len(latencies) + self.errors[code]
+            by_type[code] = {
+                "requests": total,
+                "throughput_per_second": round(len(latencies) / elapsed, 2),
+                "errors": self.errors[code],
+                "error_rate": round(self.errors[code] / total, 4) if total else 0.0,
+                "rejected": self.rejected[code],
+                "latency_ms": {
+                    name: round(value * 1000, 3) if value is not None else None
+                    for name, value in (
+                        ("p50", percentile(latencies, 0.50)),
+                        ("p90", percentile(latencies, 0.90)),
+                        ("p99", percentile(latencies, 0.99)),
+                        ("max", latencies[-1] if latencies else None),
+                    )
+                },
+            }
+        total_requests = sum(entry["requests"] for entry in by_type.values())
+        total_errors = sum(self.errors.values())
+        return {
+            "kiosks": kiosks,
+            "elapsed_seconds": round(elapsed, 3),
+            "logins": self.logins,
+            "login_failures": self.login_failures,
+            "requests": total_requests,
+            "throughput_per_second": round((total_requests - total_errors) / elapsed, 2),
+            "error_rate": round(total_errors / total_requests, 4) if total_requests else 0.0,
+            "by_type": by_type,
+        }
+
+
+class Kiosk:
+    """One simulated self-check machine: a patron queue on a single connection."""
+
+    def __init__(self, number, args, results, rng):
+        self.args = args
+        self.results = results
+        self.rng = rng
+        self.connection = SIP2Connection(
+            args.host,
+            args.port,
+            args.username,
+            args.password,
+            location=f"kiosk{number}",
+            timeout=args.timeout,
+            max_in_flight=1,  # Kiosks wait for each answer
+        )
+        self.borrowed = []  # Items this kiosk has checked out
+
+    def next_message(self):
+        code = self.rng.choices(list(self.args.mix), weights=list(self.args.mix.values()))[0]
+        patron = self.args.patron_template.format(n=self.rng.randrange(self.args.patrons))
+        item = self.args.item_template.format(n=self.rng.randrange(self.args.items))
+        institution = self.args.institution
+        if code == "23":
+            return patron_status_request(patron, institution)
+        if code == "63":
+            return patron_information_request(patron, institution, summary="  Y")  # Items out
+        if code == "11":
+            return checkout_request(patron, item, institution)
+        if code == "09":
+            if self.borrowed:
+                item = self.borrowed.pop(self.rng.randrange(len(self.borrowed)))
+            return checkin_request(item, institution)
+        return item_information_request(item, institution)
+
+    async def run(self, deadline):
+        try:
+            await self.connection.connect()
+            self.results.logins += 1
+        except (SIP2ConnectionError, SIP2LoginError):
+            self.results.login_failures += 1
+            return
+
+        sent = 0
+        while time.monotonic() < deadline and (not self.args.requests or sent < self.args.requests):
+            message = self.next_message()
+            start = time.perf_counter()
+            try:
+                response = await self.connection.request(message)
+            except (SIP2ConnectionError, SIP2LoginError, SIP2DecodeError):
+                self.results.record(message.code, error=True)
+            else:
+                ok = response.fixed.get("ok", True)
+                self.results.record(message.code, time.perf_counter() - start, ok=ok)
+                if message.code == "11" and ok:
+                    self.borrowed.append(message.get("AB"))
+            sent += 1
+            if self.args.think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+        await self.connection.wait_closed()
+
+
+async def run_load(args):
+    """Runs the simulation described by `args` and returns the report dict."""
+    results = Results()
+    rng = random.Random(args.seed)
+    kiosks = [Kiosk(n, args, results, random.Random(rng.random())) for n in range(args.kiosks)]
+    start = time.monotonic()
+    deadline = start + args.duration
+
+    async def start_kiosk(n, kiosk):
+        # Spread logins over the ramp-up period instead of one burst
+        await asyncio.sleep(args.ramp_up * n / max(1, args.kiosks))
+        await kiosk.run(deadline)
+
+    await asyncio.gather(*(start_kiosk(n, kiosk) for n, kiosk in enumerate(kiosks)))
+    return results.report(time.monotonic() - start, args.kiosks)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6000)
+    parser.add_argument("--kiosks", type=int, default=50, help="concurrent simulated kiosks")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop each kiosk after this many (0: no limit)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"default {DEFAULT_MIX}")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean seconds between requests (0: none)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds over which kiosks start")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds to wait for each response")
+    parser.add_argument("--username", default="kiosk")
+    parser.add_argument("--password", default="kiosk")
+    parser.add_argument("--institution", default="")
+    parser.add_argument("--patrons", type=int, default=1000, help="distinct patron ids")
+    parser.add_argument("--patron-template", default="patron{n}")
+    parser.add_argument("--items", type=int, default=1000, help="distinct item ids")
+    parser.add_argument("--item-template", default="item{n}")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = asyncio.run(run_load(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if report["logins"] == 0:
+        sys.exit("No kiosk could connect and log in")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,202 +1,196 @@
+import itertools
+import logging
 import socket
 import sys
 import threading
 import time
 
+from digital_library_api.log import configure_logging, connection_id, sampled
+
+from .codec import (
+    ENCODING,
+    ChecksumError,
+    SIP2DecodeError,
+    SIP2Message,
+    acs_status_response,
+    checksum,
+    decode_message,
+    encode_message,
+    sip2_timestamp,
+)
+from .framer import SIP2Framer
+
+logger = logging.getLogger(__name__)
+message_logger = logging.getLogger("digital_library_sip2.messages")
+
 # --- Helper Functions for SIP2 Message Handling ---
 
 
 def calculate_checksum(msg_data):
-    """Calculates a very basic checksum for demo purposes.
-    Real SIP2 checksum is more complex (sum of ASCII values modulo 65536, then 2's complement).
-    For a proper demo, you might just return '0000' or implement the real algorithm.
-    """
-    s = sum(ord(c) for c in msg_data)
-    # This is a simplified checksum, not the full SIP2 standard.
-    # For a robust server, refer to the SIP2 spec for checksum calculation.
-    return str(s % 10000).zfill(4)  # Just summing ASCII values and taking last 4 digits
+    """SIP2 checksum of a message up to and including "AZ" (see codec.checksum)."""
+    return checksum(msg_data.encode(ENCODING, "replace"))
 
 
 def build_sip2_message(message_code, fields="", sequence_number=0):
-    """Builds a complete SIP2 message with length prefix, seq num, and checksum."""
-    # The message data part without length prefix, seq num, or checksum
-    msg_body = f"{message_code}{fields}"
+    """Builds a complete SIP2 message from its code and raw field text.
+
+    `fields` is everything between the code and the error detection fields
+    (fixed fields, then "XXvalue|" fields). Use codec.encode_message to
+    build one from a SIP2Message instead.
+    """
+    body = f"{message_code}{fields}AY{sequence_number}AZ"
+    return f"{body}{calculate_checksum(body)}\r"
 
-    # Calculate checksum for the msg_body + seq_num part
-    # Note: SIP2 checksum includes the sequence number, but *not* the checksum itself or length.
-    # We use a placeholder for now, actual SIP2 checksum is more involved.
-    calculated_cs = calculate_checksum(msg_body + str(sequence_number))  # Simplified!
 
-    # Assemble the full message before length prefix
-    full_msg_without_len = f"{msg_body}{sequence_number}{calculated_cs}\r"
+def parse_sip2_message(raw_message):
+    """Parses one raw SIP2 message (a str ending in CR) into a SIP2Message.
 
-    # Calculate total length including the 4-digit length prefix itself and the final CR
-    total_length = len(full_msg_without_len) + 4
+    Accepts messages with or without a four-digit length prefix. Returns
+    (message, None) or (None, error).
+    """
+    if not raw_message or len(raw_message) < 3:  # Code and CR
+        return None, "Too short"
+    if not raw_message.endswith("\r"):
+        return None, "Missing CR terminator"
+    content = raw_message
+    # A length prefix counts itself and the CR (like SIP2Framer's AUTO mode,
+    # "9300CN..." is only a prefix if it matches the message length)
+    if content[:4].isdigit() and int(content[:4]) == len(content):
+        content = content[4:]
+    try:
+        return decode_message(content[:-1].encode(ENCODING, "replace")), None
+    except SIP2DecodeError as e:
+        return None, str(e)
 
-    # Format the length prefix
-    len_prefix = str(total_length).zfill(4)
 
-    # Combine everything
-    final_message = f"{len_prefix}{full_msg_without_len}"
-    return final_message
+# --- Mock SIP2 Server Logic ---
 
+# Requests generate_mock_response answers, advertised in the 98 ACS Status
+MOCK_SUPPORTED_MESSAGES = {"09", "11", "17", "23", "63", "93", "97", "99"}
 
-def parse_sip2_message(raw_message):
-    """Parses a raw SIP2 message received from the client."""
-    if (
-        not raw_message or len(raw_message) < 5
-    ):  # Min length: 4 for len + 1 for cmd code
-        return None, "Too short"
 
-    try:
-        length_str = raw_message[:4]
-        declared_length = int(length_str)
+def generate_mock_response(message):
+    """Generates a mock SIP2 response (a SIP2Message) to the incoming message.
 
-        # Check if the message is fully received
-        if len(raw_message) < declared_length:
-            return None, "Partial message"
+    Shared by the threaded MockSIP2Server and the asyncio server.
+    """
+    institution = ("AO", message.get("AO", ""))
+    item = ("AB", message.get("AB", ""))
+    patron = ("AA", message.get("AA", ""))
 
-        # Extract the actual message content based on declared length
-        message_content = raw_message[
-            4 : declared_length - 1
-        ]  # Exclude len prefix and CR
+    if message.code == "93":  # Login Request
+        return message.response("94", {"ok": True})  # Login successful
 
-        # Verify CR terminator
-        if raw_message[declared_length - 1] != "\r":
-            return None, "Missing CR terminator"
+    if message.code == "11":  # Checkout Request
+        fixed = {"ok": True, "magnetic_media": "U", "desensitize": "Y", "transaction_date": sip2_timestamp()}
+        return message.response("12", fixed, [institution, patron, item, ("AJ", ""), ("AH", "")])
 
-        message_code = message_content[:2]
-        fields_part = message_content[2:-5]  # Exclude code, seq, checksum
-        sequence_number = message_content[-5]  # The single digit sequence number
-        checksum = message_content[-4:]  # The 4-digit checksum
+    if message.code == "09":  # Checkin Request
+        fixed = {"ok": True, "resensitize": True, "magnetic_media": "U", "transaction_date": sip2_timestamp()}
+        return message.response("10", fixed, [institution, item, ("AQ", ""), ("AJ", "")])
 
-        # For a demo, we might skip full checksum verification, but it's crucial in real systems.
+    if message.code == "23":  # Patron Status Request
+        fixed = {"language": "001", "transaction_date": sip2_timestamp()}
+        return message.response(
+            "24", fixed, [institution, patron, ("AE", "Name, My Patron"), ("BL", "Y")]
+        )
 
-        return {
-            "raw": raw_message.strip(),
-            "length": declared_length,
-            "code": message_code,
-            "fields": fields_part,
-            "sequence_number": sequence_number,
-            "checksum": checksum,
-        }, None
+    if message.code == "63":  # Patron Information
+        fixed = {"language": "001", "transaction_date": sip2_timestamp()}
+        return message.response("64", fixed, [institution, patron, ("AE", "Name, My Patron"), ("BL", "Y")])
 
-    except ValueError:
-        return None, "Invalid length prefix"
-    except Exception as e:
-        return None, f"Parsing error: {e}"
+    if message.code == "17":  # Item Information
+        # Circulation status 03 (available), security marker 00 (other), fee type 01 (other)
+        fixed = {
+            "circulation_status": "03",
+            "security_marker": "00",
+            "fee_type": "01",
+            "transaction_date": sip2_timestamp(),
+        }
+        return message.response("18", fixed, [item, ("AJ", "")])
 
+    if message.code == "99":  # SC Status heartbeat
+        return acs_status_response(message, MOCK_SUPPORTED_MESSAGES, institution=institution[1])
 
-# --- Mock SIP2 Server Logic ---
+    logger.warning("Unhandled SIP2 command: %s", message.code)
+    return None
 
 
 class MockSIP2Server:
-    def __init__(self, host="127.0.0.1", port=6000):
+    def __init__(self, host="127.0.0.1", port=6000, idle_timeout=300.0):
         self.host = host
         self.port = port
+        self.idle_timeout = idle_timeout  # Seconds; None disables it
         self.running = False
         self.sequence_counter = 0  # For generating responses
+        self.server_socket = None
+        self._connection_ids = itertools.count(1)
 
     def _handle_client(self, conn, addr):
-        print(f"[Client Connected] {addr}")
-        buffer = ""
+        connection_id.set(next(self._connection_ids))  # Tags this thread's log records
+        logger.info("Client connected: %s", addr)
+        # A kiosk that vanished without closing its socket would otherwise
+        # hold this thread forever
+        conn.settimeout(self.idle_timeout)
+        framer = SIP2Framer()
+        last_response = None
         while self.running:
             try:
-                data = conn.recv(4096).decode("ascii")
-                if not data:
+                # Receive straight into the framer's buffer; frames are
+                # views into it, so nothing is re-sliced per message.
+                nbytes = conn.recv_into(framer.get_buffer(4096))
+                if not nbytes:
                     break  # Client disconnected
-
-                buffer += data
-
-                # Look for a complete message
-                while "\r" in buffer:
-                    cr_index = buffer.find("\r")
-                    potential_message = buffer[: cr_index + 1]
-
-                    parsed_msg, error = parse_sip2_message(potential_message)
-
-                    if error == "Partial message":
-                        # Not enough data for declared length, wait for more
-                        break
-                    elif error:
-                        print(
-                            f"[{addr}] Error parsing message: {error}. Raw: {potential_message.strip()}"
-                        )
-                        buffer = buffer[cr_index + 1 :]  # Skip malformed message
+                framer.buffer_updated(nbytes)
+
+                for frame in framer.frames():
+                    try:
+                        message = decode_message(frame)
+                    except ChecksumError:
+                        # Corrupted in transit; ask the client to send it again
+                        conn.sendall(encode_message(SIP2Message("96")))
                         continue
+                    except SIP2DecodeError as e:
+                        logger.warning("Error parsing message: %s", e, extra={"raw": bytes(frame)})
+                        continue  # Skip malformed message
+
+                    log_message = sampled()
+                    if log_message:
+                        message_logger.info(
+                            "Received %s", bytes(frame).decode(ENCODING, "replace"), extra={"direction": "received"}
+                        )
 
-                    print(f"[{addr}] Received: {parsed_msg['raw']}")
-
-                    # Process the message and send a response
-                    response = self._generate_response(parsed_msg)
+                    if message.code == "97":  # Resend the last response
+                        response = last_response
+                    else:
+                        # Process the message and send a response
+                        response = self._generate_response(message)
+                        response = encode_message(response) if response else None
                     if response:
-                        print(f"[{addr}] Sending: {response.strip()}")
-                        conn.sendall(response.encode("ascii"))
-
-                    # Remove processed message from buffer
-                    buffer = buffer[cr_index + 1 :]
-
+                        if log_message:
+                            message_logger.info(
+                                "Sending %s", response.decode(ENCODING).strip(), extra={"direction": "sent"}
+                            )
+                        conn.sendall(response)
+                        last_response = response
+
+            except socket.timeout:
+                logger.info("Idle for %ss, disconnecting", self.idle_timeout)
+                break
             except ConnectionResetError:
-                print(f"[Client Disconnected] {addr}")
+                logger.info("Client disconnected: %s", addr)
                 break
             except Exception as e:
-                print(f"[{addr}] An error occurred: {e}")
+                logger.exception("An error occurred: %s", e)
                 break
         conn.close()
-        print(f"[Client Handler Closed] {addr}")
+        logger.info("Client handler closed: %s", addr)
 
-    def _generate_response(self, parsed_msg):
+    def _generate_response(self, message):
         """Generates a mock SIP2 response based on the incoming message."""
-        command = parsed_msg["code"]
-        client_seq_num = parsed_msg[
-            "sequence_number"
-        ]  # Use client's sequence number for response (AY)
-
         # Increment server's internal sequence counter for its own messages
         self.sequence_counter = (self.sequence_counter + 1) % 10
-
-        response_fields = ""
-        response_code = ""
-
-        if command == "93":  # Login Request
-            # 94 - Login Response
-            # Success: '1' or '0' for fail. 'AO' for patron identifier.
-            response_code = "94"
-            response_fields = "1"  # Login successful
-
-        elif command == "11":  # Checkout Request
-            # 12 - Checkout Response
-            # Success: '1' or '0' for fail.
-            # 'AA' Patron Identifier, 'AB' Item Identifier
-            response_code = "12"
-            response_fields = "1"  # Checkout successful
-            # Example: 121AOpatron123|ABitem456|...
-
-        elif command == "09":  # Checkin Request
-            # 10 - Checkin Response
-            # Success: '1' or '0' for fail.
-            # 'AB' Item Identifier
-            response_code = "10"
-            response_fields = "1"  # Checkin successful
-            # Example: 101ABitem456|...
-
-        elif command == "23":  # Patron Status Request
-            # 24 - Patron Status Response
-            response_code = "24"
-            # Example: 24100NImy_patron_name|AAmy_patron_id|BLsome_institution|...
-            response_fields = (
-                "100NIName, My Patron|AA"
-                + parsed_msg["fields"].split("AA")[-1].split("|")[0]
-                + "|"
-            )
-
-        else:
-            print(f"Warning: Unhandled SIP2 command: {command}")
-            # Send an error or unsupported message response if needed (e.g., 99 - Error)
-            return None
-
-        # Build and return the complete SIP2 response message
-        return build_sip2_message(response_code, response_fields, client_seq_num)
+        return generate_mock_response(message)
 
     def start(self):
         self.running = True
@@ -207,9 +201,9 @@ class MockSIP2Server:
 
         try:
             self.server_socket.bind((self.host, self.port))
+            self.port = self.server_socket.getsockname()[1]  # Resolves port 0
             self.server_socket.listen(5)
-            print(f"Mock SIP2 Server listening on {self.host}:{self.port}")
-            print("Waiting for client connections...")
+            logger.info("Mock SIP2 Server listening on %s:%s", self.host, self.port)
 
             while self.running:
                 conn, addr = self.server_socket.accept()
@@ -222,10 +216,10 @@ class MockSIP2Server:
                 client_thread.start()
 
         except socket.error as e:
-            print(f"Could not start server: {e}")
+            logger.error("Could not start server: %s", e)
             self.running = False
         except KeyboardInterrupt:
-            print("Server shutting down due to KeyboardInterrupt.")
+            logger.info("Server shutting down due to KeyboardInterrupt.")
         finally:
             self.stop()
 
@@ -233,9 +227,10 @@ class MockSIP2Server:
         self.running = False
         if self.server_socket:
             self.server_socket.close()
-            print("Mock SIP2 Server stopped.")
+            logger.info("Mock SIP2 Server stopped.")
 
 
 if __name__ == "__main__":
+    configure_logging(json_format=False)  # LOG_LEVEL and LOG_SAMPLE_RATE apply
     server = MockSIP2Server("127.0.0.1", 6000)
     server.start()
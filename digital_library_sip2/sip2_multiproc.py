@@ -0,0 +1,315 @@
+"""Runs AsyncSIP2Server in several worker processes sharing one port.
+
+Each worker is a separate process with its own event loop and GIL, and
+binds the same address with SO_REUSEPORT, so the kernel spreads incoming
+connections over the workers (Linux and recent BSDs; not Windows). A
+supervisor process starts the workers, restarts any that crash and
+collects their stats:
+
+    python -m digital_library_sip2.sip2_multiproc --port 6000 --workers 4 --database
+
+Signals to the supervisor:
+
+    SIGHUP           reload: start a new set of workers, then let the old
+                     ones stop accepting and finish their connections
+    SIGTERM, SIGINT  graceful shutdown (connections get --grace seconds)
+    SIGUSR1          print the aggregated stats as JSON
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import time
+from collections import Counter
+
+from digital_library_api.log import configure_logging, shutdown_logging
+
+from .sip2_async_server import AsyncSIP2Server
+
+logger = logging.getLogger(__name__)
+
+
+def _serve(worker_id, generation, host, port, options, stats_queue, stats_interval, grace):
+    """Worker process entry point."""
+    # Ctrl-C reaches the whole process group; the supervisor decides when
+    # workers stop and tells them with SIGTERM.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging(
+        level="WARNING" if options.pop("quiet", False) else None,
+        json_format=options.pop("log_format", "json") == "json",
+        sample_rate=options.pop("log_sample_rate", None),
+    )
+    try:
+        asyncio.run(_serve_async(worker_id, generation, host, port, options, stats_queue, stats_interval, grace))
+    finally:
+        shutdown_logging()
+
+
+async def _serve_async(worker_id, generation, host, port, options, stats_queue, stats_interval, grace):
+    if options.pop("database", False):
+        from .circulation import SIP2Circulation
+
+        options["handler_factory"] = SIP2Circulation()
+    server = AsyncSIP2Server(host, port, reuse_port=True, **options)
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+
+    def report(kind):
+        stats_queue.put((kind, worker_id, generation, os.getpid(), server.stats()))
+
+    await server.start()
+    report("ready")
+    while not stopping.is_set():
+        try:
+            await asyncio.wait_for(stopping.wait(), stats_interval)
+        except asyncio.TimeoutError:
+            report("stats")
+    await server.stop(grace=grace)
+    report("exit")
+
+
+class SIP2Supervisor:
+    """Starts, reloads and stops a set of AsyncSIP2Server worker processes.
+
+    `server_options` are passed to each worker's AsyncSIP2Server, plus
+    `database=True` for SIP2Circulation handlers, `quiet=True` to log only
+    warnings from the workers, and `log_format` ("json" or "text") and
+    `log_sample_rate` for their logging (see digital_library_api.log).
+    The supervisor keeps its own SO_REUSEPORT socket bound (but not
+    listening) on the port, which resolves port 0 and keeps the port
+    reserved across reloads.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6000, workers=None, stats_interval=5.0, grace=10.0, **server_options):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("SO_REUSEPORT is not available on this platform; run sip2_async_server instead")
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.stats_interval = stats_interval
+        self.grace = grace
+        self.server_options = server_options
+        # Spawned, not forked: workers must not share the supervisor's
+        # event loop or database connections
+        self._context = multiprocessing.get_context("spawn")
+        self._queue = self._context.Queue()
+        self._processes = {}  # pid -> (worker id, generation, Process)
+        self._ready = set()  # pids that are accepting connections
+        self._socket = None
+        self._stopping = False
+        self.generation = 0
+        self.worker_stats = {}  # pid -> latest stats from a live worker
+        self._retired = Counter()  # Final stats of workers that have exited
+        self.restarts = 0
+
+    def start(self, timeout=30.0):
+        """Starts the workers and waits until all of them accept connections."""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._socket.bind((self.host, self.port))
+        self.port = self._socket.getsockname()[1]
+        self._spawn_generation()
+        self.wait_ready(self.generation, timeout)
+        logger.info("SIP2 supervisor listening on %s:%s with %s workers", self.host, self.port, self.workers)
+
+    def reload(self, timeout=30.0):
+        """Replaces every worker without refusing connections.
+
+        The new workers join the port before the old ones leave it; the old
+        ones then stop accepting and get `grace` seconds to finish.
+        """
+        old = [pid for pid, (_, generation, _) in self._processes.items() if generation == self.generation]
+        self._spawn_generation()
+        self.wait_ready(self.generation, timeout)
+        for pid in old:
+            if pid in self._processes:
+                self._processes[pid][2].terminate()  # SIGTERM: graceful
+        logger.info("SIP2 supervisor reloaded (generation %s)", self.generation)
+
+    def shutdown(self):
+        """Stops every worker, giving connections `grace` seconds to finish."""
+        self._stopping = True
+        for _, _, process in self._processes.values():
+            process.terminate()
+        deadline = time.monotonic() + self.grace + 5
+        for _, _, process in list(self._processes.values()):
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.poll()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def wait_ready(self, generation, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while self._count_ready(generation) < self.workers:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Workers did not start within {timeout}s")
+            self.poll(0.1)
+
+    def _count_ready(self, generation):
+        return sum(
+            1 for pid, (_, worker_generation, _) in self._processes.items()
+            if worker_generation == generation and pid in self._ready
+        )
+
+    def _spawn_generation(self):
+        self.generation += 1
+        for worker_id in range(self.workers):
+            self._spawn(worker_id, self.generation)
+
+    def _spawn(self, worker_id, generation):
+        process = self._context.Process(
+            target=_serve,
+            args=(
+                worker_id,
+                generation,
+                self.host,
+                self.port,
+                dict(self.server_options),
+                self._queue,
+                self.stats_interval,
+                self.grace,
+            ),
+            name=f"sip2-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[process.pid] = (worker_id, generation, process)
+
+    def poll(self, timeout=0.0):
+        """Reads worker reports for up to `timeout` seconds and reaps exited workers.
+
+        Workers of the current generation that exit unexpectedly are
+        restarted.
+        """
+        # Snapshot first: a worker's last report is in the queue before it
+        # exits, so it is read below before the worker is reaped.
+        exited = [pid for pid, (_, _, process) in self._processes.items() if not process.is_alive()]
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                kind, _, _, pid, stats = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if pid not in self._processes:
+                continue
+            self.worker_stats[pid] = stats
+            if kind == "ready":
+                self._ready.add(pid)
+        for pid in exited:
+            self._reap(pid)
+
+    def _reap(self, pid):
+        worker_id, generation, process = self._processes.pop(pid)
+        process.join()
+        self._ready.discard(pid)
+        self._retired.update(self.worker_stats.pop(pid, {}))
+        if generation == self.generation and not self._stopping:
+            self.restarts += 1
+            logger.warning("SIP2 worker %s (pid %s) exited with %s; restarting", worker_id, pid, process.exitcode)
+            self._spawn(worker_id, generation)
+
+    def stats(self):
+        """Counters summed over all workers, past and present, plus each live worker's own.
+
+        connections_peak is the sum of the workers' peaks, an upper bound on
+        the true peak.
+        """
+        totals = Counter(self._retired)
+        for stats in self.worker_stats.values():
+            totals.update(stats)
+        totals["connections_active"] = sum(stats["connections_active"] for stats in self.worker_stats.values())
+        workers = [
+            {"worker": worker_id, "generation": generation, "pid": pid, **self.worker_stats.get(pid, {})}
+            for pid, (worker_id, generation, _) in sorted(self._processes.items(), key=lambda item: item[1][:2])
+        ]
+        return {
+            "generation": self.generation,
+            "workers_alive": len(self._processes),
+            "restarts": self.restarts,
+            "totals": dict(totals),
+            "workers": workers,
+        }
+
+    def run(self):
+        """Runs until SIGTERM or SIGINT, reloading on SIGHUP."""
+        signals = []
+
+        def handle(signum, frame):
+            signals.append(signum)  # Acted on by the loop below, not inside the handler
+
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+            signal.signal(signum, handle)
+        self.start()
+        try:
+            while True:
+                self.poll(0.5)
+                while signals:
+                    signum = signals.pop(0)
+                    if signum == signal.SIGHUP:
+                        self.reload()
+                    elif signum == signal.SIGUSR1:
+                        print(json.dumps(self.stats(), indent=2), flush=True)
+                    else:
+                        return
+        finally:
+            logger.info("SIP2 supervisor shutting down")
+            self.shutdown()
+            print(json.dumps(self.stats()["totals"], indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="multi-process SIP2 server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--backlog", type=int, default=128, help="listen() backlog per worker")
+    parser.add_argument("--max-connections", type=int, default=1024, help="per worker")
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="seconds")
+    parser.add_argument("--grace", type=float, default=10.0, help="seconds connections get to finish on reload/shutdown")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="seconds between worker stats reports")
+    parser.add_argument(
+        "--database",
+        action="store_true",
+        help="run real circulation against the library database instead of canned responses",
+    )
+    parser.add_argument("--db-workers", type=int, default=4, help="database threads per worker (with --database)")
+    parser.add_argument("--quiet", action="store_true", help="only warnings from workers")
+    parser.add_argument("--verbose", action="store_true", help="log every message")
+    parser.add_argument("--log-format", choices=["json", "text"], default="json")
+    parser.add_argument("--log-sample-rate", type=float, default=1.0, help="fraction of messages logged with --verbose")
+    args = parser.parse_args()
+    configure_logging(json_format=args.log_format == "json")
+
+    options = dict(
+        backlog=args.backlog,
+        max_connections=args.max_connections,
+        idle_timeout=args.idle_timeout,
+        verbose=args.verbose,
+        quiet=args.quiet,
+        log_format=args.log_format,
+        log_sample_rate=args.log_sample_rate,
+    )
+    if args.database:
+        options.update(database=True, workers=args.db_workers)
+    try:
+        supervisor = SIP2Supervisor(
+            args.host, args.port, args.workers, stats_interval=args.stats_interval, grace=args.grace, **options
+        )
+    except RuntimeError as e:
+        sys.exit(str(e))
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
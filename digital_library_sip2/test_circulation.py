@@ -0,0 +1,229 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from digital_library_api.database import Book as DBBook, User as DBUser, create_db_tables, make_engine
+from digital_library_api.security import get_password_hash
+from digital_library_api.tags import assign_tag, tag_cache
+
+from .circulation import SIP2Circulation
+from .codec import SIP2Message, decode_message, encode_message
+
+DATE = "20250101    120000"
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'sip2.sqlite3'}")
+    create_db_tables(engine)
+    factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    db = factory()
+    db.add(DBUser(username="terminal", hashed_password=get_password_hash("secret")))
+    db.add(DBUser(username="patron", hashed_password=get_password_hash("pw")))
+    db.add(DBBook(title="Dune", author="Frank Herbert", isbn="9780441013593"))
+    db.commit()
+    db.close()
+    yield factory
+    engine.dispose()
+
+
+def send(handler, code, fixed, fields, sequence_number=1):
+    """Passes a message through the codec to the handler and back."""
+    request = decode_message(encode_message(SIP2Message(code, fixed, fields, sequence_number))[:-1])
+    response = handler(request)
+    assert response is not None
+    assert response.sequence_number == sequence_number
+    return decode_message(encode_message(response)[:-1])
+
+
+def login(handler, password="secret"):
+    return send(handler, "93", {}, [("CN", "terminal"), ("CO", password)])
+
+
+def checkout(handler, patron="patron", item="9780441013593"):
+    fixed = {"transaction_date": DATE, "nb_due_date": ""}
+    return send(handler, "11", fixed, [("AO", "lib"), ("AA", patron), ("AB", item), ("AC", "")])
+
+
+def checkin(handler, item="9780441013593"):
+    fixed = {"transaction_date": DATE, "return_date": DATE}
+    return send(handler, "09", fixed, [("AO", "lib"), ("AB", item), ("AC", "")])
+
+
+def test_login(session_factory):
+    """Test that 93 Login checks the terminal's credentials."""
+    handler = SIP2Circulation(session_factory)()
+    assert login(handler, password="wrong").fixed["ok"] is False
+    assert not handler.logged_in
+    assert login(handler).fixed["ok"] is True
+    assert handler.logged_in
+    handler.close()
+
+
+def test_checkout_and_checkin(session_factory):
+    """Test that checkout and checkin update the database atomically."""
+    handler = SIP2Circulation(session_factory, loan_days=7)()
+    login(handler)
+
+    response = checkout(handler)
+    assert response.code == "12"
+    assert response.fixed["ok"] and response.fixed["desensitize"] == "Y"
+    assert response.get("AJ") == "Dune"
+
+    again = checkout(handler)
+    assert not again.fixed["ok"]
+    assert again.get("AF") == "Book is already borrowed by patron"
+
+    db = session_factory()
+    book = db.query(DBBook).one()
+    assert book.is_borrowed and book.borrower.username == "patron"
+    db.close()
+
+    response = checkin(handler)
+    assert response.code == "10"
+    assert response.fixed["ok"] and response.fixed["resensitize"]
+    assert not checkin(handler).fixed["ok"]
+
+    db = session_factory()
+    assert not db.query(DBBook).one().is_borrowed
+    db.close()
+    handler.close()
+
+
+def test_checkout_errors(session_factory):
+    """Test that unknown items, unknown patrons and missing logins are refused."""
+    handler = SIP2Circulation(session_factory)()
+    assert checkout(handler).get("AF") == "Terminal not logged in"
+
+    login(handler)
+    assert checkout(handler, patron="nobody").get("AF") == "Unknown patron"
+    assert checkout(handler, item="0").get("AF") == "Book not found"
+    handler.close()
+
+
+def test_checkout_and_checkin_by_rfid_tag(session_factory):
+    """Test that AB may be an RFID tag EPC, and that a stale cached tag is re-read."""
+    epc = "E28011606000020A3B4C5D6E"
+    db = session_factory()
+    other = DBBook(title="Emma", author="Jane Austen", isbn="9780141439587")
+    db.add(other)
+    db.flush()
+    assign_tag(db, other.id, epc)
+    db.commit()
+    dune_id = db.query(DBBook.id).filter(DBBook.isbn == "9780441013593").scalar()
+    db.close()
+    tag_cache.clear()
+    handler = SIP2Circulation(session_factory)()
+    login(handler)
+
+    response = checkout(handler, item=epc.lower())
+    assert response.fixed["ok"] and response.get("AJ") == "Emma"
+    assert checkin(handler, item=epc).get("AJ") == "Emma"
+
+    # The tag moved to Dune in another process; the cache still says Emma
+    db = session_factory()
+    assign_tag(db, dune_id, epc, reassign=True)
+    db.commit()
+    db.close()
+    assert checkout(handler, item=epc).get("AJ") == "Dune"
+    assert checkout(handler, item="E2801160FFFFFFFFFFFFFFFF").get("AF") == "Book not found"
+    handler.close()
+    tag_cache.clear()
+
+
+def test_patron_status(session_factory):
+    """Test that 23 Patron Status reports whether the patron is valid."""
+    handler = SIP2Circulation(session_factory, require_login=False)()
+    fixed = {"language": "001", "transaction_date": DATE}
+    assert send(handler, "23", fixed, [("AO", "lib"), ("AA", "patron")]).get("BL") == "Y"
+    assert send(handler, "23", fixed, [("AO", "lib"), ("AA", "nobody")]).get("BL") == "N"
+    handler.close()
+
+
+def test_sc_status(session_factory):
+    """Test that a 99 heartbeat is answered without a login or a database session."""
+    handler = SIP2Circulation(session_factory)()
+    fixed = {"status_code": "0", "max_print_width": 40, "protocol_version": "2.00"}
+    response = send(handler, "99", fixed, [])
+    assert response.code == "98" and response.fixed["checkout_ok"]
+    assert response.get("BX") == "YYYNYYYYNNNNNNNN"
+    assert handler._db is None
+    handler.close()
+
+
+def patron_information(handler, summary="", start=None, end=None, patron="patron"):
+    fields = [("AO", "lib"), ("AA", patron)]
+    fields += [("BP", str(start))] if start is not None else []
+    fields += [("BQ", str(end))] if end is not None else []
+    fixed = {"language": "001", "transaction_date": DATE, "summary": summary}
+    return send(handler, "63", fixed, fields)
+
+
+@pytest.fixture
+def loans(session_factory):
+    """The patron has five books out; the two due earliest are overdue."""
+    db = session_factory()
+    patron = db.query(DBUser).filter(DBUser.username == "patron").one()
+    today = date.today()
+    for n in range(5):
+        db.add(
+            DBBook(
+                title=f"Loan {n}",
+                author="Author",
+                isbn=f"97800000000{n}",
+                is_borrowed=True,
+                borrower_id=patron.id,
+                due_date=today + timedelta(days=n - 2),
+            )
+        )
+    db.commit()
+    db.close()
+    return [f"97800000000{n}" for n in range(5)]
+
+
+def test_patron_information_lists(session_factory, loans):
+    """Test 63/64 counts, summary-selected lists and BP/BQ ranges."""
+    handler = SIP2Circulation(session_factory, require_login=False, max_items=3)()
+
+    response = patron_information(handler)
+    assert response.fixed["charged_items_count"] == 5
+    assert response.fixed["overdue_items_count"] == 2
+    assert response.get("BL") == "Y"
+    assert response.get_all("AU") == [] and response.get_all("AT") == []
+
+    assert patron_information(handler, summary="  Y").get_all("AU") == loans[:3]  # Capped
+    assert patron_information(handler, summary="  Y", start=4, end=10).get_all("AU") == loans[3:]
+    assert patron_information(handler, summary="  Y", start=2, end=2).get_all("AU") == loans[1:2]
+    assert patron_information(handler, summary=" Y").get_all("AT") == loans[:2]
+
+    unknown = patron_information(handler, summary="  Y", patron="nobody")
+    assert unknown.get("BL") == "N" and unknown.get_all("AU") == []
+    handler.close()
+
+
+def test_patron_information_uses_indexes(session_factory, loans):
+    """Test that the counts and item lists do not scan the books table."""
+    engine = session_factory.kw["bind"]
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    handler = SIP2Circulation(session_factory, require_login=False)()
+    handler.patron_id("patron")  # Cached per connection; not part of the check
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        patron_information(handler, summary=" Y")
+        patron_information(handler, summary="  Y", start=2, end=4)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+        handler.close()
+
+    assert len(statements) == 4
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            assert not [step for step in plan if step.startswith("SCAN")], (statement, plan)
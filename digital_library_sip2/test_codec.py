@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from .codec import (
+    FIXED_FIELDS,
+    COUNT,
+    ONE_ZERO,
+    TEXT,
+    YES_NO,
+    ChecksumError,
+    SIP2DecodeError,
+    SIP2Message,
+    checksum,
+    decode_message,
+    encode_message,
+)
+from .sip2_demo_client import SIP2Client
+from .sip2_mock_server import MockSIP2Server, build_sip2_message, parse_sip2_message
+
+SAMPLE_VALUES = {TEXT: "", COUNT: 7, YES_NO: True, ONE_ZERO: True}
+
+
+def test_checksum_is_twos_complement():
+    """Test that the bytes plus their checksum sum to zero (mod 2**16)."""
+    data = b"9300CNuser|COpass|AY1AZ"
+    value = checksum(data)
+    assert len(value) == 4 and value == value.upper()
+    assert (sum(data) + int(value, 16)) & 0xFFFF == 0
+
+
+@pytest.mark.parametrize("code", sorted(FIXED_FIELDS))
+def test_round_trip(code):
+    """Test that every message type in the table encodes and decodes losslessly."""
+    fixed = {}
+    for spec in FIXED_FIELDS[code]:
+        value = SAMPLE_VALUES[spec.kind]
+        fixed[spec.name] = "X" * spec.length if spec.kind == TEXT else value
+    message = SIP2Message(code, fixed, [("AO", "lib"), ("AF", "one"), ("AF", "two")], 4)
+
+    data = encode_message(message)
+    assert data.endswith(b"AY4AZ" + checksum(data[:-5]).encode() + b"\r")
+    decoded = decode_message(data[:-1])
+    assert decoded.fixed == message.fixed
+    assert decoded.fields == message.fields
+    assert decoded.get_all("AF") == ["one", "two"]
+    assert decoded.sequence_number == 4
+
+
+def test_encode_pads_and_validates_fixed_fields():
+    data = encode_message(SIP2Message("24", {"language": "001"}), error_detection=False)
+    assert data == b"24" + b" " * 14 + b"001" + b" " * 18 + b"\r"
+    with pytest.raises(ValueError):
+        encode_message(SIP2Message("24", {"language": "english"}))
+
+
+def test_encode_strips_separators_from_values():
+    data = encode_message(SIP2Message("94", {"ok": True}, [("AF", "a|b\rc")]), error_detection=False)
+    assert data == b"941AFa b c|\r"
+
+
+def test_decode_without_error_detection():
+    message = decode_message(b"941AFhello|")
+    assert message.fixed == {"ok": True}
+    assert message.get("AF") == "hello"
+    assert message.sequence_number is None and message.checksum is None
+
+
+def test_decode_rejects_bad_checksum():
+    """Test that a corrupted message is reported with its sequence number."""
+    data = bytearray(encode_message(SIP2Message("94", {"ok": True}, [], 3))[:-1])
+    data[2] = ord("0")  # Flip the ok flag in transit
+    with pytest.raises(ChecksumError) as excinfo:
+        decode_message(data)
+    assert excinfo.value.message.sequence_number == 3
+
+
+def test_decode_rejects_short_messages():
+    with pytest.raises(SIP2DecodeError):
+        decode_message(b"9")
+    with pytest.raises(SIP2DecodeError):
+        decode_message(b"24" + b" " * 20)  # Fixed fields need 35 characters
+
+
+def test_build_and_parse_wrappers():
+    """Test the string helpers kept for raw messages, with and without a length prefix."""
+    raw = build_sip2_message("93", "00CNuser|COpass|", 2)
+    assert raw.startswith("9300CNuser|COpass|AY2AZ") and raw.endswith("\r")
+    for text in (raw, f"{len(raw) + 4:04d}{raw}"):
+        message, error = parse_sip2_message(text)
+        assert error is None
+        assert message.get("CN") == "user" and message.sequence_number == 2
+    assert parse_sip2_message(raw[:-1])[1] == "Missing CR terminator"
+
+
+def test_client_and_server_share_the_codec(capsys):
+    """Test the demo client against the threaded mock server."""
+    server = MockSIP2Server("127.0.0.1", 0)
+    threading.Thread(target=server.start, daemon=True).start()
+    while server.server_socket is None or server.port == 0:
+        time.sleep(0.01)
+
+    client = SIP2Client("127.0.0.1", server.port)
+    try:
+        assert client.connect()
+        login = client.login("user", "pass")
+        assert login.code == "94" and login.fixed["ok"]
+        assert login.sequence_number == 1
+        status = client.patron_status("patron7", institution="lib")
+        assert status.code == "24" and status.get("AA") == "patron7"
+    finally:
+        client.disconnect()
+        server.running = False
+        server.stop()
@@ -0,0 +1,173 @@
+import random
+
+import pytest
+
+from .framer import AUTO, CR_TERMINATED, LENGTH_PREFIXED, SIP2Framer
+from .codec import decode_message
+from .sip2_mock_server import build_sip2_message
+
+
+def with_length_prefix(message):
+    return f"{len(message) + 4:04d}{message}"
+
+
+MESSAGES = [
+    with_length_prefix(build_sip2_message("93", "00CNuser|COpass|", 1)),
+    with_length_prefix(build_sip2_message("23", "00120250101    120000AOlib|AApatron7|AC|AD|", 2)),
+    with_length_prefix(
+        build_sip2_message("11", "NN20250101    120000" + " " * 18 + "AOlib|AApatron|AB123|AC|", 3)
+    ),
+    with_length_prefix(build_sip2_message("09", "N20250101    12000020250101    120000AOlib|AB123|AC|", 4)),
+]
+STREAM = "".join(MESSAGES).encode("ascii")
+
+
+def contents(messages):
+    """The frames the framer should produce: no length prefix, no CR."""
+    return [message[4:-1].encode("ascii") for message in messages]
+
+
+def feed_in_chunks(framer, data, sizes):
+    frames = []
+    position = 0
+    for size in sizes:
+        framer.feed(data[position : position + size])
+        position += size
+        frames.extend(bytes(frame) for frame in framer.frames())
+    framer.feed(data[position:])
+    frames.extend(bytes(frame) for frame in framer.frames())
+    return frames
+
+
+@pytest.mark.parametrize("mode", [AUTO, LENGTH_PREFIXED])
+def test_length_prefixed_stream(mode):
+    """Test that pipelined length-prefixed messages come out in order."""
+    framer = SIP2Framer(mode)
+    framer.feed(STREAM)
+    assert [bytes(frame) for frame in framer.frames()] == contents(MESSAGES)
+    assert framer.pending == 0
+    assert framer.frames_total == len(MESSAGES)
+
+
+def test_cr_terminated_stream():
+    """Test messages without a length prefix, as self-check machines send them."""
+    raw = [message[4:] for message in MESSAGES]
+    for mode in (AUTO, CR_TERMINATED):
+        framer = SIP2Framer(mode)
+        framer.feed("".join(raw).encode("ascii"))
+        assert [bytes(frame) for frame in framer.frames()] == contents(MESSAGES)
+
+
+def test_auto_mode_does_not_mistake_fields_for_a_prefix():
+    """Test that '2300...' (code 23, language 001) is not read as a length."""
+    framer = SIP2Framer(AUTO)
+    framer.feed(b"2300120250101    120000AOlib|AApatron|AY1AZ0000\r")
+    assert [bytes(frame) for frame in framer.frames()] == [
+        b"2300120250101    120000AOlib|AApatron|AY1AZ0000"
+    ]
+
+
+def test_crlf_line_endings():
+    """Test that a LF after each CR is ignored."""
+    framer = SIP2Framer()
+    framer.feed(STREAM.replace(b"\r", b"\r\n"))
+    assert [bytes(frame) for frame in framer.frames()] == contents(MESSAGES)
+
+
+def test_frames_are_views_into_the_buffer():
+    """Test that frames are not copies of the received data."""
+    framer = SIP2Framer()
+    framer.feed(STREAM)
+    frame = next(framer.frames())
+    assert isinstance(frame, memoryview)
+    assert frame.obj is framer._buffer
+    message = decode_message(frame)
+    assert message.code == "93"
+    assert message.fields == [("CN", "user"), ("CO", "pass")]
+    assert message.sequence_number == 1
+
+
+def test_recv_into_buffer():
+    """Test the BufferedProtocol-style get_buffer()/buffer_updated() path."""
+    framer = SIP2Framer()
+    frames = []
+    for position in range(0, len(STREAM), 7):
+        chunk = STREAM[position : position + 7]
+        framer.get_buffer(len(chunk))[: len(chunk)] = chunk
+        framer.buffer_updated(len(chunk))
+        frames.extend(bytes(frame) for frame in framer.frames())
+    assert frames == contents(MESSAGES)
+
+
+def test_held_frame_survives_buffer_growth():
+    """Test that keeping a frame view does not break later, larger reads."""
+    framer = SIP2Framer()
+    framer.feed(STREAM)
+    held = next(framer.frames())
+    framer.feed(STREAM * 2000)  # Must grow past the initial buffer
+    frames = [bytes(frame) for frame in framer.frames()]
+    assert len(frames) == len(MESSAGES) * 2001 - 1
+    assert bytes(held) == contents(MESSAGES)[0]
+
+
+def test_garbled_length_prefix_is_skipped():
+    """Test that a prefix that does not end at a CR is dropped up to the next CR."""
+    framer = SIP2Framer(LENGTH_PREFIXED)
+    framer.feed(b"0099garbage\r" + b"xx\r" + STREAM)
+    assert [bytes(frame) for frame in framer.frames()] == contents(MESSAGES)
+    assert framer.errors == 2
+    assert framer.bytes_discarded == len(b"0099garbage\rxx\r")
+
+
+def test_incomplete_message_is_kept():
+    """Test that data without a CR stays pending until the rest arrives."""
+    framer = SIP2Framer()
+    framer.feed(STREAM[:-1])
+    assert len(list(framer.frames())) == len(MESSAGES) - 1
+    assert framer.pending == len(MESSAGES[-1]) - 1
+    framer.feed(b"\r")
+    assert [bytes(frame) for frame in framer.frames()] == contents(MESSAGES[-1:])
+
+
+@pytest.mark.parametrize("mode", [AUTO, LENGTH_PREFIXED])
+@pytest.mark.parametrize("seed", range(10))
+def test_fuzz_partial_reads(mode, seed):
+    """Test that any split of a pipelined stream yields the same frames."""
+    rng = random.Random(seed)
+    messages = [rng.choice(MESSAGES) for _ in range(50)]
+    data = "".join(messages).encode("ascii")
+    sizes = [rng.randint(0, 40) for _ in range(rng.randint(1, 200))]
+    assert feed_in_chunks(SIP2Framer(mode), data, sizes) == contents(messages)
+
+
+@pytest.mark.parametrize("mode", [AUTO, LENGTH_PREFIXED, CR_TERMINATED])
+@pytest.mark.parametrize("seed", range(10))
+def test_fuzz_garbled_input(mode, seed):
+    """Test that random garbage between messages never hides a valid message.
+
+    Garbage ends in a CR, so after skipping it the framer is back in step.
+    LENGTH_PREFIXED drops the garbage; the other modes return it as frames
+    of its own (for the parser to reject), but never merged into a message.
+    """
+    rng = random.Random(seed)
+    expected, chunks = [], []
+    for _ in range(30):
+        if rng.random() < 0.3:
+            garbage = bytes(rng.choice(b"0123456789AB|\n ") for _ in range(rng.randint(0, 30)))
+            chunks.append(garbage + b"\r")
+        message = rng.choice(MESSAGES).encode("ascii")
+        # CR_TERMINATED does not know about length prefixes and keeps them
+        expected.append(message[:-1] if mode == CR_TERMINATED else message[4:-1])
+        chunks.append(message)
+    data = b"".join(chunks)
+    sizes = [rng.randint(1, 64) for _ in range(rng.randint(1, 100))]
+
+    frames = feed_in_chunks(SIP2Framer(mode), data, sizes)
+    assert [frame for frame in frames if frame in expected] == expected
+    if mode == LENGTH_PREFIXED:
+        assert frames == expected
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        SIP2Framer("lines")
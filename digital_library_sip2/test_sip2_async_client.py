@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from .codec import SIP2Message, decode_message, encode_message
+from .framer import SIP2Framer
+from .sip2_async_client import SIP2ClientPool, SIP2Connection, SIP2LoginError, SIP2TimeoutError
+from .sip2_async_server import AsyncSIP2Server
+from .sip2_mock_server import generate_mock_response
+
+
+class CountingHandler:
+    """Mock responses, counting logins and refusing the password "wrong"."""
+
+    logins = 0
+
+    def __call__(self, message):
+        if message.code == "93":
+            CountingHandler.logins += 1
+            return message.response("94", {"ok": message.get("CO") != "wrong"})
+        if message.code == "17" and message.get("AB") == "silent":
+            return None  # Never answered
+        return generate_mock_response(message)
+
+
+async def start_server(**kwargs):
+    CountingHandler.logins = 0
+    server = AsyncSIP2Server("127.0.0.1", 0, handler_factory=CountingHandler, **kwargs)
+    await server.start()
+    return server
+
+
+def test_pool_pipelines_many_requests():
+    """Test that concurrent requests are spread over the pool and correlated."""
+
+    async def scenario():
+        server = await start_server()
+        async with SIP2ClientPool("127.0.0.1", server.port, size=2, username="sc", password="pw") as pool:
+            patrons = [f"patron{n}" for n in range(50)]
+            responses = await asyncio.gather(*(pool.patron_status(p) for p in patrons))
+            stats = pool.stats()
+        await server.stop()
+        return patrons, responses, stats
+
+    patrons, responses, stats = asyncio.run(scenario())
+    assert [response.get("AA") for response in responses] == patrons
+    assert stats["connects"] == 2
+    assert stats["requests_sent"] == 52  # Two logins, then the requests
+    assert CountingHandler.logins == 2
+
+
+def test_responses_matched_by_sequence_number():
+    """Test that responses sent back out of order reach the right request."""
+
+    async def reverse_two(reader, writer):
+        framer, messages = SIP2Framer(), []
+        while len(messages) < 2:
+            framer.feed(await reader.read(1024))
+            messages += [decode_message(frame) for frame in framer.frames()]
+        for message in reversed(messages):
+            writer.write(encode_message(message.response("24", {}, [("AA", message.get("AA"))])))
+        await writer.drain()
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(reverse_two, "127.0.0.1", 0)
+        connection = SIP2Connection("127.0.0.1", server.sockets[0].getsockname()[1])
+        first, second = await asyncio.gather(
+            connection.request(SIP2Message("23", {}, [("AA", "first")])),
+            connection.request(SIP2Message("23", {}, [("AA", "second")])),
+        )
+        await connection.wait_closed()
+        server.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.get("AA") == "first"
+    assert second.get("AA") == "second"
+
+
+def test_reconnect_and_relogin():
+    """Test that a dropped connection is reopened and logged in again."""
+
+    async def scenario():
+        server = await start_server(idle_timeout=0.2)
+        async with SIP2ClientPool("127.0.0.1", server.port, size=1, username="sc", password="pw") as pool:
+            await pool.patron_status("before")
+            await asyncio.sleep(0.5)  # The server drops the idle connection
+            response = await pool.patron_status("after")
+            stats = pool.stats()
+        await server.stop()
+        return response, stats
+
+    response, stats = asyncio.run(scenario())
+    assert response.get("AA") == "after"
+    assert stats["connects"] == 2
+    assert CountingHandler.logins == 2
+
+
+def test_timeout_and_login_failure():
+    async def scenario():
+        server = await start_server()
+        pool = SIP2ClientPool("127.0.0.1", server.port, size=1, username="sc", password="pw", timeout=0.2)
+        with pytest.raises(SIP2TimeoutError):
+            await pool.item_information("silent")
+        # The timed-out connection is replaced for the next request
+        assert (await pool.item_information("book")).code == "18"
+        await pool.close()
+
+        with pytest.raises(SIP2LoginError):
+            await SIP2Connection("127.0.0.1", server.port, "sc", "wrong").connect()
+        await server.stop()
+
+    asyncio.run(scenario())
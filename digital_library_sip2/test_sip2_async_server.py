@@ -0,0 +1,147 @@
+import asyncio
+
+from .codec import SIP2Message, decode_message, encode_message
+from .sip2_async_server import AsyncSIP2Server
+from .sip2_mock_server import build_sip2_message
+
+
+async def start_server(**kwargs):
+    server = AsyncSIP2Server("127.0.0.1", 0, **kwargs)
+    await server.start()
+    return server
+
+
+def test_pipelined_messages_answered_in_order():
+    """Test that several messages sent at once each get their response."""
+
+    async def scenario():
+        server = await start_server()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(
+            (
+                build_sip2_message("93", "00CNuser|COpass|", 1)
+                + build_sip2_message("23", "00120250101    120000AOlib|AApatron7|AC|AD|", 2)
+            ).encode("ascii")
+        )
+        await writer.drain()
+        login = await reader.readuntil(b"\r")
+        status = await reader.readuntil(b"\r")
+        writer.close()
+        await server.stop()
+        return login, status, server.stats()
+
+    login, status, stats = asyncio.run(scenario())
+    assert login.startswith(b"941AY1AZ")
+    assert status.startswith(b"24")
+    assert b"AApatron7|" in status
+    assert stats["messages_handled"] == 2
+
+
+def test_error_detection():
+    """Test that a corrupted message gets a 96 and a 97 repeats the last response."""
+
+    async def scenario():
+        server = await start_server()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        login = build_sip2_message("93", "00CNuser|COpass|", 1).encode("ascii")
+        writer.write(login.replace(b"user", b"usex"))  # Corrupted in transit
+        resend = await reader.readuntil(b"\r")
+        writer.write(login + encode_message(SIP2Message("97")))
+        response = await reader.readuntil(b"\r")
+        repeated = await reader.readuntil(b"\r")
+        writer.close()
+        await server.stop()
+        return resend, response, repeated
+
+    resend, response, repeated = asyncio.run(scenario())
+    assert resend.startswith(b"96AZ")
+    assert response.startswith(b"941AY1AZ")
+    assert repeated == response
+
+
+def test_connection_limit():
+    """Test that connections beyond max_connections are closed immediately."""
+
+    async def scenario():
+        server = await start_server(max_connections=1)
+        first = await asyncio.open_connection("127.0.0.1", server.port)
+        await asyncio.sleep(0.05)
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        rejected = await asyncio.wait_for(reader.read(), 1)
+        first[1].close()
+        writer.close()
+        await server.stop()
+        return rejected, server.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected == b""
+    assert stats["connections_rejected"] == 1
+    assert stats["connections_peak"] == 1
+
+
+def test_idle_timeout_disconnects():
+    """Test that an idle client is disconnected after idle_timeout."""
+
+    async def scenario():
+        server = await start_server(idle_timeout=0.1)
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        closed = await asyncio.wait_for(reader.read(), 2)
+        writer.close()
+        await server.stop()
+        return closed, server.stats()
+
+    closed, stats = asyncio.run(scenario())
+    assert closed == b""
+    assert stats["idle_disconnects"] == 1
+    assert stats["connections_active"] == 0
+
+
+def sc_status():
+    fixed = {"status_code": "0", "max_print_width": 40, "protocol_version": "2.00"}
+    return encode_message(SIP2Message("99", fixed, [], 0))
+
+
+def test_heartbeat_gets_acs_status():
+    """Test that a 99 SC Status is answered with a 98 listing supported messages."""
+
+    async def scenario():
+        server = await start_server()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(sc_status() * 2)
+        responses = [decode_message((await reader.readuntil(b"\r"))[:-1]) for _ in range(2)]
+        stats = server.stats(connections=True)
+        writer.close()
+        await server.stop()
+        return responses, stats
+
+    responses, stats = asyncio.run(scenario())
+    status = responses[0]
+    assert status.code == "98" and status.sequence_number == 0
+    assert status.fixed["online_status"] and status.fixed["protocol_version"] == "2.00"
+    assert status.get("BX") == "YYYNYYYYNNYNNNNN"
+    assert stats["heartbeats"] == 2
+    assert stats["connections"][0]["heartbeats"] == 2
+
+
+def test_idle_reaper_spares_active_connections():
+    """Test that heartbeats keep a connection open while a silent one is reaped."""
+
+    async def scenario():
+        server = await start_server(idle_timeout=0.2)
+        silent = await asyncio.open_connection("127.0.0.1", server.port)
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        for _ in range(6):
+            writer.write(sc_status())
+            await reader.readuntil(b"\r")
+            await asyncio.sleep(0.08)
+        closed = await asyncio.wait_for(silent[0].read(), 1)
+        stats = server.stats()
+        silent[1].close()
+        writer.close()
+        await server.stop()
+        return closed, stats
+
+    closed, stats = asyncio.run(scenario())
+    assert closed == b""
+    assert stats["idle_disconnects"] == 1
+    assert stats["connections_active"] == 1
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from .sip2_async_server import AsyncSIP2Server
+from .sip2_loadgen import build_parser, parse_mix, percentile, run_load
+
+
+def test_parse_mix_and_percentile():
+    assert parse_mix("23=3, 11") == {"23": 3.0, "11": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("99=1")
+    assert percentile([1, 2, 3, 4], 0.5) == 2
+    assert percentile([1, 2, 3, 4], 0.99) == 4
+    assert percentile([], 0.5) is None
+
+
+def test_load_run_reports_per_message_type():
+    """Test a short run of a few kiosks against the mock server."""
+
+    async def scenario():
+        server = AsyncSIP2Server("127.0.0.1", 0)
+        await server.start()
+        args = build_parser().parse_args(
+            ["--port", str(server.port), "--kiosks", "3", "--requests", "20", "--think-time", "0", "--seed", "1"]
+        )
+        report = await run_load(args)
+        await server.stop()
+        return report
+
+    report = asyncio.run(scenario())
+    assert report["logins"] == 3
+    assert report["requests"] == 60
+    assert report["error_rate"] == 0.0
+    assert set(report["by_type"]) <= {"09", "11", "17", "23", "63"}
+    assert sum(entry["requests"] for entry in report["by_type"].values()) == 60
+    for entry in report["by_type"].values():
+        latency = entry["latency_ms"]
+        assert latency["p50"] <= latency["p90"] <= latency["p99"] <= latency["max"]
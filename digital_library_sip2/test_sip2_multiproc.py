@@ -0,0 +1,59 @@
+import os
+import signal
+import socket
+import time
+
+import pytest
+
+from .sip2_mock_server import build_sip2_message
+from .sip2_multiproc import SIP2Supervisor
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="needs SO_REUSEPORT")
+
+LOGIN = build_sip2_message("93", "00CNuser|COpass|", 1).encode("ascii")
+
+
+def exchange(port, count=1):
+    """Sends `count` logins on a new connection and returns the responses."""
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(LOGIN * count)
+        data = b""
+        while data.count(b"\r") < count:
+            data += sock.recv(4096)
+    return data.split(b"\r")[:count]
+
+
+def wait_for(condition, supervisor, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        supervisor.poll(0.1)
+
+
+def test_workers_share_port_reload_and_restart():
+    """Test serving, aggregated stats, a graceful reload and a crashed worker's restart."""
+    supervisor = SIP2Supervisor("127.0.0.1", 0, workers=2, stats_interval=0.1, grace=0.5, quiet=True)
+    supervisor.start()
+    try:
+        for _ in range(4):
+            assert all(response.startswith(b"941") for response in exchange(supervisor.port, 3))
+        wait_for(lambda: supervisor.stats()["totals"].get("messages_handled") == 12, supervisor)
+        stats = supervisor.stats()
+        assert stats["workers_alive"] == 2
+        assert sum(worker["messages_handled"] for worker in stats["workers"]) == 12
+
+        old_pids = {worker["pid"] for worker in stats["workers"]}
+        supervisor.reload()
+        assert exchange(supervisor.port)[0].startswith(b"941")
+        wait_for(lambda: len(supervisor.stats()["workers"]) == 2, supervisor)
+        stats = supervisor.stats()
+        assert stats["generation"] == 2
+        assert old_pids.isdisjoint(worker["pid"] for worker in stats["workers"])
+        wait_for(lambda: supervisor.stats()["totals"]["messages_handled"] == 13, supervisor)
+
+        os.kill(stats["workers"][0]["pid"], signal.SIGKILL)
+        wait_for(lambda: supervisor.restarts == 1 and supervisor._count_ready(2) == 2, supervisor)
+        assert exchange(supervisor.port)[0].startswith(b"941")
+    finally:
+        supervisor.shutdown()
+    assert supervisor.stats()["workers_alive"] == 0